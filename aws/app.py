@@ -1,4 +1,7 @@
+import json
+
 from aws_cdk import core
+from cdk_deployment import defaults
 from cdk_deployment.main_stack import MainStack
 
 # start cdk
@@ -12,6 +15,108 @@ region = app.node.try_get_context("region")
 if not branch_name or not ecr_repository_name or not account or not region:
     raise Exception("Branch, ECR repository, account and region are required")
 
+# optional, number of map items handled by a single batch job in step 2 and 3
+step2_items_per_job = int(app.node.try_get_context("step2_items_per_job") or 1)
+step3_items_per_job = int(app.node.try_get_context("step3_items_per_job") or 1)
+# optional, fan out over step 2 and 3 parameters with a step function map, a single
+# batch array job or a distributed map reading its items from a manifest in S3
+step2_fan_out_mode = app.node.try_get_context("step2_fan_out_mode") or "map"
+step3_fan_out_mode = app.node.try_get_context("step3_fan_out_mode") or "map"
+# optional, barrier between step 2 and 3 or pipelined items
+topology = app.node.try_get_context("topology") or "barrier"
+# optional, store large inputs and results in S3 and pass only their keys around
+offload_payloads = app.node.try_get_context("offload_payloads") in ("true", True)
+# optional, merge the results of all the jobs and return a pointer to them
+collect_results = app.node.try_get_context("collect_results") in ("true", True)
+# optional, skip the jobs whose result is cached for the same image digest
+cache_results = app.node.try_get_context("cache_results") in ("true", True)
+cache_ttl_days = int(app.node.try_get_context("cache_ttl_days") or 7)
+image_digest = app.node.try_get_context("image_digest")
+# optional, run_job polls batch for the completion of the jobs, callback lets the
+# containers report it with a task token
+completion_mode = app.node.try_get_context("completion_mode") or "run_job"
+# optional, where the jobs of each step run: batch (default), lambda for items too
+# small to be worth a container, or express for the lambda function invoked by an
+# express child execution of the step, and the memory and timeout of the functions
+step1_backend = app.node.try_get_context("step1_backend") or "batch"
+step2_backend = app.node.try_get_context("step2_backend") or "batch"
+step3_backend = app.node.try_get_context("step3_backend") or "batch"
+lambda_memory_mib = int(
+    app.node.try_get_context("lambda_memory_mib") or defaults.LAMBDA_MEMORY_MIB
+)
+lambda_timeout_seconds = int(
+    app.node.try_get_context("lambda_timeout_seconds") or defaults.LAMBDA_TIMEOUT_SECONDS
+)
+# optional, resources of a job, the container runs one worker process per vCPU
+job_vcpus = int(app.node.try_get_context("job_vcpus") or defaults.JOB_VCPUS)
+job_memory_limit_mib = int(
+    app.node.try_get_context("job_memory_limit_mib") or defaults.JOB_MEMORY_LIMIT_MIB
+)
+# optional, vCPU limits and instance types of the compute environment, and number of
+# items of a map running at the same time (0 is unbounded), see
+# utilities/simulate_capacity.py to pick them
+maxv_cpus = int(app.node.try_get_context("maxv_cpus") or defaults.MAXV_CPUS)
+minv_cpus = int(app.node.try_get_context("minv_cpus") or defaults.MINV_CPUS)
+instance_types = (
+    app.node.try_get_context("instance_types").split(",")
+    if app.node.try_get_context("instance_types")
+    else defaults.INSTANCE_TYPES
+)
+max_concurrency = int(
+    app.node.try_get_context("max_concurrency") or defaults.MAX_CONCURRENCY
+)
+# optional, resource tiers items are routed to by their size hint, a json list
+tiers = app.node.try_get_context("tiers") or defaults.TIERS
+if isinstance(tiers, str):
+    tiers = json.loads(tiers)
+# optional, shards step 2 and 3 items are spread over, a json list
+shards = app.node.try_get_context("shards") or defaults.SHARDS
+if isinstance(shards, str):
+    shards = json.loads(shards)
+# optional, save the progress of the jobs so that a retry resumes from it
+checkpoint_jobs = app.node.try_get_context("checkpoint_jobs") in ("true", True)
+# optional, json list of windows of warm capacity, see
+# cdk_deployment/handlers/warm_capacity
+warm_capacity = app.node.try_get_context("warm_capacity") or defaults.WARM_CAPACITY
+if isinstance(warm_capacity, str):
+    warm_capacity = json.loads(warm_capacity)
+# optional, the jobs write their timings as metrics and a dashboard shows them
+emit_metrics = app.node.try_get_context("emit_metrics") in ("true", True)
+# optional, format of the manifests of the distributed fan out, jsonl or csv, and the
+# share of its items which may fail without failing the execution
+manifest_format = app.node.try_get_context("manifest_format") or "jsonl"
+tolerated_failure_percentage = float(
+    app.node.try_get_context("tolerated_failure_percentage") or 0
+)
+# optional, scratch storage of the jobs mounted at /scratch, ebs for a gp3 volume of
+# scratch_volume_gib with scratch_throughput_mibps, instance_store for the NVMe volumes
+# of instance types which have them
+scratch_storage = app.node.try_get_context("scratch_storage")
+scratch_volume_gib = int(
+    app.node.try_get_context("scratch_volume_gib") or defaults.SCRATCH_VOLUME_GIB
+)
+scratch_throughput_mibps = int(
+    app.node.try_get_context("scratch_throughput_mibps")
+    or defaults.SCRATCH_THROUGHPUT_MIBPS
+)
+# optional, declarative list of stages replacing step 1, 2 and 3: a json or yaml file,
+# a json string or a list, see cdk_deployment/pipeline_spec.py
+pipeline = app.node.try_get_context("pipeline")
+
+# optional, id, availability zones and public subnets (comma separated) of the vpc,
+# when given the default vpc isn't looked up and the synth runs offline
+vpc_id = app.node.try_get_context("vpc_id")
+vpc_availability_zones = (
+    app.node.try_get_context("availability_zones").split(",")
+    if app.node.try_get_context("availability_zones")
+    else ()
+)
+vpc_public_subnet_ids = (
+    app.node.try_get_context("public_subnet_ids").split(",")
+    if app.node.try_get_context("public_subnet_ids")
+    else ()
+)
+
 print(
     f"Working on branch {branch_name} ",
     f"ECR repository {ecr_repository_name} ",
@@ -33,6 +138,42 @@ _ = MainStack(
     branch_name=branch_name,
     account=account,
     region=region,
+    step2_items_per_job=step2_items_per_job,
+    step3_items_per_job=step3_items_per_job,
+    step2_fan_out_mode=step2_fan_out_mode,
+    step3_fan_out_mode=step3_fan_out_mode,
+    topology=topology,
+    offload_payloads=offload_payloads,
+    collect_results=collect_results,
+    cache_results=cache_results,
+    cache_ttl_days=cache_ttl_days,
+    image_digest=image_digest,
+    completion_mode=completion_mode,
+    step1_backend=step1_backend,
+    step2_backend=step2_backend,
+    step3_backend=step3_backend,
+    lambda_memory_mib=lambda_memory_mib,
+    lambda_timeout_seconds=lambda_timeout_seconds,
+    job_vcpus=job_vcpus,
+    job_memory_limit_mib=job_memory_limit_mib,
+    maxv_cpus=maxv_cpus,
+    minv_cpus=minv_cpus,
+    instance_types=instance_types,
+    max_concurrency=max_concurrency,
+    tiers=tiers,
+    shards=shards,
+    checkpoint_jobs=checkpoint_jobs,
+    warm_capacity=warm_capacity,
+    emit_metrics=emit_metrics,
+    scratch_storage=scratch_storage,
+    scratch_volume_gib=scratch_volume_gib,
+    scratch_throughput_mibps=scratch_throughput_mibps,
+    pipeline=pipeline,
+    manifest_format=manifest_format,
+    tolerated_failure_percentage=tolerated_failure_percentage,
+    vpc_id=vpc_id,
+    vpc_availability_zones=vpc_availability_zones,
+    vpc_public_subnet_ids=vpc_public_subnet_ids,
 )
 
 # synthesize the app into a cloud assembly, ie an ensamble of artifacts
@@ -0,0 +1,106 @@
+from aws_cdk import aws_batch as batch
+from aws_cdk import aws_ec2 as ec2
+from aws_cdk import aws_iam as iam
+from aws_cdk import core
+from cdk_deployment import defaults
+from cdk_deployment.resource_tier import TIER_NAME, spot_compute_environment
+
+# items are routed by the first hex digits of the md5 of their parameter
+HASH_DIGITS = 4
+
+
+def hash_bounds(weights: list) -> list:
+
+    """
+    Upper bounds of the shards in the space of the first HASH_DIGITS hex digits of a
+    md5 hex digest, each shard gets a share of the space in proportion to its
+    weight. The last shard takes the rest and has no bound
+    """
+
+    space = 16**HASH_DIGITS
+    total = sum(weights)
+    bounds = []
+    cumulative = 0
+    for weight in weights[:-1]:
+        cumulative += weight
+        bound = min(round(space * cumulative / total), space - 1)
+        bounds.append(format(bound, f"0{HASH_DIGITS}x"))
+    return bounds + [None]
+
+
+class ComputeShard(core.Construct):
+
+    """
+    Compute environment and job queue of a shard, see defaults.SHARDS. Every shard
+    has its own spot pools, so a shortage of an instance type or in an availability
+    zone only slows down the items of its shard
+    """
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def state_suffix(self):
+        return f"Shard{self._name.capitalize()}"
+
+    @property
+    def upper_bound(self):
+        return self._upper_bound
+
+    @property
+    def queue(self):
+        return self._queue
+
+    def __init__(
+        self,
+        scope: core.Construct,
+        id: str,
+        shard: dict,
+        branch_name: str,
+        region: str,
+        vpc: ec2.IVpc,
+        batch_service_role: iam.IRole,
+        launch_template_name: str,
+        instance_profile_name: str,
+        upper_bound: str = None,
+        instance_types: list = defaults.INSTANCE_TYPES,
+        maxv_cpus: int = defaults.MAXV_CPUS,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        if not TIER_NAME.match(str(shard.get("name", ""))):
+            raise Exception("Shard names must be lower case letters and digits")
+
+        self._name = shard["name"]
+        self._upper_bound = upper_bound
+        prefix = f"csfe-{branch_name}-shard-{self._name}"
+        id_prefix = f"csfe{self.state_suffix}"
+
+        compute_environment = spot_compute_environment(
+            self,
+            f"{id_prefix}ComputeEnvironment",
+            compute_environment_name=f"{prefix}-batch-ce",
+            region=region,
+            vpc=vpc,
+            batch_service_role=batch_service_role,
+            launch_template_name=launch_template_name,
+            instance_profile_name=instance_profile_name,
+            instance_types=shard.get("instance_types", instance_types),
+            maxv_cpus=shard.get("maxv_cpus", maxv_cpus),
+            availability_zones=shard.get("availability_zones"),
+        )
+
+        self._queue = batch.JobQueue(
+            self,
+            f"{id_prefix}JobQueue",
+            compute_environments=[
+                batch.JobQueueComputeEnvironment(
+                    compute_environment=compute_environment, order=1
+                )
+            ],
+            job_queue_name=f"{prefix}-batch-jq",
+            priority=100,
+            enabled=True,
+        )
@@ -0,0 +1,90 @@
+# defaults of the stack settings, kept free of CDK imports so that the utilities,
+# eg utilities/simulate_capacity.py, model the same deployment
+
+# compute environment, vCPUs are the total across all the instances
+MAXV_CPUS = 10
+MINV_CPUS = 0
+INSTANCE_TYPES = ("r4.large", "r5.large")
+# vCPUs of the instance types the compute environment can be given
+INSTANCE_VCPUS = {
+    "r4.large": 2,
+    "r4.xlarge": 4,
+    "r4.2xlarge": 8,
+    "r5.large": 2,
+    "r5.xlarge": 4,
+    "r5.2xlarge": 8,
+    "m5.large": 2,
+    "m5.xlarge": 4,
+    "m5.2xlarge": 8,
+    "c5.large": 2,
+    "c5.xlarge": 4,
+    "c5.2xlarge": 8,
+    "r5d.large": 2,
+    "r5d.xlarge": 4,
+    "r5d.2xlarge": 8,
+    "m5d.large": 2,
+    "m5d.xlarge": 4,
+    "m5d.2xlarge": 8,
+    "c5d.large": 2,
+    "c5d.xlarge": 4,
+    "c5d.2xlarge": 8,
+}
+# families whose instances come with NVMe instance store volumes
+INSTANCE_STORE_FAMILIES = ("c5d", "m5d", "m5ad", "r5d", "r5ad", "i3", "i3en", "z1d")
+
+# job definition
+JOB_VCPUS = 1
+JOB_MEMORY_LIMIT_MIB = 2000
+# attempts of a job, only jobs stopped by a spot interruption are retried: their
+# status reason starts with one of SPOT_INTERRUPTION_REASONS, ec2 and fargate
+RETRY_ATTEMPTS = 3
+SPOT_INTERRUPTION_REASONS = ("Host EC2*", "Your Spot Task was interrupted*")
+# seconds between the SIGTERM and the SIGKILL of a container stopped by ecs, eg
+# when a spot instance is drained after its interruption notice
+CONTAINER_STOP_TIMEOUT_SECONDS = 60
+
+# scratch storage of the jobs, none by default. An ebs gp3 volume or the NVMe instance
+# store of the instances is mounted on the hosts and in the containers at SCRATCH_PATH.
+# gp3 provisions its throughput (MiB/s, up to a quarter of the iops) independently of
+# its size
+SCRATCH_PATH = "/scratch"
+SCRATCH_VOLUME_GIB = 100
+SCRATCH_THROUGHPUT_MIBPS = 500
+SCRATCH_IOPS = 3000
+
+# functions of the steps with the lambda or express backend, see lambda_backend.py.
+# Express child executions last 5 minutes at most
+LAMBDA_MEMORY_MIB = 1024
+LAMBDA_TIMEOUT_SECONDS = 60
+
+# iterations of a step 2 or 3 map running at the same time, 0 is unbounded
+MAX_CONCURRENCY = 0
+
+# resource tiers, none by default. Each is a dict with a name, the largest item size
+# hint it runs (max_size), vcpus and memory_mib of its jobs and optionally fargate,
+# instance_types and maxv_cpus. Items without size hint, or larger than every tier,
+# run with the job definition above
+TIERS = ()
+# vCPUs and memory (MiB) combinations accepted by fargate
+FARGATE_MEMORY_MIB = {
+    0.25: (512, 1024, 2048),
+    0.5: tuple(range(1024, 4097, 1024)),
+    1: tuple(range(2048, 8193, 1024)),
+    2: tuple(range(4096, 16385, 1024)),
+    4: tuple(range(8192, 30721, 1024)),
+}
+
+# shards, none by default. Each is a dict with a name and optionally instance_types,
+# maxv_cpus, availability_zones and a weight (default 1). The step 2 and 3 items are
+# spread over the shards by the hash of their parameter, in proportion to the weights
+SHARDS = ()
+
+# windows of warm capacity, none by default, see handlers/warm_capacity. The
+# controller runs every interval and warms the instances up lead minutes ahead of a
+# window
+WARM_CAPACITY = ()
+WARM_CAPACITY_INTERVAL_MINUTES = 5
+WARM_CAPACITY_LEAD_MINUTES = 15
+
+# namespace of the metrics written by the jobs, see source/metrics.py
+METRICS_NAMESPACE = "csfe"
@@ -0,0 +1,153 @@
+import json
+import os
+from datetime import datetime, timezone
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+# jobs which keep the compute environment busy, it is scaled down once there are none
+ACTIVE_STATUSES = ("SUBMITTED", "PENDING", "RUNNABLE", "STARTING", "RUNNING")
+
+
+def minutes_of_day(value):
+
+    """
+    Minutes since midnight of a HH:MM time, 24:00 being the end of the day
+    """
+
+    hours, minutes = (int(part) for part in value.split(":"))
+    if not (0 <= minutes < 60 and (0 <= hours < 24 or (hours, minutes) == (24, 0))):
+        raise Exception(f"Invalid time {value}")
+    return hours * 60 + minutes
+
+
+def validate_schedule(schedule, maxv_cpus=None):
+
+    """
+    Raises when a window of the schedule is invalid or overlaps another one on a
+    same day. A window has a start and end HH:MM utc time, the vcpus to keep warm
+    and optionally the days it applies to,
+    eg {"days": ["mon", "tue"], "start": "08:00", "end": "10:30", "vcpus": 8}
+    """
+
+    for window in schedule:
+        if minutes_of_day(window["start"]) >= minutes_of_day(window["end"]):
+            raise Exception(f"Window {window} ends before it starts")
+        if not isinstance(window.get("vcpus"), int) or window["vcpus"] < 1:
+            raise Exception(f"Window {window} needs a positive number of vcpus")
+        if maxv_cpus is not None and window["vcpus"] > maxv_cpus:
+            raise Exception(f"Window {window} exceeds the {maxv_cpus} maxv_cpus")
+        if any(day not in DAYS for day in window.get("days", DAYS)):
+            raise Exception(f"Window {window} days must be in {', '.join(DAYS)}")
+
+    for index, window in enumerate(schedule):
+        start, end = minutes_of_day(window["start"]), minutes_of_day(window["end"])
+        for other in schedule[index + 1 :]:
+            shared_days = set(window.get("days", DAYS)) & set(other.get("days", DAYS))
+            if (
+                shared_days
+                and minutes_of_day(other["start"]) < end
+                and start < minutes_of_day(other["end"])
+            ):
+                raise Exception(f"Windows {window} and {other} overlap")
+
+
+def warm_vcpus(schedule, now, lead_minutes=0):
+
+    """
+    vCPUs to keep warm at now, the largest of the windows starting within
+    lead_minutes or in progress, so that instances are running when load arrives
+    """
+
+    vcpus = 0
+    for window in schedule:
+        # a window starting early in the day may be lead from the previous day
+        for day_offset in (0, 1):
+            day = DAYS[(now.weekday() + day_offset) % 7]
+            minute = now.hour * 60 + now.minute - day_offset * 24 * 60
+            if day not in window.get("days", DAYS):
+                continue
+            start = minutes_of_day(window["start"]) - lead_minutes
+            if start <= minute < minutes_of_day(window["end"]):
+                vcpus = max(vcpus, window["vcpus"])
+    return vcpus
+
+
+def queue_drained(batch_client, job_queue):
+
+    """
+    Whether the job queue has no job waiting or running
+    """
+
+    for status in ACTIVE_STATUSES:
+        response = batch_client.list_jobs(
+            jobQueue=job_queue, jobStatus=status, maxResults=1
+        )
+        if response["jobSummaryList"]:
+            return False
+    return True
+
+
+def reconcile(
+    batch_client,
+    compute_environment,
+    job_queue,
+    schedule,
+    now,
+    lead_minutes=0,
+    base_minv_cpus=0,
+):
+
+    """
+    Sets the minvCpus of the compute environment to the vCPUs of the schedule at
+    now. Outside of the windows it goes back to base_minv_cpus once the job queue
+    has drained. desiredvCpus is raised with minvCpus, batch lowers it by itself.
+    Returns what was done
+    """
+
+    described = batch_client.describe_compute_environments(
+        computeEnvironments=[compute_environment]
+    )["computeEnvironments"][0]
+    resources = described["computeResources"]
+    current = resources["minvCpus"]
+    target = max(base_minv_cpus, warm_vcpus(schedule, now, lead_minutes))
+
+    if described["status"] != "VALID":
+        # an update is in progress, the next run reconciles
+        return {"action": "skipped", "status": described["status"]}
+    if target < current and not queue_drained(batch_client, job_queue):
+        return {"action": "waiting", "minvCpus": current}
+    if target == current:
+        return {"action": "none", "minvCpus": current}
+
+    update = {"minvCpus": target}
+    if target > resources["desiredvCpus"]:
+        update["desiredvCpus"] = target
+    batch_client.update_compute_environment(
+        computeEnvironment=compute_environment, computeResources=update
+    )
+    return {"action": "scaled", "from": current, **update}
+
+
+def handler(event, context, batch_client=None, clock=None):
+
+    """
+    Entrypoint of the lambda, run on a schedule. The compute environment, job queue
+    and schedule come from the environment
+    """
+
+    if batch_client is None:
+        import boto3
+
+        batch_client = boto3.client("batch")
+    now = clock() if clock else datetime.now(timezone.utc)
+
+    result = reconcile(
+        batch_client,
+        os.environ["COMPUTE_ENVIRONMENT"],
+        os.environ["JOB_QUEUE"],
+        json.loads(os.environ["SCHEDULE"]),
+        now,
+        lead_minutes=int(os.environ.get("LEAD_MINUTES", 0)),
+        base_minv_cpus=int(os.environ.get("BASE_MINV_CPUS", 0)),
+    )
+    print(json.dumps({"time": now.isoformat(), **result}))
+    return result
@@ -0,0 +1,407 @@
+# fan out modes available for the steps running over a list of parameters, the
+# distributed map reads its items from a manifest in S3 instead of the input
+FAN_OUT_MODES = ("map", "array", "distributed")
+# formats of the manifest of a distributed map, one object with a parameter per line
+# or a csv with a parameter column
+MANIFEST_FORMATS = {
+    "jsonl": {"InputType": "JSONL"},
+    "csv": {"InputType": "CSV", "CSVHeaderLocation": "FIRST_ROW"},
+}
+
+# how the step function learns that a batch job has completed: run_job polls the
+# job through the .sync integration, callback waits for the container to send back
+# the task token it receives in TASK_TOKEN
+COMPLETION_MODES = ("run_job", "callback")
+BATCH_RESOURCES = {
+    "run_job": "arn:aws:states:::batch:submitJob.sync",
+    "callback": "arn:aws:states:::aws-sdk:batch:submitJob.waitForTaskToken",
+}
+LAMBDA_INVOKE_RESOURCE = "arn:aws:states:::lambda:invoke"
+# .sync:2 returns the output of the child execution as json rather than a string
+EXPRESS_EXECUTION_RESOURCE = "arn:aws:states:::states:startExecution.sync:2"
+# transient errors of the lambda service, retried like the CDK LambdaInvoke does
+LAMBDA_SERVICE_ERRORS = [
+    "Lambda.ServiceException",
+    "Lambda.AWSLambdaException",
+    "Lambda.SdkClientException",
+    "Lambda.TooManyRequestsException",
+]
+# a callback task fails when no task token came back after this long, eg when the
+# job failed before its container ran. It covers the longest wait in the job queue
+# plus the longest run of a job, a heartbeat timeout would fail jobs still queued
+CALLBACK_TIMEOUT_SECONDS = 24 * 3600
+# quota on the size of a state machine definition
+DEFINITION_MAX_BYTES = 1024 * 1024
+
+
+def container_environment(variables: dict) -> list:
+
+    """
+    Amazon States Language environment of a batch job, values starting with $ are
+    json paths resolved against the input of the state
+    """
+
+    return [
+        {"Name": name, "Value.$": value}
+        if value.startswith("$")
+        else {"Name": name, "Value": value}
+        for name, value in variables.items()
+    ]
+
+
+def submit_job_state(
+    job_name: str,
+    job_queue_arn: str,
+    job_definition_arn: str,
+    environment: list,
+    completion_mode: str = "run_job",
+    command: list = None,
+    **kwargs,
+) -> dict:
+
+    """
+    Amazon States Language definition of a task submitting an AWS Batch job and
+    waiting for it to complete, with command in place of the one of the job
+    definition if given. Extra keyword arguments are added to the parameters of the
+    task, eg ArrayProperties
+    """
+
+    state = {
+        "Type": "Task",
+        "Resource": BATCH_RESOURCES[completion_mode],
+        "Parameters": {
+            "JobDefinition": job_definition_arn,
+            "JobName": job_name,
+            "JobQueue": job_queue_arn,
+            "ContainerOverrides": {"Environment": environment},
+            **kwargs,
+        },
+        "ResultPath": "$.resultData",
+    }
+    if command:
+        state["Parameters"]["ContainerOverrides"]["Command"] = command
+
+    if completion_mode == "callback":
+        state["Parameters"]["ContainerOverrides"]["Environment"] = [
+            *environment,
+            {"Name": "TASK_TOKEN", "Value.$": "$$.Task.Token"},
+        ]
+        state["TimeoutSeconds"] = CALLBACK_TIMEOUT_SECONDS
+
+    return state
+
+
+def lambda_invoke_state(function_arn: str, environment: list) -> dict:
+
+    """
+    Amazon States Language definition of a task invoking the function of the lambda
+    backend of a step, see lambda_handler in source/main.py. The function gets the
+    environment a batch job of the step would get, the task keeps the JobId and
+    Status of its result under the same ResultPath as a batch task
+    """
+
+    payload_environment = {}
+    for variable in environment:
+        if "Value.$" in variable:
+            payload_environment[f"{variable['Name']}.$"] = variable["Value.$"]
+        else:
+            payload_environment[variable["Name"]] = variable["Value"]
+
+    return {
+        "Type": "Task",
+        "Resource": LAMBDA_INVOKE_RESOURCE,
+        "Parameters": {
+            "FunctionName": function_arn,
+            "Payload": {"environment": payload_environment},
+        },
+        "ResultSelector": {"JobId.$": "$.Payload.JobId", "Status.$": "$.Payload.Status"},
+        "ResultPath": "$.resultData",
+        "Retry": [
+            {
+                "ErrorEquals": LAMBDA_SERVICE_ERRORS,
+                "IntervalSeconds": 2,
+                "MaxAttempts": 6,
+                "BackoffRate": 2,
+            }
+        ],
+    }
+
+
+def express_execution_state(state_machine_arn: str) -> dict:
+
+    """
+    Amazon States Language definition of a task running an express state machine
+    on the input of the state and waiting for it, its output is the one of the
+    child execution. The child is named after the parent, so that the jobs store
+    their results under the execution of the parent, express executions don't
+    need unique names
+    """
+
+    return {
+        "Type": "Task",
+        "Resource": EXPRESS_EXECUTION_RESOURCE,
+        "Parameters": {
+            "StateMachineArn": state_machine_arn,
+            "Name.$": "$$.Execution.Name",
+            "Input.$": "$",
+        },
+        "OutputPath": "$.Output",
+    }
+
+
+def array_manifest_reference(step_name: str, bucket_name: str) -> str:
+
+    """
+    Intrinsic function of the s3:// url of the manifest of the array job of a step,
+    specific to the execution
+    """
+
+    return (
+        f"States.Format('s3://{bucket_name}/manifests/{{}}/{step_name}.json', "
+        + "$$.Execution.Name)"
+    )
+
+
+def array_manifest_state(step_name: str, bucket_name: str, items_path: str) -> dict:
+
+    """
+    Amazon States Language definition of a task writing the list at items_path as
+    the json encoded manifest of the array job of a step, see array_job_arguments.
+    Only the etag of the manifest is added to $.resultData, which the array job
+    then replaces with its own result
+    """
+
+    return {
+        "Type": "Task",
+        "Resource": "arn:aws:states:::aws-sdk:s3:putObject",
+        "Parameters": {
+            "Bucket": bucket_name,
+            "Key.$": f"States.Format('manifests/{{}}/{step_name}.json', "
+            + "$$.Execution.Name)",
+            "Body.$": f"States.JsonToString({items_path})",
+        },
+        "ResultSelector": {"ETag.$": "$.ETag"},
+        "ResultPath": "$.resultData.manifest",
+    }
+
+
+def array_job_arguments(
+    step_name: str, bucket_name: str, items_path: str, environment: list = None
+) -> dict:
+
+    """
+    Environment and ArrayProperties of a single AWS Batch array job with one child
+    for each element of the list at items_path. The list is written to S3 first by
+    array_manifest_state, as the container overrides of a job are limited to a few
+    KiB, and every child gets the url of the manifest. Each child picks its own
+    element through AWS_BATCH_JOB_ARRAY_INDEX. Any extra environment is passed to
+    every child as well
+    """
+
+    return {
+        "environment": [
+            {
+                "Name": "MANIFEST",
+                "Value.$": array_manifest_reference(step_name, bucket_name),
+            },
+            *(environment or []),
+        ],
+        "ArrayProperties": {"Size.$": f"States.ArrayLength({items_path})"},
+    }
+
+
+def distributed_map_state(
+    step_name: str,
+    job_name: str,
+    job_queue_arn: str,
+    job_definition_arn: str,
+    bucket_name: str,
+    manifest_path: str = None,
+    manifest_format: str = "jsonl",
+    items_per_job: int = 1,
+    max_concurrency: int = 0,
+    tolerated_failure_percentage: float = 0,
+    offload_payloads: bool = False,
+    completion_mode: str = "run_job",
+) -> dict:
+
+    """
+    Amazon States Language definition of a distributed map submitting a batch job
+    for each item, or chunk of items_per_job items, of the manifest whose key is at
+    manifest_path, $.parameters.<step_name>_manifest by default, in bucket_name. Every iteration is a child
+    execution of its own, so neither the concurrency nor the number of items are
+    bound by the history of the execution. The results of the iterations, ie their
+    job ids, are written under results/<step_name>/ in the same bucket and only a
+    reference to them is added to the input, at $.<step_name>Results
+    """
+
+    if manifest_format not in MANIFEST_FORMATS:
+        raise Exception(f"manifest_format must be one of {', '.join(MANIFEST_FORMATS)}")
+    if not 0 <= tolerated_failure_percentage <= 100:
+        raise Exception("tolerated_failure_percentage must be between 0 and 100")
+
+    item_selector = {"parameter.$": "$$.Map.Item.Value.parameter"}
+    if items_per_job == 1:
+        environment = [{"Name": "PARAMETER", "Value.$": "$.parameter"}]
+    else:
+        # the chunk is passed to the container as a json encoded list of objects
+        environment = [{"Name": "PARAMETERS", "Value.$": "States.JsonToString($.Items)"}]
+    environment.append({"Name": "STEP_NAME", "Value": step_name})
+    if offload_payloads:
+        # the iterations run in child executions, they get the name of the parent
+        # which the container stores its result under
+        if items_per_job == 1:
+            item_selector["execution_name.$"] = "$$.Execution.Name"
+            execution_name_path = "$.execution_name"
+        else:
+            execution_name_path = "$.BatchInput.execution_name"
+        environment.append({"Name": "EXECUTION_NAME", "Value.$": execution_name_path})
+
+    task_name = f"csfe{step_name.capitalize()}Task"
+    state = {
+        "Type": "Map",
+        "ItemReader": {
+            "Resource": "arn:aws:states:::s3:getObject",
+            "ReaderConfig": MANIFEST_FORMATS[manifest_format],
+            "Parameters": {
+                "Bucket": bucket_name,
+                "Key.$": manifest_path or f"$.parameters.{step_name}_manifest",
+            },
+        },
+        "ItemSelector": item_selector,
+        "ItemProcessor": {
+            "ProcessorConfig": {"Mode": "DISTRIBUTED", "ExecutionType": "STANDARD"},
+            "StartAt": task_name,
+            "States": {
+                task_name: {
+                    **submit_job_state(
+                        job_name,
+                        job_queue_arn,
+                        job_definition_arn,
+                        environment=environment,
+                        completion_mode=completion_mode,
+                    ),
+                    "OutputPath": "$.resultData.JobId",
+                    "End": True,
+                }
+            },
+        },
+        "MaxConcurrency": max_concurrency,
+        "ToleratedFailurePercentage": tolerated_failure_percentage,
+        "ResultWriter": {
+            "Resource": "arn:aws:states:::s3:putObject",
+            "Parameters": {"Bucket": bucket_name, "Prefix": f"results/{step_name}"},
+        },
+        "ResultPath": f"$.{step_name}Results",
+    }
+    if items_per_job > 1:
+        state["ItemBatcher"] = {"MaxItemsPerBatch": items_per_job}
+        if offload_payloads:
+            state["ItemBatcher"]["BatchInput"] = {"execution_name.$": "$$.Execution.Name"}
+
+    return state
+
+
+def cache_key_expression(step_name: str, parameter_path: str, image_digest: str) -> str:
+
+    """
+    Intrinsic function deriving the cache key of a job, ie the sha-256 hex digest of
+    step name, parameter and image digest separated by |
+    """
+
+    return (
+        f"States.Hash(States.Format('{step_name}|{{}}|{image_digest}', "
+        + f"{parameter_path}), 'SHA-256')"
+    )
+
+
+def cache_lookup_state(table_name: str) -> dict:
+
+    """
+    Amazon States Language definition of a task getting the item of the cache key
+    at $.cache.key from the result cache, into $.cache.lookup
+    """
+
+    return {
+        "Type": "Task",
+        "Resource": "arn:aws:states:::dynamodb:getItem",
+        "Parameters": {
+            "TableName": table_name,
+            "Key": {"cache_key": {"S.$": "$.cache.key"}},
+        },
+        "ResultPath": "$.cache.lookup",
+    }
+
+
+def cached_states(
+    state_prefix: str,
+    step_name: str,
+    parameter_path: str,
+    task_name: str,
+    task_state: dict,
+    table_name: str,
+    image_digest: str,
+    hit_output_path: str = None,
+) -> dict:
+
+    """
+    Amazon States Language definition of the states looking up the result cache
+    before running task_state, same as CachedTask. The first state is
+    <state_prefix>CacheKey and the task receives the key in $.cache.key
+    """
+
+    cache_hit = {"Type": "Pass", "End": True}
+    if hit_output_path:
+        cache_hit["OutputPath"] = hit_output_path
+
+    return {
+        f"{state_prefix}CacheKey": {
+            "Type": "Pass",
+            "Parameters": {
+                "key.$": cache_key_expression(step_name, parameter_path, image_digest)
+            },
+            "ResultPath": "$.cache",
+            "Next": f"{state_prefix}CacheLookup",
+        },
+        f"{state_prefix}CacheLookup": {
+            **cache_lookup_state(table_name),
+            "Next": f"{state_prefix}CacheFound",
+        },
+        f"{state_prefix}CacheFound": {
+            "Type": "Choice",
+            "Choices": [
+                {
+                    "Variable": "$.cache.lookup.Item",
+                    "IsPresent": True,
+                    "Next": f"{state_prefix}CacheFresh",
+                }
+            ],
+            "Default": task_name,
+        },
+        f"{state_prefix}CacheFresh": {
+            "Type": "Choice",
+            "Choices": [
+                {
+                    "Variable": "$.cache.lookup.Item.expires.S",
+                    "TimestampGreaterThanPath": "$$.State.EnteredTime",
+                    "Next": f"{state_prefix}CacheHit",
+                }
+            ],
+            "Default": task_name,
+        },
+        f"{state_prefix}CacheHit": cache_hit,
+        task_name: task_state,
+    }
+
+
+def used_substitutions(definition_string: str, substitutions: dict) -> dict:
+
+    """
+    Definition substitutions whose ${Name} placeholder is in the definition
+    """
+
+    return {
+        name: value
+        for name, value in substitutions.items()
+        if "${" + name + "}" in definition_string
+    }
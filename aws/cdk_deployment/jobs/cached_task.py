@@ -0,0 +1,73 @@
+from aws_cdk import aws_stepfunctions as sfn
+from aws_cdk import core
+from cdk_deployment.jobs.asl import cache_key_expression, cache_lookup_state
+
+
+class CachedTask(core.Construct):
+
+    """
+    Looks up the result cache before batch_task, as states that can be chained to
+    the following ones. The iterations of a map use cached_states of asl.py instead
+    """
+
+    @property
+    def starting_point(self):
+        return self._starting_point
+
+    @property
+    def ending_point(self):
+        return self._ending_point
+
+    def __init__(
+        self,
+        scope: core.Construct,
+        id: str,
+        state_prefix: str,
+        step_name: str,
+        parameter_path: str,
+        batch_task: sfn.State,
+        table_name: str,
+        image_digest: str,
+        hit_output_path: str = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        # the key of a result is the hash of the step, its parameter and the digest
+        # of the image, source/cache.py derives exactly the same key
+        cache_key = sfn.Pass(
+            self,
+            f"{state_prefix}CacheKey",
+            parameters={
+                "key.$": cache_key_expression(step_name, parameter_path, image_digest)
+            },
+            result_path="$.cache",
+        )
+
+        cache_lookup = sfn.CustomState(
+            self, f"{state_prefix}CacheLookup", state_json=cache_lookup_state(table_name)
+        )
+
+        # on a hit the job is skipped, the output is the id of the cached job
+        cache_hit = sfn.Pass(self, f"{state_prefix}CacheHit", output_path=hit_output_path)
+
+        # dynamodb deletes expired items up to a couple of days late, so the
+        # expiry is checked here as well
+        cache_fresh = (
+            sfn.Choice(self, f"{state_prefix}CacheFresh")
+            .when(
+                sfn.Condition.timestamp_greater_than_json_path(
+                    "$.cache.lookup.Item.expires.S", "$$.State.EnteredTime"
+                ),
+                cache_hit,
+            )
+            .otherwise(batch_task)
+        )
+        cache_found = (
+            sfn.Choice(self, f"{state_prefix}CacheFound")
+            .when(sfn.Condition.is_present("$.cache.lookup.Item"), cache_fresh)
+            .otherwise(batch_task)
+        )
+
+        self._starting_point = cache_key.next(cache_lookup).next(cache_found)
+        self._ending_point = cache_found.afterwards()
@@ -0,0 +1,57 @@
+from aws_cdk import aws_stepfunctions as sfn
+from aws_cdk import core
+from cdk_deployment.jobs.asl import container_environment, submit_job_state
+
+
+class CollectTask(core.Construct):
+    @property
+    def starting_point(self):
+        return self._starting_point
+
+    @property
+    def ending_point(self):
+        return self._ending_point
+
+    def __init__(
+        self,
+        scope: core.Construct,
+        id: str,
+        branch_name: str,
+        job_queue_arn: str,
+        job_definition_arn: str,
+        payload_bucket_name: str,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        # task merging the results stored by every job of the execution into a
+        # single newline delimited json object, same image but different command
+        batch_task = sfn.CustomState(
+            self,
+            "csfeCollectTask",
+            state_json=submit_job_state(
+                f"csfe-{branch_name}-collect",
+                job_queue_arn,
+                job_definition_arn,
+                environment=container_environment(
+                    {"EXECUTION_NAME": "$$.Execution.Name", "STEP_NAME": "collect"}
+                ),
+                command=["python3", "main.py", "--aggregate"],
+            ),
+        )
+
+        # the output of the step function is only a pointer to the merged results
+        pointer = sfn.Pass(
+            self,
+            "csfeCollectPointer",
+            parameters={
+                "results": {
+                    "bucket": payload_bucket_name,
+                    "key.$": "States.Format('aggregated/{}.jsonl', $$.Execution.Name)",
+                }
+            },
+        )
+        batch_task.next(pointer)
+
+        self._ending_point = pointer
+        self._starting_point = batch_task
@@ -0,0 +1,93 @@
+import json
+
+from aws_cdk import aws_iam as iam
+from aws_cdk import aws_lambda as lambda_
+from aws_cdk import aws_stepfunctions as sfn
+from aws_cdk import core
+from cdk_deployment.jobs.asl import express_execution_state, used_substitutions
+
+
+class ExpressTask(core.Construct):
+
+    """
+    Runs the states of a step in an express state machine of their own, started and
+    waited for by a single task of the parent. Express executions are billed by
+    duration rather than by state transition and don't add the events of the step
+    to the history of the parent, which suits fan outs of tiny lambda items. The
+    child gets the definition substitutions of the parent its states refer to, the
+    task of the parent refers to the child through the definition_substitutions of
+    the ExpressTask
+    """
+
+    @property
+    def starting_point(self):
+        return self._starting_point
+
+    @property
+    def ending_point(self):
+        return self._ending_point
+
+    @property
+    def state_machine_arn(self):
+        return self._state_machine.ref
+
+    @property
+    def definition_substitutions(self):
+        return {self._placeholder: self._state_machine.ref}
+
+    def __init__(
+        self,
+        scope: core.Construct,
+        id: str,
+        branch_name: str,
+        step_name: str,
+        step_task: core.Construct,
+        function: lambda_.IFunction,
+        definition_substitutions: dict = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        state_prefix = f"csfe{step_name.capitalize()}"
+        state_machine_name = f"csfe-{branch_name}-{step_name}-express"
+
+        # the states of the step invoke its function, they are the whole definition
+        # of the child
+        role = iam.Role(
+            self,
+            f"{state_prefix}ExpressRole",
+            assumed_by=iam.ServicePrincipal("states.amazonaws.com"),
+        )
+        role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["lambda:InvokeFunction"],
+                resources=[function.function_arn],
+            )
+        )
+        graph = sfn.StateGraph(
+            step_task.starting_point.start_state,
+            f"State Machine {state_machine_name} definition",
+        )
+        definition_string = json.dumps(graph.to_graph_json(), separators=(",", ":"))
+        self._state_machine = sfn.CfnStateMachine(
+            self,
+            f"{state_prefix}ExpressStateMachine",
+            definition_string=definition_string,
+            definition_substitutions=used_substitutions(
+                definition_string, definition_substitutions or {}
+            )
+            or None,
+            state_machine_name=state_machine_name,
+            state_machine_type="EXPRESS",
+            role_arn=role.role_arn,
+        )
+
+        self._placeholder = f"{step_name.capitalize()}ExpressStateMachine"
+        express_task = sfn.CustomState(
+            self,
+            f"{state_prefix}Express",
+            state_json=express_execution_state("${" + self._placeholder + "}"),
+        )
+        self._ending_point = express_task
+        self._starting_point = express_task
@@ -0,0 +1,115 @@
+from aws_cdk import aws_stepfunctions as sfn
+from aws_cdk import core
+from cdk_deployment.jobs.asl import submit_job_state
+
+
+class PipelineTask(core.Construct):
+    @property
+    def starting_point(self):
+        return self._starting_point
+
+    @property
+    def ending_point(self):
+        return self._ending_point
+
+    def __init__(
+        self,
+        scope: core.Construct,
+        id: str,
+        branch_name: str,
+        job_queue_arn: str,
+        job_definition_arn: str,
+        completion_mode: str = "run_job",
+        max_concurrency: int = 0,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        # pipelined alternative to the step 2 and 3 stages: every iteration of
+        # the map runs the step 2 job of an item and then, straight away, the step 3
+        # job of the item at the same position of step3_parameters. Step 3 jobs then
+        # overlap with the step 2 stragglers instead of waiting for all of them
+        batch_map = sfn.CustomState(
+            self,
+            "csfePipelineMap",
+            state_json={
+                "Type": "Map",
+                "MaxConcurrency": max_concurrency,
+                "Parameters": {
+                    "parameters.$": "$.parameters",
+                    "step2_parameter.$": "$$.Map.Item.Value",
+                    "item_index.$": "$$.Map.Item.Index",
+                },
+                "ItemsPath": "$.parameters.step2_parameters",
+                "Iterator": {
+                    "StartAt": "csfePipelineStep2Task",
+                    "States": {
+                        "csfePipelineStep2Task": {
+                            **submit_job_state(
+                                f"csfe-{branch_name}-step2",
+                                job_queue_arn,
+                                job_definition_arn,
+                                environment=[
+                                    {"Name": "PARAMETER", "Value.$": "$.step2_parameter"},
+                                    {"Name": "STEP_NAME", "Value": "step2"},
+                                ],
+                                completion_mode=completion_mode,
+                            ),
+                            "Next": "csfePipelineStep3Task",
+                        },
+                        "csfePipelineStep3Task": {
+                            **submit_job_state(
+                                f"csfe-{branch_name}-step3",
+                                job_queue_arn,
+                                job_definition_arn,
+                                environment=[
+                                    {
+                                        "Name": "PARAMETER",
+                                        "Value.$": "States.ArrayGetItem("
+                                        + "$.parameters.step3_parameters, $.item_index)",
+                                    },
+                                    {"Name": "STEP_NAME", "Value": "step3"},
+                                ],
+                                completion_mode=completion_mode,
+                            ),
+                            "End": True,
+                        },
+                    },
+                },
+                "OutputPath": "$.[0]",
+            },
+        )
+
+        # items are paired by position, an execution whose lists differ in length
+        # fails before its step 2 and 3 jobs are submitted, instead of dropping the
+        # extra step 3 items or failing half way through
+        count_items = sfn.Pass(
+            self,
+            "csfePipelineCount",
+            parameters={
+                "step2.$": "States.ArrayLength($.parameters.step2_parameters)",
+                "step3.$": "States.ArrayLength($.parameters.step3_parameters)",
+            },
+            result_path="$.item_counts",
+        )
+        count_items.next(
+            sfn.Choice(self, "csfePipelinePaired")
+            .when(
+                sfn.Condition.number_equals_json_path(
+                    "$.item_counts.step2", "$.item_counts.step3"
+                ),
+                batch_map,
+            )
+            .otherwise(
+                sfn.Fail(
+                    self,
+                    "csfePipelineUnpaired",
+                    error="UnpairedParameters",
+                    cause="The pipelined topology requires step2_parameters and "
+                    + "step3_parameters of the same length",
+                )
+            )
+        )
+
+        self._ending_point = batch_map
+        self._starting_point = count_items
@@ -0,0 +1,422 @@
+from aws_cdk import aws_stepfunctions as sfn
+from aws_cdk import core
+from cdk_deployment.jobs.asl import (
+    COMPLETION_MODES,
+    array_job_arguments,
+    array_manifest_state,
+    cached_states,
+    container_environment,
+    distributed_map_state,
+    lambda_invoke_state,
+    submit_job_state,
+)
+from cdk_deployment.jobs.cached_task import CachedTask
+
+
+class StageTask(core.Construct):
+
+    """
+    States of a stage of a pipeline spec, see pipeline_spec.py, the step 1, 2 and 3
+    of the default step function included. A single stage runs one job on its
+    parameter, the other stages fan out over their parameters with a map, an array
+    job or a distributed map. The arns of the queues, job definitions and function
+    and the names of the bucket and table are usually ${Name} placeholders, replaced
+    through the definition substitutions of the state machine so that each of them
+    is in the template once instead of once per state. The items of a map are routed
+    to tiers, dicts with the state_suffix, max_size, job_queue_arn and
+    job_definition_arn of a tier, or to shards, dicts with the state_suffix,
+    upper_bound and job_queue_arn of a shard
+    """
+
+    @property
+    def starting_point(self):
+        return self._starting_point
+
+    @property
+    def ending_point(self):
+        return self._ending_point
+
+    def __init__(
+        self,
+        scope: core.Construct,
+        id: str,
+        branch_name: str,
+        stage: dict,
+        job_queue_arn: str,
+        job_definition_arn: str,
+        completion_mode: str = "run_job",
+        offload_payloads: bool = False,
+        manifest_bucket_name: str = None,
+        manifest_format: str = "jsonl",
+        tolerated_failure_percentage: float = 0,
+        cache_table_name: str = None,
+        image_digest: str = None,
+        tiers: list = None,
+        shards: list = None,
+        function_arn: str = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        name = stage["name"]
+        fan_out_mode = stage["fan_out_mode"]
+        items_per_job = stage["items_per_job"]
+        if completion_mode not in COMPLETION_MODES:
+            raise Exception(
+                f"completion_mode must be one of {', '.join(COMPLETION_MODES)}"
+            )
+        if fan_out_mode == "single":
+            if function_arn and cache_table_name:
+                raise Exception(
+                    f"Stage {name}: the lambda backend runs without result cache"
+                )
+        else:
+            if cache_table_name and (items_per_job != 1 or fan_out_mode != "map"):
+                raise Exception(
+                    f"Stage {name}: the result cache runs one item per job with a map "
+                    + "fan out"
+                )
+            if completion_mode == "callback" and fan_out_mode == "array":
+                raise Exception(
+                    f"Stage {name}: the callback completion mode requires a map or "
+                    + "distributed fan out"
+                )
+            if shards and (
+                items_per_job != 1 or fan_out_mode != "map" or cache_table_name or tiers
+            ):
+                raise Exception(
+                    f"Stage {name}: shards run one item per job with a map fan out, "
+                    + "without result cache or resource tiers"
+                )
+            if function_arn and (
+                fan_out_mode != "map" or cache_table_name or tiers or shards
+            ):
+                raise Exception(
+                    f"Stage {name}: the lambda backend requires a map fan out, without "
+                    + "result cache, resource tiers or shards"
+                )
+            if fan_out_mode in ("array", "distributed") and not manifest_bucket_name:
+                raise Exception(
+                    f"Stage {name}: the {fan_out_mode} fan out requires a manifest bucket"
+                )
+            if tiers and (
+                items_per_job != 1 or fan_out_mode != "map" or cache_table_name
+            ):
+                raise Exception(
+                    f"Stage {name}: resource tiers run one item per job with a map fan "
+                    + "out, without result cache"
+                )
+
+        state_prefix = f"csfe{name.capitalize()}"
+        job_name = f"csfe-{branch_name}-{name}"
+        parameters_path = f"$.parameters.{stage['parameters']}"
+
+        # environment of the container besides its parameters, values starting with $
+        # are json paths
+        extra_variables = {"STEP_NAME": name}
+        if offload_payloads:
+            # lets the container store its result under the execution and stage
+            extra_variables["EXECUTION_NAME"] = "$$.Execution.Name"
+        if cache_table_name:
+            # lets the container store its result in the cache
+            extra_variables["CACHE_KEY"] = "$.cache.key"
+
+        if fan_out_mode == "single":
+            variables = {"PARAMETER": parameters_path, **extra_variables}
+            if function_arn:
+                # the job runs in the lambda function of the stage instead of a
+                # container
+                batch_task = sfn.CustomState(
+                    self,
+                    f"{state_prefix}Lambda",
+                    state_json=lambda_invoke_state(
+                        function_arn, container_environment(variables)
+                    ),
+                )
+            else:
+                batch_task = sfn.CustomState(
+                    self,
+                    f"{state_prefix}Task",
+                    state_json=submit_job_state(
+                        job_name,
+                        job_queue_arn,
+                        job_definition_arn,
+                        environment=container_environment(variables),
+                        completion_mode=completion_mode,
+                    ),
+                )
+            self._ending_point = batch_task
+            self._starting_point = batch_task
+
+            if cache_table_name:
+                # skip the job when the cache holds a result for the same parameter
+                cached_task = CachedTask(
+                    self,
+                    f"{state_prefix}Cache",
+                    state_prefix=state_prefix,
+                    step_name=name,
+                    parameter_path=parameters_path,
+                    batch_task=batch_task,
+                    table_name=cache_table_name,
+                    image_digest=image_digest,
+                )
+                self._ending_point = cached_task.ending_point
+                self._starting_point = cached_task.starting_point
+            return
+
+        if items_per_job == 1:
+            # one job for each element of the parameter list
+            items_path = parameters_path
+            item_parameters = {f"{name}_parameter.$": "$$.Map.Item.Value"}
+            variables = {"PARAMETER": f"$.{name}_parameter", **extra_variables}
+        else:
+            # one job for each chunk of items_per_job elements, the chunk is passed to
+            # the container as a json encoded list
+            items_path = f"$.{name}_chunks"
+            item_parameters = {
+                f"{name}_parameters.$": "States.JsonToString($$.Map.Item.Value)"
+            }
+            variables = {"PARAMETERS": f"$.{name}_parameters", **extra_variables}
+
+        if offload_payloads:
+            # the items are small references to S3 objects, the container stores its
+            # result under the execution and stage. Iterations don't need a copy of
+            # all the parameters and only return the id of their job, which the map
+            # adds to its input
+            map_parameters = item_parameters
+            map_paths = {"ResultPath": f"$.{name}Results"}
+            task_paths = {"OutputPath": "$.resultData.JobId"}
+        else:
+            # every iteration gets the parameters and the first one is the output
+            # of the map, so the state doesn't grow with the stages
+            map_parameters = {"parameters.$": "$.parameters", **item_parameters}
+            map_paths = {"OutputPath": "$.[0]"}
+            task_paths = {}
+
+        def iteration_task(queue_arn, definition_arn, task_variables):
+            return {
+                **submit_job_state(
+                    job_name,
+                    queue_arn,
+                    definition_arn,
+                    environment=container_environment(task_variables),
+                    completion_mode=completion_mode,
+                ),
+                **task_paths,
+                "End": True,
+            }
+
+        if fan_out_mode == "distributed":
+            # the items are read from a manifest in S3 and every iteration is a
+            # child execution, for fan outs too large for the execution input or
+            # history
+            batch_fan_out = sfn.CustomState(
+                self,
+                f"{state_prefix}DistributedMap",
+                state_json=distributed_map_state(
+                    name,
+                    job_name,
+                    job_queue_arn,
+                    job_definition_arn,
+                    manifest_bucket_name,
+                    manifest_path=parameters_path,
+                    manifest_format=manifest_format,
+                    items_per_job=items_per_job,
+                    max_concurrency=stage["max_concurrency"],
+                    tolerated_failure_percentage=tolerated_failure_percentage,
+                    offload_payloads=offload_payloads,
+                    completion_mode=completion_mode,
+                ),
+            )
+        elif fan_out_mode == "array":
+            # a single batch array job with one child for each element of the list,
+            # the size of the array comes from the input of the state. The list is
+            # written to a manifest in S3 first, the children read their element
+            # from it
+            batch_fan_out = sfn.CustomState(
+                self,
+                f"{state_prefix}ArrayTask",
+                state_json=submit_job_state(
+                    job_name,
+                    job_queue_arn,
+                    job_definition_arn,
+                    **array_job_arguments(
+                        name,
+                        manifest_bucket_name,
+                        items_path,
+                        container_environment(extra_variables),
+                    ),
+                ),
+            )
+            manifest_state = sfn.CustomState(
+                self,
+                f"{state_prefix}ArrayManifest",
+                state_json=array_manifest_state(name, manifest_bucket_name, items_path),
+            )
+        else:
+            if function_arn:
+                # the jobs run in the lambda function of the stage instead of
+                # containers
+                iteration_start = f"{state_prefix}Lambda"
+                iteration_states = {
+                    iteration_start: {
+                        **lambda_invoke_state(
+                            function_arn, container_environment(variables)
+                        ),
+                        **task_paths,
+                        "End": True,
+                    }
+                }
+            else:
+                iteration_start = f"{state_prefix}Task"
+                iteration_states = {
+                    iteration_start: iteration_task(
+                        job_queue_arn, job_definition_arn, variables
+                    )
+                }
+
+            if cache_table_name:
+                # skip the job when the cache holds a result for the same parameter
+                iteration_states = cached_states(
+                    state_prefix,
+                    name,
+                    f"$.{name}_parameter",
+                    f"{state_prefix}Task",
+                    iteration_states[f"{state_prefix}Task"],
+                    cache_table_name,
+                    image_digest,
+                    hit_output_path="$.cache.lookup.Item.job_id.S"
+                    if offload_payloads
+                    else None,
+                )
+                iteration_start = f"{state_prefix}CacheKey"
+
+            if tiers:
+                # an item is either its parameter, which runs in the default tier,
+                # or an object with the parameter and a size hint, which runs in the
+                # first tier the size fits. Sized items larger than every tier are
+                # unwrapped for the default tier
+                size_path = f"$.{name}_parameter.size"
+                route_choices = []
+                for tier in tiers:
+                    tier_task = f"{state_prefix}Task{tier['state_suffix']}"
+                    iteration_states[tier_task] = iteration_task(
+                        tier["job_queue_arn"],
+                        tier["job_definition_arn"],
+                        {**variables, "PARAMETER": f"$.{name}_parameter.parameter"},
+                    )
+                    route_choices.append(
+                        {
+                            "And": [
+                                {"Variable": size_path, "IsPresent": True},
+                                {"Variable": size_path, "IsNumeric": True},
+                                {
+                                    "Variable": size_path,
+                                    "NumericLessThanEquals": tier["max_size"],
+                                },
+                            ],
+                            "Next": tier_task,
+                        }
+                    )
+                route_choices.append(
+                    {
+                        "Variable": f"$.{name}_parameter.parameter",
+                        "IsPresent": True,
+                        "Next": f"{state_prefix}Unwrap",
+                    }
+                )
+                iteration_states[f"{state_prefix}Route"] = {
+                    "Type": "Choice",
+                    "Choices": route_choices,
+                    "Default": f"{state_prefix}Task",
+                }
+                iteration_states[f"{state_prefix}Unwrap"] = {
+                    "Type": "Pass",
+                    "InputPath": f"$.{name}_parameter.parameter",
+                    "ResultPath": f"$.{name}_parameter",
+                    "Next": f"{state_prefix}Task",
+                }
+                iteration_start = f"{state_prefix}Route"
+
+            if shards:
+                # items are spread over the shards by the md5 of their parameter, an
+                # item always runs in the same shard. Each shard task runs in the
+                # queue of its shard with the default job definition
+                shard_choices = []
+                iteration_states = {}
+                for shard in shards:
+                    shard_task = f"{state_prefix}Task{shard['state_suffix']}"
+                    iteration_states[shard_task] = iteration_task(
+                        shard["job_queue_arn"], job_definition_arn, variables
+                    )
+                    if shard["upper_bound"]:
+                        shard_choices.append(
+                            {
+                                "Variable": "$.shard.hash",
+                                "StringLessThan": shard["upper_bound"],
+                                "Next": shard_task,
+                            }
+                        )
+                    else:
+                        default_shard_task = shard_task
+                if shard_choices:
+                    iteration_states[f"{state_prefix}Hash"] = {
+                        "Type": "Pass",
+                        "Parameters": {
+                            "hash.$": f"States.Hash($.{name}_parameter, 'MD5')"
+                        },
+                        "ResultPath": "$.shard",
+                        "Next": f"{state_prefix}Shard",
+                    }
+                    iteration_states[f"{state_prefix}Shard"] = {
+                        "Type": "Choice",
+                        "Choices": shard_choices,
+                        "Default": default_shard_task,
+                    }
+                    iteration_start = f"{state_prefix}Hash"
+                else:
+                    # a single shard takes every item, a choice needs a condition
+                    iteration_start = default_shard_task
+
+            # the map is written as Amazon States Language rather than with the
+            # python CDK, which doesn't support intrinsic functions such as
+            # States.JsonToString in its parameters
+            batch_fan_out = sfn.CustomState(
+                self,
+                f"{state_prefix}Map",
+                state_json={
+                    "Type": "Map",
+                    "MaxConcurrency": stage["max_concurrency"],
+                    "Parameters": map_parameters,
+                    "ItemsPath": items_path,
+                    "Iterator": {
+                        "StartAt": iteration_start,
+                        "States": iteration_states,
+                    },
+                    **map_paths,
+                },
+            )
+
+        self._ending_point = batch_fan_out
+        self._starting_point = batch_fan_out
+
+        if fan_out_mode == "array":
+            manifest_state.next(batch_fan_out)
+            self._starting_point = manifest_state
+
+        if items_per_job > 1 and fan_out_mode != "distributed":
+            # split the parameter list in chunks before fanning out over them
+            chunk_state = sfn.CustomState(
+                self,
+                f"{state_prefix}Chunk",
+                state_json={
+                    "Type": "Pass",
+                    "Parameters": {
+                        "parameters.$": "$.parameters",
+                        f"{name}_chunks.$": "States.ArrayPartition("
+                        + f"{parameters_path}, {items_per_job})",
+                    },
+                },
+            )
+            chunk_state.next(self._starting_point)
+            self._starting_point = chunk_state
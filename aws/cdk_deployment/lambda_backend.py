@@ -0,0 +1,57 @@
+import os
+
+from aws_cdk import aws_lambda as lambda_
+from aws_cdk import core
+from cdk_deployment import defaults
+
+# the code of the image, the handler is lambda_handler in source/main.py
+SOURCE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "source")
+SOURCE_EXCLUDE = ["Dockerfile", "setup.py", "requirements.txt", "__pycache__"]
+# variables of the batch jobs which apply to the functions too. The checkpoints are
+# keyed by the batch job id and the result cache isn't available
+FUNCTION_ENVIRONMENT = ("PAYLOAD_BUCKET", "METRICS_NAMESPACE", "BRANCH_NAME")
+
+
+class LambdaBackend(core.Construct):
+
+    """
+    Function running the jobs of a step whose items are too small to be worth a
+    batch job, with the same code as the image. boto3 comes with the runtime
+    """
+
+    @property
+    def function(self):
+        return self._function
+
+    def __init__(
+        self,
+        scope: core.Construct,
+        id: str,
+        branch_name: str,
+        step_name: str,
+        job_environment: dict,
+        memory_mib: int = defaults.LAMBDA_MEMORY_MIB,
+        timeout_seconds: int = defaults.LAMBDA_TIMEOUT_SECONDS,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        environment = {
+            name: value
+            for name, value in job_environment.items()
+            if name in FUNCTION_ENVIRONMENT
+        }
+        # the metrics of the function are dimensioned by its step from the start
+        environment["STEP_NAME"] = step_name
+
+        self._function = lambda_.Function(
+            self,
+            f"csfe{step_name.capitalize()}Function",
+            function_name=f"csfe-{branch_name}-{step_name}",
+            runtime=lambda_.Runtime.PYTHON_3_8,
+            handler="main.lambda_handler",
+            code=lambda_.Code.from_asset(SOURCE_DIR, exclude=SOURCE_EXCLUDE),
+            memory_size=memory_mib,
+            timeout=core.Duration.seconds(timeout_seconds),
+            environment=environment,
+        )
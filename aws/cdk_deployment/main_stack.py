@@ -1,13 +1,42 @@
+import json
+import re
+
 from aws_cdk import aws_batch as batch
+from aws_cdk import aws_dynamodb as dynamodb
 from aws_cdk import aws_ec2 as ec2
 from aws_cdk import aws_ecr as ecr
 from aws_cdk import aws_ecs as ecs
 from aws_cdk import aws_iam as iam
+from aws_cdk import aws_s3 as s3
 from aws_cdk import aws_stepfunctions as sfn
 from aws_cdk import core
-from cdk_deployment.jobs.step1_task import Step1Task
-from cdk_deployment.jobs.step2_task import Step2Task
-from cdk_deployment.jobs.step3_task import Step3Task
+from cdk_deployment import defaults
+from cdk_deployment.compute_shard import ComputeShard, hash_bounds
+from cdk_deployment.jobs.asl import (
+    DEFINITION_MAX_BYTES,
+    FAN_OUT_MODES,
+    used_substitutions,
+)
+from cdk_deployment.jobs.collect_task import CollectTask
+from cdk_deployment.jobs.express_task import ExpressTask
+from cdk_deployment.jobs.pipeline_task import PipelineTask
+from cdk_deployment.jobs.stage_task import StageTask
+from cdk_deployment.lambda_backend import LambdaBackend
+from cdk_deployment.metrics_dashboard import MetricsDashboard
+from cdk_deployment.pipeline_spec import (
+    default_pipeline_spec,
+    load_pipeline_spec,
+    normalize_stages,
+)
+from cdk_deployment.resource_tier import ResourceTier, retry_on_spot_interruption
+from cdk_deployment.scratch_storage import (
+    SCRATCH_STORAGE,
+    has_instance_store,
+    scratch_block_devices,
+    scratch_mounts,
+    scratch_user_data_commands,
+)
+from cdk_deployment.warm_capacity import WarmCapacityController
 
 
 class MainStack(core.Stack):
@@ -19,10 +48,174 @@ class MainStack(core.Stack):
         branch_name: str,
         account: str,
         region: str,
+        step2_items_per_job: int = 1,
+        step3_items_per_job: int = 1,
+        step2_fan_out_mode: str = "map",
+        step3_fan_out_mode: str = "map",
+        topology: str = "barrier",
+        offload_payloads: bool = False,
+        collect_results: bool = False,
+        cache_results: bool = False,
+        cache_ttl_days: int = 7,
+        image_digest: str = None,
+        completion_mode: str = "run_job",
+        step1_backend: str = "batch",
+        step2_backend: str = "batch",
+        step3_backend: str = "batch",
+        lambda_memory_mib: int = defaults.LAMBDA_MEMORY_MIB,
+        lambda_timeout_seconds: int = defaults.LAMBDA_TIMEOUT_SECONDS,
+        job_vcpus: int = defaults.JOB_VCPUS,
+        job_memory_limit_mib: int = defaults.JOB_MEMORY_LIMIT_MIB,
+        maxv_cpus: int = defaults.MAXV_CPUS,
+        minv_cpus: int = defaults.MINV_CPUS,
+        instance_types: list = defaults.INSTANCE_TYPES,
+        max_concurrency: int = defaults.MAX_CONCURRENCY,
+        tiers: list = defaults.TIERS,
+        shards: list = defaults.SHARDS,
+        checkpoint_jobs: bool = False,
+        warm_capacity: list = defaults.WARM_CAPACITY,
+        emit_metrics: bool = False,
+        scratch_storage: str = None,
+        scratch_volume_gib: int = defaults.SCRATCH_VOLUME_GIB,
+        scratch_throughput_mibps: int = defaults.SCRATCH_THROUGHPUT_MIBPS,
+        pipeline=None,
+        vpc_id: str = None,
+        vpc_availability_zones: list = (),
+        vpc_public_subnet_ids: list = (),
+        manifest_format: str = "jsonl",
+        tolerated_failure_percentage: float = 0,
         **kwargs,
     ) -> None:
         super().__init__(scope, id, **kwargs)
 
+        if collect_results and not offload_payloads:
+            raise Exception("Collecting the results requires offload_payloads")
+        if cache_results and not image_digest:
+            raise Exception("The result cache requires the digest of the image")
+        if image_digest and not re.match(r"^sha256:[0-9a-f]{64}$", image_digest):
+            raise Exception("image_digest must be the sha256:<hex> digest of the image")
+        if cache_results and collect_results:
+            # a cache hit only returns the id of a job of an earlier execution, whose
+            # results are under the prefix of that execution
+            raise Exception("The result cache can't be combined with collect_results")
+
+        if topology not in ("barrier", "pipelined"):
+            raise Exception("topology must be one of barrier, pipelined")
+        if topology == "pipelined" and (
+            step2_items_per_job != 1
+            or step3_items_per_job != 1
+            or step2_fan_out_mode != "map"
+            or step3_fan_out_mode != "map"
+            or offload_payloads
+            or cache_results
+        ):
+            raise Exception(
+                "The pipelined topology runs one item per job with a map fan out "
+                + "and inline payloads, without result cache"
+            )
+        if tiers and topology != "barrier":
+            raise Exception("Resource tiers require the barrier topology")
+        max_sizes = [tier.get("max_size") for tier in tiers]
+        if len({tier.get("name") for tier in tiers}) != len(tiers) or any(
+            not isinstance(size, (int, float)) for size in max_sizes
+        ):
+            raise Exception("Resource tiers need distinct names and a numeric max_size")
+        if max_sizes != sorted(max_sizes):
+            raise Exception("Resource tiers must be sorted by max_size")
+        if shards and (tiers or topology != "barrier"):
+            raise Exception("Shards require the barrier topology, without resource tiers")
+        weights = [shard.get("weight", 1) for shard in shards]
+        if len({shard.get("name") for shard in shards}) != len(shards) or any(
+            not isinstance(weight, (int, float)) or weight <= 0 for weight in weights
+        ):
+            raise Exception("Shards need distinct names and a positive weight")
+        if scratch_storage and scratch_storage not in SCRATCH_STORAGE:
+            raise Exception(
+                "scratch_storage must be one of " + ", ".join(SCRATCH_STORAGE)
+            )
+        if scratch_storage == "instance_store":
+            ec2_instance_types = list(instance_types)
+            for tier in tiers:
+                if not tier.get("fargate"):
+                    ec2_instance_types += tier.get("instance_types", instance_types)
+            for shard in shards:
+                ec2_instance_types += shard.get("instance_types", instance_types)
+            without_store = sorted(
+                {name for name in ec2_instance_types if not has_instance_store(name)}
+            )
+            if without_store:
+                raise Exception(
+                    "Instance store scratch storage requires instance types with NVMe "
+                    + "volumes, not "
+                    + ", ".join(without_store)
+                )
+
+        if pipeline:
+            # a declarative list of stages replaces step 1, 2 and 3
+            if topology != "barrier":
+                raise Exception("A pipeline spec runs with the barrier topology")
+            if (
+                step2_items_per_job != 1
+                or step3_items_per_job != 1
+                or step2_fan_out_mode != "map"
+                or step3_fan_out_mode != "map"
+                or {step1_backend, step2_backend, step3_backend} != {"batch"}
+            ):
+                raise Exception(
+                    "The step settings don't apply to a pipeline spec, its stages "
+                    + "have settings of their own"
+                )
+            spec = pipeline
+        else:
+            if {step2_fan_out_mode, step3_fan_out_mode} - set(FAN_OUT_MODES):
+                raise Exception(f"fan_out_mode must be one of {', '.join(FAN_OUT_MODES)}")
+            # step 1 runs one job, then step 2 and 3 fan out
+            spec = default_pipeline_spec(
+                step2_items_per_job=step2_items_per_job,
+                step3_items_per_job=step3_items_per_job,
+                step2_fan_out_mode=step2_fan_out_mode,
+                step3_fan_out_mode=step3_fan_out_mode,
+                step1_backend=step1_backend,
+                step2_backend=step2_backend,
+                step3_backend=step3_backend,
+            )
+        stages = normalize_stages(
+            load_pipeline_spec(spec), job_vcpus, job_memory_limit_mib, max_concurrency
+        )
+        lambda_stages = [stage["name"] for stage in stages if stage["backend"] != "batch"]
+        if lambda_stages and topology != "barrier":
+            raise Exception(
+                "The lambda and express backends require the barrier topology"
+            )
+
+        # ecs drains a spot instance on its interruption notice, its containers
+        # receive a SIGTERM and have some time to save their progress before the
+        # SIGKILL. Batch only accepts user data in the MIME multi-part format
+        user_data_commands = [
+            "echo ECS_ENABLE_SPOT_INSTANCE_DRAINING=true >> /etc/ecs/ecs.config",
+            "echo ECS_CONTAINER_STOP_TIMEOUT="
+            + f"{defaults.CONTAINER_STOP_TIMEOUT_SECONDS}s >> /etc/ecs/ecs.config",
+        ]
+        if scratch_storage:
+            # jobs stage their inputs and outputs on a dedicated volume instead of
+            # the root volume of the host, see source/staging.py
+            user_data_commands += scratch_user_data_commands(scratch_storage)
+        user_data = "\n".join(
+            [
+                "MIME-Version: 1.0",
+                'Content-Type: multipart/mixed; boundary="==BOUNDARY=="',
+                "",
+                "--==BOUNDARY==",
+                'Content-Type: text/x-shellscript; charset="us-ascii"',
+                "",
+                "#!/bin/bash",
+                *user_data_commands,
+                "",
+                "--==BOUNDARY==--",
+                "",
+            ]
+        )
+
         # the launch template contains the parameters to launch an host instance
         # AMIs available at
         # https://docs.aws.amazon.com/AmazonECS/latest/developerguide/ecs-optimized_AMI.html
@@ -32,15 +225,16 @@ class MainStack(core.Stack):
             launch_template_name=f"csfe-{branch_name}-ec2-lt",
             launch_template_data=ec2.CfnLaunchTemplate.LaunchTemplateDataProperty(
                 image_id="ami-096dbf55319e44970",  # optimised linux AMI for ECS
-                # # the following adds more disk space
-                # block_device_mappings=[
-                #     ec2.CfnLaunchTemplate.BlockDeviceMappingProperty(
-                #         device_name="/dev/xvda",
-                #         ebs=ec2.CfnLaunchTemplate.EbsProperty(
-                #             volume_size=300, volume_type="gp2",
-                #         ),
-                #     )
-                # ],
+                user_data=core.Fn.base64(user_data),
+                # the gp3 scratch volume, if any
+                block_device_mappings=scratch_block_devices(
+                    scratch_storage,
+                    scratch_volume_gib,
+                    scratch_throughput_mibps,
+                    # gp3 provisions up to 0.25 MiB/s per iops
+                    max(defaults.SCRATCH_IOPS, scratch_throughput_mibps * 4),
+                )
+                or None,
             ),
         )
 
@@ -89,7 +283,23 @@ class MainStack(core.Stack):
         # vpc for the following compute env instance role
         # setting up default vpc
         # no inward connections if not from the same vpc, all outwards connections
-        vpc = ec2.Vpc.from_lookup(self, "csfeVpc", is_default=True)
+        if vpc_id:
+            # given vpc, the synth needs no lookup and runs offline
+            if not vpc_availability_zones or len(vpc_availability_zones) != len(
+                vpc_public_subnet_ids
+            ):
+                raise Exception(
+                    "A given vpc needs one public subnet per availability zone"
+                )
+            vpc = ec2.Vpc.from_vpc_attributes(
+                self,
+                "csfeVpc",
+                vpc_id=vpc_id,
+                availability_zones=list(vpc_availability_zones),
+                public_subnet_ids=list(vpc_public_subnet_ids),
+            )
+        else:
+            vpc = ec2.Vpc.from_lookup(self, "csfeVpc", is_default=True)
 
         # compute environments contain the Amazon ECS container instances that
         # are used to run containerized batch jobs.
@@ -104,18 +314,17 @@ class MainStack(core.Stack):
                 image=ec2.MachineImage.generic_linux(
                     {region: "ami-096dbf55319e44970"}  # match the ami above
                 ),
-                maxv_cpus=10,  # this is the total across all machines
+                maxv_cpus=maxv_cpus,  # this is the total across all machines
                 type=batch.ComputeResourceType.SPOT,  # spot are cheaper than on demand
                 allocation_strategy=batch.AllocationStrategy.SPOT_CAPACITY_OPTIMIZED,
                 launch_template=batch.LaunchTemplateSpecification(
                     launch_template_name=launch_template.launch_template_name,
                     version="$Latest",  # defined above
                 ),
-                minv_cpus=0,
+                minv_cpus=minv_cpus,
                 instance_role=batch_compute_instance_profile.instance_profile_name,
                 instance_types=[
-                    ec2.InstanceType("r4.large"),
-                    ec2.InstanceType("r5.large"),
+                    ec2.InstanceType(instance_type) for instance_type in instance_types
                 ],
                 desiredv_cpus=0,  # so that we don't keep stuff running if not needed
                 vpc=vpc,  # defined above
@@ -141,10 +350,135 @@ class MainStack(core.Stack):
             enabled=True,
         )
 
+        if warm_capacity:
+            # raises the minimum vCPUs ahead of the expected executions, so that
+            # their first jobs don't wait for instances to start, and lowers it back
+            # once the queue has drained
+            WarmCapacityController(
+                self,
+                "warmCapacity",
+                branch_name=branch_name,
+                compute_environment=compute_environment,
+                job_queue=job_queue,
+                schedule=list(warm_capacity),
+                maxv_cpus=maxv_cpus,
+                base_minv_cpus=minv_cpus,
+            )
+
         # retrieve ecr repo where our image is stored
         repo = ecr.Repository.from_repository_name(
             self, "csfeEcrRepo", ecr_repository_name
         )
+        # the image of the branch, pinned to its digest when one is given so that
+        # the jobs run exactly the image the result cache keys are derived from
+        job_image = ecs.EcrImage(repo, image_digest or branch_name)
+
+        # role assumed by the containers of the batch jobs, ie the permissions
+        # available to the code under source
+        batch_job_role = iam.Role(
+            self,
+            "csfeBatchJobRole",
+            assumed_by=iam.ServicePrincipal("ecs-tasks.amazonaws.com"),
+        )
+        # the container runs its parameters on one worker process per vCPU, batch
+        # only sets cpu shares on ec2 so the count is passed explicitly
+        job_environment = {"JOB_VCPUS": str(job_vcpus)}
+        # volumes and mount points of the ec2 job definitions
+        container_mounts = {}
+        if scratch_storage:
+            container_mounts = scratch_mounts()
+            job_environment["SCRATCH_DIR"] = defaults.SCRATCH_PATH
+
+        if offload_payloads:
+            # claim check pattern, large inputs and the results of the jobs are
+            # stored in S3 and only their keys travel through the step function
+            payload_bucket = s3.Bucket(
+                self,
+                "csfePayloadBucket",
+                bucket_name=f"csfe-{branch_name}-{account}-payloads",
+                block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+                lifecycle_rules=[s3.LifecycleRule(expiration=core.Duration.days(30))],
+            )
+            payload_bucket.grant_read_write(batch_job_role)
+            job_environment["PAYLOAD_BUCKET"] = payload_bucket.bucket_name
+
+        fan_out_modes = {stage["fan_out_mode"] for stage in stages}
+        manifest_bucket = None
+        if fan_out_modes & {"array", "distributed"}:
+            # the distributed maps read their items from manifests in S3, and write
+            # the results of their iterations next to them. The array jobs read
+            # their items from a manifest the step function writes there
+            if offload_payloads:
+                manifest_bucket = payload_bucket
+            else:
+                manifest_bucket = s3.Bucket(
+                    self,
+                    "csfeManifestBucket",
+                    bucket_name=f"csfe-{branch_name}-{account}-manifests",
+                    block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+                    lifecycle_rules=[s3.LifecycleRule(expiration=core.Duration.days(30))],
+                )
+                manifest_bucket.grant_read(batch_job_role)
+
+        if emit_metrics:
+            # the jobs write their timings as embedded metric format log lines,
+            # turned into metrics by CloudWatch Logs, see source/metrics.py
+            job_environment["METRICS_NAMESPACE"] = defaults.METRICS_NAMESPACE
+            job_environment["BRANCH_NAME"] = branch_name
+            MetricsDashboard(
+                self,
+                "metricsDashboard",
+                branch_name=branch_name,
+                steps=[stage["name"] for stage in stages]
+                + (["collect"] if collect_results else []),
+            )
+
+        if checkpoint_jobs:
+            # the jobs save their progress, and a job retried after a spot
+            # interruption resumes from it, see source/checkpoint.py
+            if offload_payloads:
+                checkpoint_bucket = payload_bucket
+            else:
+                checkpoint_bucket = s3.Bucket(
+                    self,
+                    "csfeCheckpointBucket",
+                    bucket_name=f"csfe-{branch_name}-{account}-checkpoints",
+                    block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+                    lifecycle_rules=[s3.LifecycleRule(expiration=core.Duration.days(7))],
+                )
+                checkpoint_bucket.grant_read_write(batch_job_role)
+            job_environment["CHECKPOINT_BUCKET"] = checkpoint_bucket.bucket_name
+
+        cache_table = None
+        if cache_results:
+            # content addressed cache of the results of the jobs, keyed by the hash
+            # of step, parameter and image digest. Expired items are deleted by
+            # dynamodb through the expires_at ttl attribute
+            cache_table = dynamodb.Table(
+                self,
+                "csfeCacheTable",
+                table_name=f"csfe-{branch_name}-cache",
+                partition_key=dynamodb.Attribute(
+                    name="cache_key", type=dynamodb.AttributeType.STRING
+                ),
+                billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+                time_to_live_attribute="expires_at",
+                removal_policy=core.RemovalPolicy.DESTROY,
+            )
+            cache_table.grant_read_write_data(batch_job_role)
+            job_environment["CACHE_TABLE"] = cache_table.table_name
+            job_environment["CACHE_TTL_SECONDS"] = str(cache_ttl_days * 24 * 3600)
+
+        if completion_mode == "callback":
+            # the containers send back the task token themselves.
+            # Task tokens can't be scoped to a resource
+            batch_job_role.add_to_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=["states:SendTaskSuccess", "states:SendTaskFailure"],
+                    resources=["*"],
+                )
+            )
 
         # job definitions specify how jobs are to be run
         batch_job = batch.JobDefinition(
@@ -152,37 +486,248 @@ class MainStack(core.Stack):
             "csfeJobDef",
             job_definition_name=f"csfe-{branch_name}",
             container=batch.JobDefinitionContainer(
-                image=ecs.EcrImage(repo, branch_name),
-                memory_limit_mib=2000,
-                vcpus=1,
+                image=job_image,
+                memory_limit_mib=job_memory_limit_mib,
+                vcpus=job_vcpus,
+                job_role=batch_job_role,
+                environment=job_environment,
+                **container_mounts,
             ),  # which image to use
-            retry_attempts=1,
+            retry_attempts=defaults.RETRY_ATTEMPTS,
         )
+        # only spot interruptions are retried, the job resumes from its checkpoint
+        retry_on_spot_interruption(batch_job.node.default_child)
+
+        # resource tiers, an item with a size hint runs in the first tier whose
+        # max_size it fits, with its own job definition and queue, so that small
+        # items don't reserve the memory of the large ones and don't wait behind them.
+        # The job definition and queue above are the default tier
+        execution_role, fargate_security_group = None, None
+        if any(tier.get("fargate") for tier in tiers):
+            # fargate pulls the image and writes the logs with an execution role
+            execution_role = iam.Role(
+                self,
+                "csfeBatchExecutionRole",
+                assumed_by=iam.ServicePrincipal("ecs-tasks.amazonaws.com"),
+                managed_policies=[
+                    iam.ManagedPolicy.from_aws_managed_policy_name(
+                        "service-role/AmazonECSTaskExecutionRolePolicy"
+                    )
+                ],
+            )
+            # no inward connections, all outwards connections
+            fargate_security_group = ec2.SecurityGroup(
+                self, "csfeFargateSecurityGroup", vpc=vpc, allow_all_outbound=True
+            )
+        instance_profile_name = batch_compute_instance_profile.instance_profile_name
+        resource_tiers = []
+        for tier in tiers:
+            resource_tier = ResourceTier(
+                self,
+                f"{tier.get('name')}Tier",
+                tier=tier,
+                branch_name=branch_name,
+                region=region,
+                vpc=vpc,
+                image=job_image,
+                batch_service_role=batch_service_role,
+                batch_job_role=batch_job_role,
+                job_environment=job_environment,
+                container_mounts=container_mounts,
+                instance_profile_name=instance_profile_name,
+                launch_template_name=launch_template.launch_template_name,
+                execution_role=execution_role,
+                security_group=fargate_security_group,
+                instance_types=instance_types,
+                maxv_cpus=maxv_cpus,
+            )
+            if not tier.get("fargate"):
+                resource_tier.node.add_dependency(launch_template)
+            resource_tiers.append(resource_tier)
+
+        # shards, each with its own compute environment and queue, spread the step 2
+        # and 3 items over several spot pools so that a shortage in one of them
+        # only slows down its share of the items
+        compute_shards = []
+        for shard, upper_bound in zip(shards, hash_bounds(weights) if shards else []):
+            compute_shard = ComputeShard(
+                self,
+                f"{shard.get('name')}Shard",
+                shard=shard,
+                branch_name=branch_name,
+                region=region,
+                vpc=vpc,
+                batch_service_role=batch_service_role,
+                launch_template_name=launch_template.launch_template_name,
+                instance_profile_name=instance_profile_name,
+                upper_bound=upper_bound,
+                instance_types=instance_types,
+                maxv_cpus=maxv_cpus,
+            )
+            compute_shard.node.add_dependency(launch_template)
+            compute_shards.append(compute_shard)
+
+        # lambda backends, the stages whose items are too small to be worth a batch
+        # job run them in a function with the code of the image instead
+        functions = {}
+        for stage_name in lambda_stages:
+            functions[stage_name] = LambdaBackend(
+                self,
+                f"{stage_name}Lambda",
+                branch_name=branch_name,
+                step_name=stage_name,
+                job_environment=job_environment,
+                memory_mib=lambda_memory_mib,
+                timeout_seconds=lambda_timeout_seconds,
+            ).function
+            if offload_payloads:
+                payload_bucket.grant_read_write(functions[stage_name])
+
+        # stages with the same resources share a job definition, the default one
+        # when they have the resources of the stack
+        job_definitions = {(job_vcpus, job_memory_limit_mib): batch_job}
+        for stage in stages:
+            vcpus, memory_mib = stage["vcpus"], stage["memory_mib"]
+            if (vcpus, memory_mib) in job_definitions:
+                continue
+            stage_job = batch.JobDefinition(
+                self,
+                f"csfeJobDef{vcpus}x{memory_mib}",
+                job_definition_name=f"csfe-{branch_name}-{vcpus}x{memory_mib}",
+                container=batch.JobDefinitionContainer(
+                    image=job_image,
+                    memory_limit_mib=memory_mib,
+                    vcpus=vcpus,
+                    job_role=batch_job_role,
+                    environment={**job_environment, "JOB_VCPUS": str(vcpus)},
+                    **container_mounts,
+                ),
+                retry_attempts=defaults.RETRY_ATTEMPTS,
+            )
+            retry_on_spot_interruption(stage_job.node.default_child)
+            job_definitions[(vcpus, memory_mib)] = stage_job
+
+        # the states refer to the arns and names through placeholders, replaced by
+        # CloudFormation, so that the template holds each of them once instead of
+        # once per state
+        definition_substitutions = {"JobQueue": job_queue.job_queue_arn}
+        for (vcpus, memory_mib), stage_job in job_definitions.items():
+            placeholder = f"JobDefinition{vcpus}x{memory_mib}"
+            definition_substitutions[placeholder] = stage_job.job_definition_arn
+        if manifest_bucket:
+            definition_substitutions["ManifestBucket"] = manifest_bucket.bucket_name
+        if offload_payloads:
+            definition_substitutions["PayloadBucket"] = payload_bucket.bucket_name
+        if cache_table:
+            definition_substitutions["CacheTable"] = cache_table.table_name
+        stage_tiers = []
+        for tier in resource_tiers:
+            queue_placeholder = f"{tier.state_suffix}JobQueue"
+            definition_placeholder = f"{tier.state_suffix}JobDefinition"
+            definition_substitutions[queue_placeholder] = tier.queue.job_queue_arn
+            definition_substitutions[
+                definition_placeholder
+            ] = tier.job_definition.job_definition_arn
+            stage_tiers.append(
+                {
+                    "state_suffix": tier.state_suffix,
+                    "max_size": tier.max_size,
+                    "job_queue_arn": "${" + queue_placeholder + "}",
+                    "job_definition_arn": "${" + definition_placeholder + "}",
+                }
+            )
+        stage_shards = []
+        for shard in compute_shards:
+            queue_placeholder = f"{shard.state_suffix}JobQueue"
+            definition_substitutions[queue_placeholder] = shard.queue.job_queue_arn
+            stage_shards.append(
+                {
+                    "state_suffix": shard.state_suffix,
+                    "upper_bound": shard.upper_bound,
+                    "job_queue_arn": "${" + queue_placeholder + "}",
+                }
+            )
+        for stage_name, function in functions.items():
+            placeholder = f"{stage_name.capitalize()}Function"
+            definition_substitutions[placeholder] = function.function_arn
 
         # tasks, these is where we define the tasks that will compose our step function
-        step1_task = Step1Task(
-            self,
-            "step1Task",
-            branch_name=branch_name,
-            queue=job_queue,
-            job_definition=batch_job,
-        )
+        express_tasks = {}
+        stage_tasks = []
+        # with the pipelined topology, step 2 and 3 run in the same map iteration
+        for stage in stages if topology == "barrier" else stages[:1]:
+            stage_name = stage["name"]
+            stage_task = StageTask(
+                self,
+                f"{stage_name}Stage",
+                branch_name=branch_name,
+                stage=stage,
+                job_queue_arn="${JobQueue}",
+                job_definition_arn="${JobDefinition"
+                + f"{stage['vcpus']}x{stage['memory_mib']}"
+                + "}",
+                completion_mode=completion_mode,
+                offload_payloads=offload_payloads,
+                manifest_bucket_name="${ManifestBucket}" if manifest_bucket else None,
+                manifest_format=manifest_format,
+                tolerated_failure_percentage=tolerated_failure_percentage,
+                cache_table_name="${CacheTable}" if cache_table else None,
+                image_digest=image_digest,
+                # step 1 runs in the compute environment of the stack
+                tiers=stage_tiers if stage["fan_out_mode"] != "single" else None,
+                shards=stage_shards if stage["fan_out_mode"] != "single" else None,
+                function_arn="${" + f"{stage_name.capitalize()}Function" + "}"
+                if stage_name in functions
+                else None,
+            )
+            if stage["backend"] == "express":
+                # the stage runs in a child execution
+                express_tasks[stage_name] = ExpressTask(
+                    self,
+                    f"{stage_name}Express",
+                    branch_name=branch_name,
+                    step_name=stage_name,
+                    step_task=stage_task,
+                    function=functions[stage_name],
+                    definition_substitutions=definition_substitutions,
+                )
+                stage_task = express_tasks[stage_name]
+                definition_substitutions.update(stage_task.definition_substitutions)
+            stage_tasks.append(stage_task)
+        first_task, *downstream_tasks = stage_tasks
 
-        step2_task = Step2Task(
-            self,
-            "step2Task",
-            branch_name=branch_name,
-            queue=job_queue,
-            job_definition=batch_job,
-        )
+        if topology == "pipelined":
+            # step 2 and 3 of an item run in the same map iteration
+            downstream_tasks.append(
+                PipelineTask(
+                    self,
+                    "pipelineTask",
+                    branch_name=branch_name,
+                    job_queue_arn="${JobQueue}",
+                    job_definition_arn="${JobDefinition"
+                    + f"{job_vcpus}x{job_memory_limit_mib}"
+                    + "}",
+                    completion_mode=completion_mode,
+                    max_concurrency=max_concurrency,
+                )
+            )
 
-        step3_task = Step3Task(
-            self,
-            "step3Task",
-            branch_name=branch_name,
-            queue=job_queue,
-            job_definition=batch_job,
-        )
+        if collect_results:
+            # merge the results of all the jobs once the last stage has completed
+            downstream_tasks.append(
+                CollectTask(
+                    self,
+                    "collectTask",
+                    branch_name=branch_name,
+                    job_queue_arn="${JobQueue}",
+                    job_definition_arn="${JobDefinition"
+                    + f"{job_vcpus}x{job_memory_limit_mib}"
+                    + "}",
+                    payload_bucket_name="${PayloadBucket}",
+                )
+            )
+
+        state_machine_name = f"csfe-{branch_name}-stepfunction"
 
         # step function policies
         # these appears to be default for the task we need
@@ -217,6 +762,99 @@ class MainStack(core.Stack):
                 resources=["*"],
             )
         )  # not really needed, helps developers analyze and debug
+        if cache_table:
+            step_function_policies.add_statements(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=["dynamodb:GetItem"],
+                    resources=[cache_table.table_arn],
+                )
+            )  # looking up the result cache before submitting the jobs
+        if manifest_bucket:
+            # the distributed maps read their manifest and write their results, the
+            # array jobs get their manifest from the step function
+            step_function_policies.add_statements(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=[
+                        "s3:GetObject",
+                        "s3:PutObject",
+                        "s3:ListMultipartUploadParts",
+                        "s3:AbortMultipartUpload",
+                    ],
+                    resources=[manifest_bucket.arn_for_objects("*")],
+                )
+            )
+        if "distributed" in fan_out_modes:
+            # the iterations of the distributed maps are child executions of the
+            # state machine
+            step_function_policies.add_statements(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=["states:StartExecution"],
+                    resources=[
+                        f"arn:aws:states:{region}:{account}:"
+                        + f"stateMachine:{state_machine_name}"
+                    ],
+                )
+            )
+            step_function_policies.add_statements(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=["states:DescribeExecution", "states:StopExecution"],
+                    resources=[
+                        f"arn:aws:states:{region}:{account}:"
+                        + f"execution:{state_machine_name}/*"
+                    ],
+                )
+            )
+
+        direct_functions = [
+            functions[stage["name"]] for stage in stages if stage["backend"] == "lambda"
+        ]
+        if direct_functions:
+            step_function_policies.add_statements(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=["lambda:InvokeFunction"],
+                    resources=[function.function_arn for function in direct_functions],
+                )
+            )  # the stages with the lambda backend invoke their function
+        if express_tasks:
+            # the stages with the express backend start a child execution and wait
+            # for it
+            step_function_policies.add_statements(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=["states:StartExecution"],
+                    resources=[task.state_machine_arn for task in express_tasks.values()],
+                )
+            )
+            step_function_policies.add_statements(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=["states:DescribeExecution", "states:StopExecution"],
+                    resources=[
+                        f"arn:aws:states:{region}:{account}:express:"
+                        + f"csfe-{branch_name}-{stage_name}-express:*"
+                        for stage_name in express_tasks
+                    ],
+                )
+            )
+            step_function_policies.add_statements(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=[
+                        "events:PutTargets",
+                        "events:PutRule",
+                        "events:DescribeRule",
+                    ],
+                    resources=[
+                        f"arn:aws:events:{region}:{account}:rule/"
+                        + "StepFunctionsGetEventsForStepFunctionsExecutionRule",
+                    ],
+                )
+            )
 
         # step function role
         step_function_role = iam.Role(
@@ -224,27 +862,42 @@ class MainStack(core.Stack):
             "csfeJStepFunctionRole",
             role_name=f"csfe-{branch_name}-func",
             assumed_by=iam.ServicePrincipal("states.amazonaws.com"),
-            inline_policies=[step_function_policies],  # defined above
+            inline_policies={
+                "csfeStepFunctionPolicies": step_function_policies
+            },  # defined above
         )
 
         # State machine definition
         # this is the logic (very simple) of the step function
-        # step 1 followed by 2 followed by 3
-        (step2_task.ending_point).next(step3_task.starting_point)
-        (step1_task.ending_point).next(step2_task.starting_point)
-        state_machine_def = step1_task.starting_point
+        # step 1 followed by 2 followed by 3, or followed by the pipelined 2 and 3,
+        # optionally followed by the collection of the results. Or the stages of the
+        # pipeline spec one after the other
+        previous_task = first_task
+        for task in downstream_tasks:
+            (previous_task.ending_point).next(task.starting_point)
+            previous_task = task
+        state_machine_def = first_task.starting_point
 
-        state_machine_name = f"csfe-{branch_name}-stepfunction"
         graph = sfn.StateGraph(
             state_machine_def.start_state,
             f"State Machine {state_machine_name} definition",
         )
 
-        # render state machine
+        # render state machine, the definition holds no token, its size is known
+        # before deploying
+        definition_string = json.dumps(graph.to_graph_json(), separators=(",", ":"))
+        if len(definition_string.encode("utf-8")) > DEFINITION_MAX_BYTES:
+            raise Exception(
+                f"The definition of {len(stages)} stages exceeds the "
+                + f"{DEFINITION_MAX_BYTES} bytes quota of step functions"
+            )
         sfn.CfnStateMachine(
             self,
             "csfeStateMachine",
-            definition_string=core.Stack.of(self).to_json_string(graph.to_graph_json()),
+            definition_string=definition_string,
+            definition_substitutions=used_substitutions(
+                definition_string, definition_substitutions
+            ),
             state_machine_name=state_machine_name,
             role_arn=step_function_role.role_arn,
         )
@@ -0,0 +1,70 @@
+from aws_cdk import aws_cloudwatch as cloudwatch
+from aws_cdk import core
+from cdk_deployment import defaults
+
+# metrics written by source/metrics.py, timers in milliseconds and counters
+TIMERS = ("JobTime", "SetupTime", "ReadTime", "ComputeTime", "StoreTime")
+COUNTERS = ("ParametersSucceeded", "ParametersFailed", "ParametersResumed")
+PERCENTILES = ("p50", "p95")
+
+
+class MetricsDashboard(core.Construct):
+
+    """
+    CloudWatch dashboard of the metrics the jobs write in the embedded metric
+    format: p50 and p95 of every timer and the sum of every counter, per step
+    """
+
+    def __init__(
+        self,
+        scope: core.Construct,
+        id: str,
+        branch_name: str,
+        steps: list,
+        namespace: str = defaults.METRICS_NAMESPACE,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        def metric(metric_name, step, statistic):
+            return cloudwatch.Metric(
+                namespace=namespace,
+                metric_name=metric_name,
+                dimensions={"Branch": branch_name, "Step": step},
+                statistic=statistic,
+                label=f"{step} {statistic}",
+                period=core.Duration.minutes(5),
+            )
+
+        timer_widgets = [
+            cloudwatch.GraphWidget(
+                title=f"{timer} (ms)",
+                left=[
+                    metric(timer, step, percentile)
+                    for step in steps
+                    for percentile in PERCENTILES
+                ],
+                width=12,
+            )
+            for timer in TIMERS
+        ]
+        counter_widgets = [
+            cloudwatch.GraphWidget(
+                title=counter,
+                left=[metric(counter, step, "Sum") for step in steps],
+                width=8,
+            )
+            for counter in COUNTERS
+        ]
+
+        cloudwatch.Dashboard(
+            self,
+            "csfeDashboard",
+            dashboard_name=f"csfe-{branch_name}",
+            # two timers per row then the counters
+            widgets=[
+                timer_widgets[index : index + 2]
+                for index in range(0, len(timer_widgets), 2)
+            ]
+            + [counter_widgets],
+        )
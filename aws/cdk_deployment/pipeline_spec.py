@@ -0,0 +1,139 @@
+import json
+import os
+import re
+
+from cdk_deployment import defaults
+
+# stage names end up in state names, job names and metric dimensions
+STAGE_NAME = re.compile(r"^[a-z][a-z0-9]*$")
+# a single stage runs one job on one parameter, the others fan out over a list, the
+# distributed map reads its items from a manifest in S3 instead of the input
+STAGE_FAN_OUT_MODES = ("single", "map", "array", "distributed")
+# where the jobs of a stage run: batch containers, a lambda function invoked by the
+# tasks, or the same function invoked by an express child execution of the stage
+BACKENDS = ("batch", "lambda", "express")
+
+
+def load_pipeline_spec(spec):
+
+    """
+    Stages of a pipeline spec, given as a list of stages, a dict with a stages list,
+    a json string or the path of a json or yaml file. Yaml requires PyYAML
+    """
+
+    if isinstance(spec, str):
+        if spec.lstrip().startswith(("{", "[")):
+            spec = json.loads(spec)
+        elif os.path.splitext(spec)[1] in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise Exception("Yaml pipeline specs require PyYAML, pip install pyyaml")
+            with open(spec) as stream:
+                spec = yaml.safe_load(stream)
+        else:
+            with open(spec) as stream:
+                spec = json.load(stream)
+    if isinstance(spec, dict):
+        spec = spec.get("stages")
+    if not isinstance(spec, list) or not spec:
+        raise Exception("A pipeline spec needs a non empty list of stages")
+    return spec
+
+
+def normalize_stages(
+    stages,
+    job_vcpus=defaults.JOB_VCPUS,
+    job_memory_limit_mib=defaults.JOB_MEMORY_LIMIT_MIB,
+    max_concurrency=defaults.MAX_CONCURRENCY,
+):
+
+    """
+    Stages with every setting filled in, raises when one is invalid. A stage has a
+    name and optionally a fan_out_mode (single, map, array or distributed, defaults
+    to map), a backend (batch, lambda or express, defaults to batch), the key of its
+    parameters in the execution input (<name>_parameter for a single stage,
+    <name>_manifest for a distributed one, <name>_parameters otherwise),
+    items_per_job, max_concurrency, and the vcpus and memory_mib of its jobs.
+    Settings left out follow the stack
+    """
+
+    normalized = []
+    for stage in stages:
+        name = str(stage.get("name", ""))
+        if not STAGE_NAME.match(name):
+            raise Exception(f"Stage {name}: names must be lower case letters and digits")
+        fan_out_mode = stage.get("fan_out_mode", "map")
+        if fan_out_mode not in STAGE_FAN_OUT_MODES:
+            raise Exception(
+                f"Stage {name}: fan_out_mode must be one of "
+                + ", ".join(STAGE_FAN_OUT_MODES)
+            )
+        backend = stage.get("backend", "batch")
+        if backend not in BACKENDS:
+            raise Exception(f"Stage {name}: backend must be one of {', '.join(BACKENDS)}")
+        items_per_job = stage.get("items_per_job", 1)
+        if not isinstance(items_per_job, int) or items_per_job < 1:
+            raise Exception(f"Stage {name}: items_per_job must be a positive integer")
+        if fan_out_mode == "single" and items_per_job != 1:
+            raise Exception(f"Stage {name}: a single stage runs one item")
+        vcpus = stage.get("vcpus", job_vcpus)
+        memory_mib = stage.get("memory_mib", job_memory_limit_mib)
+        if not isinstance(vcpus, int) or not isinstance(memory_mib, int):
+            raise Exception(f"Stage {name}: vcpus and memory_mib must be integers")
+        default_parameters = {
+            "single": f"{name}_parameter",
+            "distributed": f"{name}_manifest",
+        }.get(fan_out_mode, f"{name}_parameters")
+        normalized.append(
+            {
+                "name": name,
+                "fan_out_mode": fan_out_mode,
+                "backend": backend,
+                "parameters": stage.get("parameters", default_parameters),
+                "items_per_job": items_per_job,
+                "max_concurrency": stage.get("max_concurrency", max_concurrency),
+                "vcpus": vcpus,
+                "memory_mib": memory_mib,
+            }
+        )
+
+    names = [stage["name"] for stage in normalized]
+    if len(set(names)) != len(names):
+        raise Exception("The stages of a pipeline need distinct names")
+    return normalized
+
+
+def default_pipeline_spec(
+    step2_items_per_job=1,
+    step3_items_per_job=1,
+    step2_fan_out_mode="map",
+    step3_fan_out_mode="map",
+    step1_backend="batch",
+    step2_backend="batch",
+    step3_backend="batch",
+):
+
+    """
+    Pipeline spec of the default step function, step 1 runs one job on
+    step1_parameter then step 2 and 3 fan out over step2_parameters and
+    step3_parameters, or read the manifests at step2_manifest and step3_manifest
+    """
+
+    return {
+        "stages": [
+            {"name": "step1", "fan_out_mode": "single", "backend": step1_backend},
+            {
+                "name": "step2",
+                "fan_out_mode": step2_fan_out_mode,
+                "items_per_job": step2_items_per_job,
+                "backend": step2_backend,
+            },
+            {
+                "name": "step3",
+                "fan_out_mode": step3_fan_out_mode,
+                "items_per_job": step3_items_per_job,
+                "backend": step3_backend,
+            },
+        ]
+    }
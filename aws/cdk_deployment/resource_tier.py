@@ -0,0 +1,250 @@
+import re
+
+from aws_cdk import aws_batch as batch
+from aws_cdk import aws_ec2 as ec2
+from aws_cdk import aws_ecs as ecs
+from aws_cdk import aws_iam as iam
+from aws_cdk import core
+from cdk_deployment import defaults
+
+# tier names end up in construct ids, state names and resource names
+TIER_NAME = re.compile(r"^[a-z][a-z0-9]*$")
+# retry the jobs stopped by a spot interruption, fail on any other reason
+EVALUATE_ON_EXIT = [
+    *(
+        {"OnStatusReason": reason, "Action": "RETRY"}
+        for reason in defaults.SPOT_INTERRUPTION_REASONS
+    ),
+    {"OnReason": "*", "Action": "EXIT"},
+]
+
+
+def retry_on_spot_interruption(job_definition: batch.CfnJobDefinition) -> None:
+
+    """
+    Limits the retries of a job definition to spot interruptions, not available in
+    the CDK construct
+    """
+
+    job_definition.add_property_override("RetryStrategy.EvaluateOnExit", EVALUATE_ON_EXIT)
+
+
+def spot_compute_environment(
+    scope: core.Construct,
+    id: str,
+    compute_environment_name: str,
+    region: str,
+    vpc: ec2.IVpc,
+    batch_service_role: iam.IRole,
+    launch_template_name: str,
+    instance_profile_name: str,
+    instance_types: list,
+    maxv_cpus: int,
+    availability_zones: list = None,
+) -> batch.ComputeEnvironment:
+
+    """
+    Compute environment of spot instances of instance_types, same as the one of the
+    stack, optionally limited to the subnets of availability_zones
+    """
+
+    return batch.ComputeEnvironment(
+        scope,
+        id,
+        compute_environment_name=compute_environment_name,
+        service_role=batch_service_role,
+        compute_resources=batch.ComputeResources(
+            image=ec2.MachineImage.generic_linux({region: "ami-096dbf55319e44970"}),
+            maxv_cpus=maxv_cpus,
+            type=batch.ComputeResourceType.SPOT,
+            allocation_strategy=batch.AllocationStrategy.SPOT_CAPACITY_OPTIMIZED,
+            launch_template=batch.LaunchTemplateSpecification(
+                launch_template_name=launch_template_name, version="$Latest"
+            ),
+            minv_cpus=0,
+            instance_role=instance_profile_name,
+            instance_types=[
+                ec2.InstanceType(instance_type) for instance_type in instance_types
+            ],
+            desiredv_cpus=0,
+            vpc=vpc,
+            vpc_subnets=ec2.SubnetSelection(availability_zones=availability_zones)
+            if availability_zones
+            else None,
+        ),
+    )
+
+
+class ResourceTier(core.Construct):
+
+    """
+    Compute environment, job queue and job definition of a resource tier, see
+    defaults.TIERS. Fargate tiers run on fargate spot, the others on spot instances of
+    their own instance types
+    """
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @property
+    def state_suffix(self):
+        return self._name.capitalize()
+
+    @property
+    def queue(self):
+        return self._queue
+
+    @property
+    def job_definition(self):
+        return self._job_definition
+
+    def __init__(
+        self,
+        scope: core.Construct,
+        id: str,
+        tier: dict,
+        branch_name: str,
+        region: str,
+        vpc: ec2.IVpc,
+        image: ecs.EcrImage,
+        batch_service_role: iam.IRole,
+        batch_job_role: iam.IRole,
+        job_environment: dict,
+        container_mounts: dict = None,
+        instance_profile_name: str = None,
+        launch_template_name: str = None,
+        execution_role: iam.IRole = None,
+        security_group: ec2.ISecurityGroup = None,
+        instance_types: list = defaults.INSTANCE_TYPES,
+        maxv_cpus: int = defaults.MAXV_CPUS,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        if not TIER_NAME.match(str(tier.get("name", ""))):
+            raise Exception("Tier names must be lower case letters and digits")
+
+        self._name = tier["name"]
+        self._max_size = tier["max_size"]
+        vcpus = tier.get("vcpus", defaults.JOB_VCPUS)
+        memory_mib = tier.get("memory_mib", defaults.JOB_MEMORY_LIMIT_MIB)
+        maxv_cpus = tier.get("maxv_cpus", maxv_cpus)
+        prefix = f"csfe-{branch_name}-{self._name}"
+        id_prefix = f"csfe{self.state_suffix}"
+        # the workers of the container follow the vCPUs of the tier
+        environment = {**job_environment, "JOB_VCPUS": str(vcpus)}
+
+        if tier.get("fargate"):
+            if memory_mib not in defaults.FARGATE_MEMORY_MIB.get(vcpus, ()):
+                raise Exception(
+                    f"Tier {self._name}: {vcpus} vCPUs and {memory_mib} MiB isn't a "
+                    + "fargate combination"
+                )
+            # fargate jobs can't mount the scratch storage of a host
+            environment.pop("SCRATCH_DIR", None)
+            # not available as a CDK construct yet. Jobs get a public ip to pull the
+            # image as the default vpc has no nat gateway
+            compute_environment = batch.CfnComputeEnvironment(
+                self,
+                f"{id_prefix}ComputeEnvironment",
+                type="MANAGED",
+                compute_environment_name=f"{prefix}-batch-ce",
+                service_role=batch_service_role.role_arn,
+                compute_resources=batch.CfnComputeEnvironment.ComputeResourcesProperty(
+                    type="FARGATE_SPOT",
+                    maxv_cpus=maxv_cpus,
+                    subnets=[subnet.subnet_id for subnet in vpc.public_subnets],
+                    security_group_ids=[security_group.security_group_id],
+                ),
+                state="ENABLED",
+            )
+            compute_environment = batch.ComputeEnvironment.from_compute_environment_arn(
+                self, f"{id_prefix}ComputeEnvironmentRef", compute_environment.ref
+            )
+
+            network_configuration = batch.CfnJobDefinition.NetworkConfigurationProperty(
+                assign_public_ip="ENABLED"
+            )
+            job_definition = batch.CfnJobDefinition(
+                self,
+                f"{id_prefix}JobDef",
+                type="container",
+                job_definition_name=prefix,
+                platform_capabilities=["FARGATE"],
+                container_properties=batch.CfnJobDefinition.ContainerPropertiesProperty(
+                    image=image.image_name,
+                    job_role_arn=batch_job_role.role_arn,
+                    execution_role_arn=execution_role.role_arn,
+                    resource_requirements=[
+                        batch.CfnJobDefinition.ResourceRequirementProperty(
+                            type="VCPU", value=str(vcpus)
+                        ),
+                        batch.CfnJobDefinition.ResourceRequirementProperty(
+                            type="MEMORY", value=str(memory_mib)
+                        ),
+                    ],
+                    environment=[
+                        batch.CfnJobDefinition.EnvironmentProperty(name=name, value=value)
+                        for name, value in environment.items()
+                    ],
+                    network_configuration=network_configuration,
+                ),
+                retry_strategy=batch.CfnJobDefinition.RetryStrategyProperty(
+                    attempts=defaults.RETRY_ATTEMPTS
+                ),
+            )
+            retry_on_spot_interruption(job_definition)
+            self._job_definition = batch.JobDefinition.from_job_definition_arn(
+                self, f"{id_prefix}JobDefRef", job_definition.ref
+            )
+        else:
+            if not isinstance(vcpus, int):
+                raise Exception(f"Tier {self._name}: ec2 jobs need whole vCPUs")
+            # same as the compute environment of the stack, with the instance types
+            # of the tier
+            compute_environment = spot_compute_environment(
+                self,
+                f"{id_prefix}ComputeEnvironment",
+                compute_environment_name=f"{prefix}-batch-ce",
+                region=region,
+                vpc=vpc,
+                batch_service_role=batch_service_role,
+                launch_template_name=launch_template_name,
+                instance_profile_name=instance_profile_name,
+                instance_types=tier.get("instance_types", instance_types),
+                maxv_cpus=maxv_cpus,
+            )
+
+            self._job_definition = batch.JobDefinition(
+                self,
+                f"{id_prefix}JobDef",
+                job_definition_name=prefix,
+                container=batch.JobDefinitionContainer(
+                    image=image,
+                    memory_limit_mib=memory_mib,
+                    vcpus=vcpus,
+                    job_role=batch_job_role,
+                    environment=environment,
+                    **(container_mounts or {}),
+                ),
+                retry_attempts=defaults.RETRY_ATTEMPTS,
+            )
+            retry_on_spot_interruption(self._job_definition.node.default_child)
+
+        self._queue = batch.JobQueue(
+            self,
+            f"{id_prefix}JobQueue",
+            compute_environments=[
+                batch.JobQueueComputeEnvironment(
+                    compute_environment=compute_environment, order=1
+                )
+            ],
+            job_queue_name=f"{prefix}-batch-jq",
+            priority=100,
+            enabled=True,
+        )
@@ -0,0 +1,101 @@
+from aws_cdk import aws_ec2 as ec2
+from aws_cdk import aws_ecs as ecs
+from cdk_deployment import defaults
+
+# ebs for a gp3 volume attached to every instance, instance_store for the NVMe
+# volumes of the instance types which have them
+SCRATCH_STORAGE = ("ebs", "instance_store")
+# device of the gp3 volume, amazon linux links it to its NVMe name on nitro instances
+EBS_DEVICE = "/dev/xvdb"
+VOLUME_NAME = "scratch"
+
+
+def has_instance_store(instance_type: str) -> bool:
+
+    """
+    Whether the instances of instance_type come with NVMe instance store volumes
+    """
+
+    return instance_type.split(".")[0] in defaults.INSTANCE_STORE_FAMILIES
+
+
+def scratch_block_devices(
+    storage: str,
+    volume_gib: int = defaults.SCRATCH_VOLUME_GIB,
+    throughput_mibps: int = defaults.SCRATCH_THROUGHPUT_MIBPS,
+    iops: int = defaults.SCRATCH_IOPS,
+) -> list:
+
+    """
+    Block device mappings of the launch template, the gp3 volume for ebs scratch
+    storage. Instance store volumes of nitro instances are attached without mapping
+    """
+
+    if storage != "ebs":
+        return []
+    if throughput_mibps * 4 > iops:
+        raise Exception("The gp3 throughput in MiB/s can be up to a quarter of its iops")
+    return [
+        ec2.CfnLaunchTemplate.BlockDeviceMappingProperty(
+            device_name=EBS_DEVICE,
+            ebs=ec2.CfnLaunchTemplate.EbsProperty(
+                volume_size=volume_gib,
+                volume_type="gp3",
+                throughput=throughput_mibps,
+                iops=iops,
+                delete_on_termination=True,
+            ),
+        )
+    ]
+
+
+def scratch_user_data_commands(storage: str, path: str = defaults.SCRATCH_PATH) -> list:
+
+    """
+    Commands of the user data formatting the scratch storage and mounting it at
+    path, writable by the non root user of the container. Several instance store
+    volumes are striped into a raid 0 array
+    """
+
+    if storage == "ebs":
+        find_device = [
+            f"while [ ! -e {EBS_DEVICE} ]; do sleep 1; done",
+            f"device={EBS_DEVICE}",
+        ]
+    else:
+        find_device = [
+            "devices=$(lsblk -d -n -o NAME,MODEL "
+            + "| awk '/Instance Storage/ {print \"/dev/\" $1}')",
+            "count=$(echo $devices | wc -w)",
+            "if [ $count -gt 1 ]; then",
+            "  yum install -y mdadm",
+            "  mdadm --create /dev/md0 --run --level=0 --raid-devices=$count $devices",
+            "  device=/dev/md0",
+            "else",
+            "  device=$devices",
+            "fi",
+        ]
+    return [
+        *find_device,
+        "mkfs -t xfs -f $device",
+        f"mkdir -p {path}",
+        f"mount -o noatime $device {path}",
+        f"chmod 1777 {path}",
+    ]
+
+
+def scratch_mounts(path: str = defaults.SCRATCH_PATH) -> dict:
+
+    """
+    Volumes and mount points of a job definition container, to be passed as keyword
+    arguments, bind mounting the scratch storage of the host at the same path
+    """
+
+    return {
+        "volumes": [ecs.Volume(name=VOLUME_NAME, host=ecs.Host(source_path=path))],
+        "mount_points": [
+            ecs.MountPoint(
+                container_path=path, source_volume=VOLUME_NAME, read_only=False
+            )
+        ],
+    }
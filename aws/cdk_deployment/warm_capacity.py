@@ -0,0 +1,81 @@
+import json
+import os
+
+from aws_cdk import aws_batch as batch
+from aws_cdk import aws_events as events
+from aws_cdk import aws_events_targets as events_targets
+from aws_cdk import aws_iam as iam
+from aws_cdk import aws_lambda as lambda_
+from aws_cdk import core
+from cdk_deployment import defaults
+from cdk_deployment.handlers.warm_capacity.index import validate_schedule
+
+HANDLER_DIR = os.path.join(os.path.dirname(__file__), "handlers", "warm_capacity")
+
+
+class WarmCapacityController(core.Construct):
+
+    """
+    Lambda run on a schedule keeping the minimum vCPUs of a compute environment at
+    the vCPUs of a declarative schedule of windows, see handlers/warm_capacity
+    """
+
+    def __init__(
+        self,
+        scope: core.Construct,
+        id: str,
+        branch_name: str,
+        compute_environment: batch.IComputeEnvironment,
+        job_queue: batch.IJobQueue,
+        schedule: list,
+        maxv_cpus: int = defaults.MAXV_CPUS,
+        base_minv_cpus: int = defaults.MINV_CPUS,
+        lead_minutes: int = defaults.WARM_CAPACITY_LEAD_MINUTES,
+        interval_minutes: int = defaults.WARM_CAPACITY_INTERVAL_MINUTES,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        validate_schedule(schedule, maxv_cpus)
+
+        controller = lambda_.Function(
+            self,
+            "csfeWarmCapacityFunction",
+            function_name=f"csfe-{branch_name}-warm-capacity",
+            runtime=lambda_.Runtime.PYTHON_3_8,
+            handler="index.handler",
+            code=lambda_.Code.from_asset(HANDLER_DIR),
+            timeout=core.Duration.seconds(30),
+            environment={
+                "COMPUTE_ENVIRONMENT": compute_environment.compute_environment_arn,
+                "JOB_QUEUE": job_queue.job_queue_arn,
+                "SCHEDULE": json.dumps(schedule),
+                "LEAD_MINUTES": str(lead_minutes),
+                "BASE_MINV_CPUS": str(base_minv_cpus),
+            },
+        )
+        controller.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["batch:UpdateComputeEnvironment"],
+                resources=[compute_environment.compute_environment_arn],
+            )
+        )
+        # describe and list calls can't be scoped to a resource
+        controller.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["batch:DescribeComputeEnvironments", "batch:ListJobs"],
+                resources=["*"],
+            )
+        )
+
+        # the windows are reconciled every interval, lead_minutes has to be longer
+        # than the interval to warm the instances up ahead of a window
+        events.Rule(
+            self,
+            "csfeWarmCapacitySchedule",
+            rule_name=f"csfe-{branch_name}-warm-capacity",
+            schedule=events.Schedule.rate(core.Duration.minutes(interval_minutes)),
+            targets=[events_targets.LambdaFunction(controller)],
+        )
@@ -0,0 +1,239 @@
+import argparse
+import hashlib
+import json
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+import time
+
+import pkg_resources
+
+AWS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+# everything the cloud assembly depends on besides the context and the CDK version,
+# the functions of the lambda backend are an asset of the source
+KEY_PATHS = (
+    "app.py",
+    "cdk.json",
+    "deploy-requirements.txt",
+    "cdk_deployment",
+    "../source",
+)
+# context values which can be the path of a file read by the app, relative to the
+# working directory, see app.py
+CONTEXT_PATHS = ("pipeline",)
+CACHE_DIRECTORY = os.path.join(AWS_DIRECTORY, ".synth-cache")
+CDK_DISTRIBUTION = "aws-cdk.core"
+# cloud assemblies kept in the cache, the least recently used ones are removed
+MAX_ENTRIES = 20
+
+
+def files_digest(paths, root=AWS_DIRECTORY):
+
+    """
+    sha-256 of the relative names and the contents of the files under paths
+    """
+
+    digest = hashlib.sha256()
+    for path in paths:
+        full_path = os.path.join(root, path)
+        if os.path.isfile(full_path):
+            files = [full_path]
+        else:
+            files = [
+                os.path.join(directory, name)
+                for directory, subdirectories, names in os.walk(full_path)
+                if "__pycache__" not in directory
+                for name in names
+            ]
+        for file_path in sorted(files):
+            digest.update(os.path.relpath(file_path, root).encode("utf-8"))
+            with open(file_path, "rb") as stream:
+                digest.update(hashlib.sha256(stream.read()).digest())
+    return digest.hexdigest()
+
+
+def context_files(context):
+
+    """
+    Paths of the files the context values of CONTEXT_PATHS point to, the values
+    holding inline json excepted
+    """
+
+    return [
+        context[name]
+        for name in CONTEXT_PATHS
+        if isinstance(context.get(name), str)
+        and not context[name].lstrip().startswith(("{", "["))
+        and os.path.isfile(context[name])
+    ]
+
+
+def cache_key(context):
+
+    """
+    Key of the cloud assembly synthesized with context, the sources of the app, the
+    context values, the contents of the files they point to, eg a pipeline spec,
+    and the versions of CDK and python
+    """
+
+    digest = hashlib.sha256()
+    digest.update(files_digest(KEY_PATHS).encode("utf-8"))
+    digest.update(json.dumps(context, sort_keys=True).encode("utf-8"))
+    digest.update(files_digest(context_files(context), os.getcwd()).encode("utf-8"))
+    digest.update(pkg_resources.get_distribution(CDK_DISTRIBUTION).version.encode())
+    digest.update(f"{sys.version_info.major}.{sys.version_info.minor}".encode())
+    return digest.hexdigest()
+
+
+def read_context(values):
+
+    """
+    Context of the app. When run by the cdk cli it comes from CDK_CONTEXT_JSON,
+    otherwise from cdk.json, cdk.context.json and the key=value pairs of values,
+    in this order of precedence
+    """
+
+    if "CDK_CONTEXT_JSON" in os.environ:
+        return json.loads(os.environ["CDK_CONTEXT_JSON"])
+
+    context = {}
+    with open(os.path.join(AWS_DIRECTORY, "cdk.json")) as stream:
+        context.update(json.load(stream).get("context", {}))
+    if os.path.exists(os.path.join(AWS_DIRECTORY, "cdk.context.json")):
+        with open(os.path.join(AWS_DIRECTORY, "cdk.context.json")) as stream:
+            context.update(json.load(stream))
+    for value in values:
+        name, _, value = value.partition("=")
+        context[name] = value
+    return context
+
+
+def copy_tree(source, destination):
+
+    """
+    Copies the files under source to destination, replacing existing files
+    """
+
+    for directory, _, names in os.walk(source):
+        target = os.path.join(destination, os.path.relpath(directory, source))
+        os.makedirs(target, exist_ok=True)
+        for name in names:
+            shutil.copy2(os.path.join(directory, name), os.path.join(target, name))
+
+
+def missing_context(outdir):
+
+    """
+    Lookups the app couldn't resolve from its context, eg the default vpc
+    """
+
+    with open(os.path.join(outdir, "manifest.json")) as stream:
+        return json.load(stream).get("missing", [])
+
+
+def synthesize(context, outdir):
+
+    """
+    Runs app.py in this process, returns the seconds spent importing the CDK
+    modules and the seconds spent synthesizing
+    """
+
+    # read by the jsii runtime, started at the first import of a CDK module
+    os.environ["CDK_CONTEXT_JSON"] = json.dumps(context)
+    os.environ["CDK_OUTDIR"] = outdir
+    sys.path.insert(0, AWS_DIRECTORY)
+
+    start = time.perf_counter()
+    import cdk_deployment.main_stack  # noqa: F401
+
+    imported = time.perf_counter()
+    runpy.run_path(os.path.join(AWS_DIRECTORY, "app.py"), run_name="__main__")
+    return imported - start, time.perf_counter() - imported
+
+
+def prune(cache_directory, max_entries):
+
+    """
+    Removes the least recently used cloud assemblies beyond max_entries
+    """
+
+    entries = sorted(
+        (os.path.join(cache_directory, name) for name in os.listdir(cache_directory)),
+        key=os.path.getmtime,
+        reverse=True,
+    )
+    for entry in entries[max_entries:]:
+        shutil.rmtree(entry, ignore_errors=True)
+
+
+def main():
+
+    """
+    Synthesizes the app into CDK_OUTDIR, or cdk.out, reusing the cloud assembly of a
+    previous synth with the same sources, context and CDK version. It is the app
+    of cdk.json, so cdk synth and cdk deploy go through the cache, and it can be
+    run on its own with the context as -c key=value. Assemblies with unresolved
+    lookups aren't cached, the cdk cli resolves them and runs the app again
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-c",
+        "--context",
+        type=str,
+        action="append",
+        default=[],
+        help="context value as key=value, ignored when run by the cdk cli",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="always synthesize")
+    parser.add_argument(
+        "--max-entries", type=int, default=MAX_ENTRIES, help="assemblies kept"
+    )
+    args = parser.parse_args()
+
+    run_by_cli = "CDK_OUTDIR" in os.environ
+    outdir = os.environ.get("CDK_OUTDIR") or os.path.join(AWS_DIRECTORY, "cdk.out")
+    context = read_context(args.context)
+    key = cache_key(context)
+    entry = os.path.join(CACHE_DIRECTORY, key)
+
+    if not args.no_cache and os.path.isdir(entry):
+        copy_tree(entry, outdir)
+        os.utime(entry)
+        # on stderr, the cdk cli reads the assembly and shows the app output
+        print(f"Synth cache hit {key[:12]}, copied to {outdir}", file=sys.stderr)
+        sys.exit(0)
+
+    # a fresh directory, so that no file left in outdir by another synth is cached
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    assembly = tempfile.mkdtemp(dir=CACHE_DIRECTORY, prefix="tmp-")
+    import_seconds, synth_seconds = synthesize(context, assembly)
+    print(
+        f"Synth cache miss {key[:12]}: imports {import_seconds:.2f}s, "
+        + f"synth {synth_seconds:.2f}s",
+        file=sys.stderr,
+    )
+    copy_tree(assembly, outdir)
+
+    missing = missing_context(assembly)
+    if missing or args.no_cache:
+        shutil.rmtree(assembly, ignore_errors=True)
+    else:
+        shutil.rmtree(entry, ignore_errors=True)
+        os.rename(assembly, entry)
+        prune(CACHE_DIRECTORY, args.max_entries)
+
+    if missing:
+        keys = ", ".join(lookup["key"] for lookup in missing)
+        print(f"Not cached, unresolved lookups: {keys}", file=sys.stderr)
+        # the cdk cli performs the lookups and runs the app again
+        sys.exit(0 if run_by_cli else 1)
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+
+    main()
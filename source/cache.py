@@ -0,0 +1,64 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+
+import clients
+
+
+def cache_key(step_name, parameter, image_digest):
+
+    """
+    Key of the cached result of a job, the sha-256 hex digest of step name,
+    parameter and image digest. Same as the key derived by the step function with
+    States.Hash
+    """
+
+    content = f"{step_name}|{parameter}|{image_digest}"
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+
+    """
+    Cache of the results of the jobs stored in a dynamodb table. Items expire after
+    ttl_seconds through the expires_at ttl attribute of the table, expires holds the
+    same time as a timestamp the step function can compare
+    """
+
+    def __init__(self, table_name, ttl_seconds, dynamodb_client=None, clock=time.time):
+
+        self.table_name = table_name
+        self.ttl_seconds = int(ttl_seconds)
+        self.dynamodb_client = dynamodb_client or clients.client("dynamodb")
+        self.clock = clock
+
+    def get(self, key):
+
+        """
+        Returns the cached item for key, None when missing or expired
+        """
+
+        item = self.dynamodb_client.get_item(
+            TableName=self.table_name, Key={"cache_key": {"S": key}}
+        ).get("Item")
+        if not item or int(item["expires_at"]["N"]) <= self.clock():
+            return None
+        return {"job_id": item["job_id"]["S"], "expires_at": int(item["expires_at"]["N"])}
+
+    def put(self, key, job_id):
+
+        """
+        Stores the result of the job job_id under key
+        """
+
+        expires_at = int(self.clock()) + self.ttl_seconds
+        expires = datetime.fromtimestamp(expires_at, timezone.utc)
+        self.dynamodb_client.put_item(
+            TableName=self.table_name,
+            Item={
+                "cache_key": {"S": key},
+                "job_id": {"S": job_id},
+                "expires_at": {"N": str(expires_at)},
+                "expires": {"S": expires.strftime("%Y-%m-%dT%H:%M:%SZ")},
+            },
+        )
@@ -0,0 +1,45 @@
+import json
+
+import clients
+
+
+class TaskCallback:
+
+    """
+    Reports the completion of a job to the step function waiting on task_token.
+    Used as a context manager it sends the task success with the json of output once
+    the body ran or, if the body raised, the task failure. Without task_token it
+    does nothing
+    """
+
+    def __init__(self, task_token, sfn_client=None):
+
+        self.task_token = task_token
+        self.sfn_client = sfn_client
+        self.output = {}
+
+    def __enter__(self):
+
+        if self.task_token:
+            self.sfn_client = self.sfn_client or clients.client("stepfunctions")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        if not self.task_token:
+            return False
+
+        succeeded = exc_type is None or (
+            issubclass(exc_type, SystemExit) and not exc_value.code
+        )
+        if succeeded:
+            self.sfn_client.send_task_success(
+                taskToken=self.task_token, output=json.dumps(self.output)
+            )
+        else:
+            self.sfn_client.send_task_failure(
+                taskToken=self.task_token,
+                error=exc_type.__name__[:256],
+                cause=str(exc_value)[:32768],
+            )
+        return False
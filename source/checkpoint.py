@@ -0,0 +1,232 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import time
+
+import clients
+
+# exit code of a job stopped by SIGTERM, ie 128 + the signal number
+EXIT_INTERRUPTED = 128 + signal.SIGTERM
+# progress is written at most once per interval, and always on SIGTERM
+CHECKPOINT_SECONDS = 30
+# seconds left to the worker processes to flush their progress on SIGTERM
+WORKERS_FLUSH_SECONDS = 10
+
+
+class LocalStore:
+
+    """
+    Checkpoints stored as json files under a local directory, eg a volume which
+    outlives the container
+    """
+
+    def __init__(self, directory):
+
+        self.directory = directory
+
+    def _path(self, key):
+
+        return os.path.join(self.directory, key.replace(":", "_"))
+
+    def load(self, key):
+
+        """
+        Returns the checkpoint under key, None when missing
+        """
+
+        try:
+            with open(self._path(key)) as stream:
+                return json.load(stream)
+        except FileNotFoundError:
+            return None
+
+    def save(self, key, data):
+
+        """
+        Stores data under key, replacing the previous checkpoint atomically
+        """
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "w") as stream:
+            json.dump(data, stream)
+        os.replace(f"{path}.tmp", path)
+
+
+class S3Store:
+
+    """
+    Checkpoints stored as json objects under a prefix of an S3 bucket
+    """
+
+    def __init__(self, bucket, prefix="checkpoints/", s3_client=None):
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.s3_client = s3_client or clients.client("s3")
+
+    def load(self, key):
+
+        """
+        Returns the checkpoint under key, None when missing
+        """
+
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket, Key=self.prefix + key
+            )
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        return json.loads(response["Body"].read())
+
+    def save(self, key, data):
+
+        """
+        Stores data under key
+        """
+
+        self.s3_client.put_object(
+            Bucket=self.bucket, Key=self.prefix + key, Body=json.dumps(data).encode()
+        )
+
+
+def store_from_environment():
+
+    """
+    Store of CHECKPOINT_BUCKET, else of CHECKPOINT_DIR, None when checkpoints are
+    disabled
+    """
+
+    if os.environ.get("CHECKPOINT_BUCKET"):
+        return S3Store(os.environ["CHECKPOINT_BUCKET"])
+    if os.environ.get("CHECKPOINT_DIR"):
+        return LocalStore(os.environ["CHECKPOINT_DIR"])
+    return None
+
+
+def checkpoint_key(job_id, parameter):
+
+    """
+    Key of the checkpoint of a parameter. Batch keeps the id of a job across its
+    attempts, so a retry finds the checkpoints of the previous attempt
+    """
+
+    digest = hashlib.sha256(parameter.encode("utf-8")).hexdigest()[:32]
+    return f"{job_id}/{digest}.json"
+
+
+class Checkpoint:
+
+    """
+    Progress of a parameter within a job. state is the last state saved by a previous
+    attempt, None at the first one, and record its result when it had completed.
+    Without store nothing is persisted
+    """
+
+    def __init__(self, store, key, interval=CHECKPOINT_SECONDS, clock=time.monotonic):
+
+        self.store = store
+        self.key = key
+        self.interval = interval
+        self.clock = clock
+        self._pending = None
+        self._saved_at = clock()
+        loaded = store.load(key) if store else None
+        self.state = loaded.get("state") if loaded else None
+        self.record = loaded.get("record") if loaded else None
+
+    def save(self, state):
+
+        """
+        Records the progress of the parameter, written to the store at most once per
+        interval
+        """
+
+        self.state = state
+        self._pending = {"state": state}
+        if self.clock() - self._saved_at >= self.interval:
+            self.flush()
+
+    def complete(self, record):
+
+        """
+        Records the result of the parameter, a retry returns it without running the
+        parameter again. A failed result isn't recorded, the retry runs the
+        parameter again from the last state saved
+        """
+
+        if record.get("status") == "failed":
+            self.flush()
+            return
+        self.record = record
+        self._pending = {"state": self.state, "record": record}
+        self.flush()
+
+    def flush(self):
+
+        """
+        Writes the progress not yet in the store
+        """
+
+        pending, self._pending = self._pending, None
+        if pending and self.store:
+            self.store.save(self.key, pending)
+        self._saved_at = self.clock()
+
+
+# checkpoint of the parameter running in this process
+_current = Checkpoint(None, None)
+
+
+def start(job_id, parameter, store=None):
+
+    """
+    Loads the checkpoint of a parameter and makes it the current one
+    """
+
+    global _current
+    _current = Checkpoint(store, checkpoint_key(job_id, parameter))
+    return _current
+
+
+def current():
+
+    """
+    Checkpoint of the parameter running in this process, the functions running a
+    parameter save their progress with current().save(state) and resume from
+    current().state
+    """
+
+    return _current
+
+
+def _flush_and_exit(signum, frame):
+
+    """
+    SIGTERM handler, flushes the current checkpoint and the ones of the worker
+    processes then exits. Batch retries the job when the stop comes from a spot
+    interruption
+    """
+
+    print("SIGTERM received, saving the progress")
+    _current.flush()
+    workers = multiprocessing.active_children()
+    for worker in workers:
+        worker.terminate()
+    deadline = time.monotonic() + WORKERS_FLUSH_SECONDS
+    for worker in workers:
+        worker.join(max(0, deadline - time.monotonic()))
+    # skips the clean up, eg the task callback, the job isn't over when retried
+    os._exit(EXIT_INTERRUPTED)
+
+
+def install_signal_handler():
+
+    """
+    Saves the progress on SIGTERM, sent by ecs when a spot instance is drained or a
+    job is terminated. Installed in the main process and in every worker process
+    """
+
+    signal.signal(signal.SIGTERM, _flush_and_exit)
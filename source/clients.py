@@ -0,0 +1,15 @@
+import functools
+
+
+@functools.lru_cache(maxsize=None)
+def client(service_name):
+
+    """
+    boto3 client of service_name, shared by the callers. boto3 is imported by the
+    first call only: it takes most of the start up time of the interpreter and jobs
+    which don't call AWS don't pay for it
+    """
+
+    import boto3
+
+    return boto3.client(service_name)
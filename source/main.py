@@ -1,19 +1,403 @@
 import argparse
+import functools
+import json
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import cache
+import callback
+import checkpoint
+import metrics
+import payloads
+
+EXIT_FAILURE = 1
+EXIT_PARTIAL_FAILURE = 3
+
+
+def run(parameter):
+
+    """
+    Processes a single parameter and returns its result. Does nothing if not
+    printing it
+    """
+
+    print(f"Entrypoint running with parameter {parameter}")
+
+    return {"status": "succeeded"}
+
+
+def resolve_manifest(manifest, index):
+
+    """
+    Returns the parameters of a batch array job child, ie the element of the json
+    encoded manifest at the child index. The manifest is given as such or as the
+    s3:// url of the object holding it. An element can be a single parameter or a
+    chunk of parameters
+    """
+
+    if index is None:
+        raise Exception("AWS_BATCH_JOB_ARRAY_INDEX is required to resolve a manifest")
+
+    item = json.loads(payloads.read_parameter(manifest))[int(index)]
+    if isinstance(item, list):
+        return [str(parameter) for parameter in item]
+    return [str(item)]
+
+
+def decode_parameters(encoded):
+
+    """
+    Parameters of a json encoded list, the chunks of a distributed map are lists of
+    objects with a parameter
+    """
+
+    return [
+        str(parameter["parameter"] if isinstance(parameter, dict) else parameter)
+        for parameter in json.loads(encoded)
+    ]
+
+
+def read_parameters_file(path):
+
+    """
+    Reads one parameter per line from a file, or from stdin when path is -
+    """
+
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path) as stream:
+            lines = stream.read().splitlines()
+
+    return [line for line in lines if line.strip()]
+
+
+def cgroup_cpu_quota():
+
+    """
+    vCPUs allowed by the cpu quota of the container cgroup, v2 or v1, None when
+    there is no quota
+    """
+
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as stream:
+            quota, period = stream.read().split()
+        if quota != "max":
+            return max(1, int(quota) // int(period))
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as stream:
+            quota = int(stream.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as stream:
+            period = int(stream.read())
+        if quota > 0:
+            return max(1, quota // period)
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+
+def available_vcpus():
+
+    """
+    vCPUs allocated to the container: JOB_VCPUS, set by the job definition as batch
+    only sets cpu shares on ec2, else the cgroup quota, else the cpus the process
+    can run on
+    """
+
+    if os.environ.get("JOB_VCPUS"):
+        return max(1, int(float(os.environ["JOB_VCPUS"])))
+
+    return cgroup_cpu_quota() or len(os.sched_getaffinity(0))
+
+
+def run_isolated(parameter, function=run):
+
+    """
+    Runs a parameter with function, s3:// claim checks are resolved first. An error
+    only fails its own parameter and is returned in the result. With a checkpoint
+    store function can save its progress through checkpoint.current(), and a
+    parameter completed by a previous attempt of the job isn't run again
+    """
+
+    parameter_checkpoint = checkpoint.start(
+        os.environ.get("AWS_BATCH_JOB_ID", "local"),
+        parameter,
+        checkpoint.store_from_environment(),
+    )
+    if parameter_checkpoint.record:
+        print(f"Parameter {parameter} completed by a previous attempt")
+        metrics.count("ParametersResumed")
+        return parameter_checkpoint.record
+
+    try:
+        with metrics.timer("ReadTime"):
+            value = payloads.read_parameter(parameter)
+        with metrics.timer("ComputeTime"):
+            record = {"parameter": parameter, **function(value)}
+    except Exception as error:
+        print(f"Parameter {parameter} failed: {error!r}")
+        record = {"parameter": parameter, "status": "failed", "error": repr(error)}
+    metrics.count(
+        "ParametersFailed" if record.get("status") == "failed" else "ParametersSucceeded"
+    )
+
+    parameter_checkpoint.complete(record)
+    return record
+
+
+def init_worker():
+
+    """
+    Initializer of the worker processes, they save their progress on SIGTERM and
+    write their metrics at exit
+    """
+
+    checkpoint.install_signal_handler()
+    metrics.init_worker()
+
+
+def process(parameters, workers=1, function=run):
+
+    """
+    Runs every parameter with function on a pool of workers processes and returns
+    the results in the same order as the parameters
+    """
+
+    if workers <= 1 or len(parameters) <= 1:
+        return [run_isolated(parameter, function) for parameter in parameters]
+
+    workers = min(workers, len(parameters))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        return list(
+            pool.map(
+                functools.partial(run_isolated, function=function),
+                parameters,
+                chunksize=max(1, len(parameters) // (4 * workers)),
+            )
+        )
+
+
+def exit_code(records):
+
+    """
+    0 when every parameter succeeded, EXIT_PARTIAL_FAILURE when only some failed and
+    EXIT_FAILURE when all of them failed
+    """
+
+    failed = sum(record["status"] == "failed" for record in records)
+    if not failed:
+        return 0
+    if failed == len(records):
+        return EXIT_FAILURE
+    return EXIT_PARTIAL_FAILURE
+
+
+def store(records, job_id):
+
+    """
+    Stores the results in the payload bucket when PAYLOAD_BUCKET is set, and records
+    the job in the result cache when CACHE_TABLE and CACHE_KEY are set and every
+    parameter succeeded, a failure is retried by the next execution
+    """
+
+    payload_bucket = os.environ.get("PAYLOAD_BUCKET")
+    if payload_bucket:
+        payloads.write_results(
+            payload_bucket,
+            payloads.result_key(
+                os.environ.get("EXECUTION_NAME", "local"),
+                os.environ.get("STEP_NAME", "local"),
+                job_id,
+            ),
+            records,
+        )
+
+    cache_table = os.environ.get("CACHE_TABLE")
+    cache_key = os.environ.get("CACHE_KEY")
+    if cache_table and cache_key and exit_code(records) == 0:
+        cache.ResultCache(cache_table, os.environ["CACHE_TTL_SECONDS"]).put(
+            cache_key, job_id
+        )
+
+
+def write_records(records, path):
+
+    """
+    Writes the results as newline delimited json to a file, or to stdout when path
+    is -
+    """
+
+    lines = "".join(json.dumps(record) + "\n" for record in records)
+    if path == "-":
+        sys.stdout.write(lines)
+    else:
+        with open(path, "w") as stream:
+            stream.write(lines)
+
+
+def run_job(parameters, workers, job_id):
+
+    """
+    Runs the parameters of a job and stores their results, returns the results
+    """
+
+    with metrics.timer("JobTime"):
+        records = process(parameters, workers)
+        with metrics.timer("StoreTime"):
+            store(records, job_id)
+    return records
+
+
+def run_event(event, job_id):
+
+    """
+    Runs the job of an event of the lambda backend and returns its results. The
+    event holds in environment the variables a batch job of the step gets from the
+    step function, eg PARAMETER or PARAMETERS and EXECUTION_NAME, they are set for
+    the duration of the job. The parameters run one after the other, lambda has no
+    shared memory for a pool of worker processes
+    """
+
+    environment = {
+        name: str(value) for name, value in event.get("environment", {}).items()
+    }
+    previous = {name: os.environ.get(name) for name in environment}
+    os.environ.update(environment)
+    try:
+        if environment.get("PARAMETERS"):
+            parameters = decode_parameters(environment["PARAMETERS"])
+        else:
+            parameters = [environment["PARAMETER"]]
+        return run_job(parameters, 1, job_id)
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        # the execution environment outlives the invocation, nothing runs at exit
+        metrics.flush()
+
+
+def lambda_handler(event, context):
+
+    """
+    Entrypoint of the lambda backend of a step, for items too small to be worth a
+    batch job, see run_event. Returns the job id, ie the request id, and the
+    results. Raises when a parameter failed, so that the task fails like the batch
+    job would
+    """
+
+    job_id = context.aws_request_id
+    records = run_event(event, job_id)
+    if exit_code(records):
+        failed = sum(record["status"] == "failed" for record in records)
+        raise Exception(f"{failed} of {len(records)} parameters failed")
+    return {"JobId": job_id, "Status": "SUCCEEDED", "Records": records}
 
 
 def main():
 
     """
-    The entrypoint of the package. Does nothing if not printing the parameters
+    The entrypoint of the package. Runs the single parameter or, when a json encoded
+    list is passed with --parameters, every parameter of the chunk. Batch array job
+    children resolve their parameters from --manifest. Many parameters are processed
+    on a pool of --workers processes. --aggregate merges the results of a whole
+    execution. When TASK_TOKEN is set the job reports its own completion to the step
+    function. When CHECKPOINT_BUCKET or CHECKPOINT_DIR is set the progress is saved
+    and a retry of the job resumes from it. With METRICS_NAMESPACE the timings of
+    the job are written at exit in the CloudWatch embedded metric format. --output
+    writes the results to a file too. lambda_handler is the same entrypoint for the
+    lambda backend
     """
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("-p", "--parameter", type=str, help="parameter", required=True)
+    parser.add_argument("-p", "--parameter", type=str, nargs="+", help="parameters")
+    parser.add_argument(
+        "-ps",
+        "--parameters",
+        type=str,
+        help="json encoded list of parameters, overrides --parameter",
+    )
+    parser.add_argument(
+        "-f",
+        "--parameters-file",
+        type=str,
+        help="file with one parameter per line, - for stdin, overrides --parameter",
+    )
+    parser.add_argument(
+        "-m",
+        "--manifest",
+        type=str,
+        help="json encoded list of parameters of a batch array job, or the s3:// url "
+        + "of one, overrides --parameters and --parameter",
+    )
+    parser.add_argument(
+        "-a",
+        "--aggregate",
+        action="store_true",
+        help="merge the results of the execution in EXECUTION_NAME",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="worker processes, defaults to the vCPUs of the container",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="file the results are written to as json lines, - for stdout",
+    )
     args = parser.parse_args()
-    parameter = str(args.parameter)
 
-    print(f"Entrypoint running with parameter {parameter}")
+    if args.aggregate:
+        payload_bucket = os.environ.get("PAYLOAD_BUCKET")
+        if not payload_bucket:
+            parser.error("--aggregate requires PAYLOAD_BUCKET")
+        key = payloads.aggregate_results(payload_bucket, os.environ["EXECUTION_NAME"])
+        print(f"Results aggregated in s3://{payload_bucket}/{key}")
+        sys.exit(0)
+
+    if args.manifest:
+        parameters = resolve_manifest(
+            args.manifest, os.environ.get("AWS_BATCH_JOB_ARRAY_INDEX")
+        )
+    elif args.parameters:
+        parameters = decode_parameters(args.parameters)
+    elif args.parameters_file:
+        parameters = read_parameters_file(args.parameters_file)
+    elif args.parameter:
+        parameters = [str(parameter) for parameter in args.parameter]
+    else:
+        parser.error(
+            "one of --parameter, --parameters, --parameters-file or --manifest is "
+            + "required"
+        )
+
+    job_id = os.environ.get("AWS_BATCH_JOB_ID", "local")
+    # on SIGTERM the progress is saved for the next attempt of the job
+    checkpoint.install_signal_handler()
+    # from the start of the interpreter, imports included, to the first parameter
+    setup_seconds = metrics.process_uptime()
+    if setup_seconds is not None:
+        metrics.record("SetupTime", round(setup_seconds * 1000, 3))
+    with callback.TaskCallback(os.environ.get("TASK_TOKEN")) as task_callback:
+        records = run_job(parameters, args.workers or available_vcpus(), job_id)
+        if args.output:
+            write_records(records, args.output)
+        task_callback.output = {"JobId": job_id, "Status": "SUCCEEDED"}
+        # a failure is reported to the step function too
+        code = exit_code(records)
+        if code:
+            print(f"{sum(r['status'] == 'failed' for r in records)} parameters failed")
+            sys.exit(code)
 
     sys.exit(0)
 
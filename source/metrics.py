@@ -0,0 +1,210 @@
+import atexit
+import contextlib
+import json
+import multiprocessing.util
+import os
+import sys
+import time
+
+# CloudWatch limits of an embedded metric format document
+MAX_METRICS = 100
+MAX_VALUES = 100
+
+
+class Metrics:
+
+    """
+    Timers and counters buffered in memory and written at flush as CloudWatch
+    embedded metric format json lines, which CloudWatch Logs turns into metrics. No
+    call to CloudWatch is made. Without namespace nothing is written
+    """
+
+    def __init__(
+        self, namespace=None, dimensions=None, properties=None, stream=None, clock=None
+    ):
+
+        self.namespace = namespace
+        self.dimensions = dimensions or {}
+        self.properties = properties or {}
+        self.stream = stream
+        self.clock = clock or time.time
+        self._values = {}
+        self._units = {}
+
+    def record(self, name, value, unit="Milliseconds"):
+
+        """
+        Adds a value to the metric name
+        """
+
+        self._values.setdefault(name, []).append(value)
+        self._units[name] = unit
+
+    def count(self, name, value=1):
+
+        """
+        Adds value to the counter name
+        """
+
+        self.record(name, value, unit="Count")
+
+    @contextlib.contextmanager
+    def timer(self, name):
+
+        """
+        Records the milliseconds spent in the block under the metric name, even
+        when it raises
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, round((time.perf_counter() - start) * 1000, 3))
+
+    def documents(self):
+
+        """
+        Embedded metric format documents of the buffered values, as few as the
+        limits on metrics and values per document allow
+        """
+
+        values = {name: list(metric) for name, metric in self._values.items()}
+        documents = []
+        while values:
+            names = list(values)[:MAX_METRICS]
+            document = {
+                "_aws": {
+                    "Timestamp": int(self.clock() * 1000),
+                    "CloudWatchMetrics": [
+                        {
+                            "Namespace": self.namespace,
+                            "Dimensions": [list(self.dimensions)],
+                            "Metrics": [
+                                {"Name": name, "Unit": self._units[name]}
+                                for name in names
+                            ],
+                        }
+                    ],
+                },
+                **self.dimensions,
+                **self.properties,
+            }
+            for name in names:
+                document[name] = values[name][:MAX_VALUES]
+                values[name] = values[name][MAX_VALUES:]
+                if not values[name]:
+                    del values[name]
+            documents.append(document)
+        return documents
+
+    def flush(self):
+
+        """
+        Writes the buffered values, one json line per document, and clears them
+        """
+
+        if self.namespace:
+            stream = self.stream or sys.stdout
+            for document in self.documents():
+                stream.write(json.dumps(document) + "\n")
+            stream.flush()
+        self.reset()
+
+    def reset(self):
+
+        """
+        Drops the buffered values
+        """
+
+        self._values = {}
+        self._units = {}
+
+
+def process_uptime():
+
+    """
+    Seconds since the start of this process, from the start time of /proc/self/stat
+    in clock ticks since boot. None when not available, eg outside of linux
+    """
+
+    try:
+        with open("/proc/self/stat") as stream:
+            # the command name in parentheses can contain spaces
+            start_ticks = int(stream.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as stream:
+            uptime = float(stream.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+    return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+
+
+def from_environment():
+
+    """
+    Metrics in METRICS_NAMESPACE with the branch and step of the job as dimensions.
+    The job id is only a property of the log lines, a series per job would be
+    costly and of no use on a dashboard
+    """
+
+    return Metrics(
+        namespace=os.environ.get("METRICS_NAMESPACE"),
+        dimensions={
+            "Branch": os.environ.get("BRANCH_NAME", "local"),
+            "Step": os.environ.get("STEP_NAME", "local"),
+        },
+        properties={"JobId": os.environ.get("AWS_BATCH_JOB_ID", "local")},
+    )
+
+
+# metrics of this process, written once at exit
+_metrics = from_environment()
+atexit.register(_metrics.flush)
+
+
+def record(name, value, unit="Milliseconds"):
+
+    """
+    Adds a value to the metric name of this process
+    """
+
+    _metrics.record(name, value, unit)
+
+
+def count(name, value=1):
+
+    """
+    Adds value to the counter name of this process
+    """
+
+    _metrics.count(name, value)
+
+
+def timer(name):
+
+    """
+    Times a block under the metric name of this process
+    """
+
+    return _metrics.timer(name)
+
+
+def flush():
+
+    """
+    Writes the metrics of this process
+    """
+
+    _metrics.flush()
+
+
+def init_worker():
+
+    """
+    Worker processes don't run the atexit functions, their metrics are written by a
+    multiprocessing finalizer instead. The values inherited from the parent process
+    are dropped, the parent writes them
+    """
+
+    _metrics.reset()
+    multiprocessing.util.Finalize(None, _metrics.flush, exitpriority=10)
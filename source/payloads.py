@@ -0,0 +1,118 @@
+import codecs
+import json
+import tempfile
+from urllib.parse import urlparse
+
+import clients
+
+READ_CHUNK_BYTES = 1024 * 1024
+SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+
+def is_reference(parameter):
+
+    """
+    Whether the parameter is a claim check, ie the url of an S3 object holding the
+    actual parameter
+    """
+
+    return parameter.startswith("s3://")
+
+
+def parse_reference(reference):
+
+    """
+    Splits an s3://bucket/key url in bucket and key
+    """
+
+    url = urlparse(reference)
+    return url.netloc, url.path.lstrip("/")
+
+
+def stream_reference(reference, s3_client=None, chunk_bytes=READ_CHUNK_BYTES):
+
+    """
+    Yields the text of the referenced S3 object chunk by chunk, without holding the
+    raw body in memory
+    """
+
+    bucket, key = parse_reference(reference)
+    s3_client = s3_client or clients.client("s3")
+    body = s3_client.get_object(Bucket=bucket, Key=key)["Body"]
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in body.iter_chunks(chunk_bytes):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
+def read_parameter(parameter, s3_client=None):
+
+    """
+    Returns the parameter itself or, for a claim check, the content of the
+    referenced S3 object
+    """
+
+    if not is_reference(parameter):
+        return parameter
+    return "".join(stream_reference(parameter, s3_client))
+
+
+def result_key(execution_name, step_name, job_id):
+
+    """
+    Key of the results of a batch job, grouped by execution and step
+    """
+
+    return f"results/{execution_name}/{step_name}/{job_id}.jsonl"
+
+
+def write_results(bucket, key, records, s3_client=None):
+
+    """
+    Stores the results of a batch job as newline delimited json
+    """
+
+    s3_client = s3_client or clients.client("s3")
+    body = "".join(json.dumps(record) + "\n" for record in records)
+    s3_client.put_object(Bucket=bucket, Key=key, Body=body.encode("utf-8"))
+
+
+def aggregated_key(execution_name):
+
+    """
+    Key of the merged results of an execution
+    """
+
+    return f"aggregated/{execution_name}.jsonl"
+
+
+def aggregate_results(bucket, execution_name, s3_client=None):
+
+    """
+    Merges the results of every job of an execution into a single newline delimited
+    json object, each record tagged with its step and job. Objects are streamed line
+    by line into a temporary file which spills to disk past SPOOL_MAX_BYTES, so the
+    memory used does not depend on the number of items. Returns the merged key
+    """
+
+    s3_client = s3_client or clients.client("s3")
+    prefix = f"results/{execution_name}/"
+    paginator = s3_client.get_paginator("list_objects_v2")
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as merged:
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for item in page.get("Contents", []):
+                step_name, job_file = item["Key"][len(prefix) :].split("/", 1)
+                job_id = job_file[: -len(".jsonl")]
+                body = s3_client.get_object(Bucket=bucket, Key=item["Key"])["Body"]
+                for line in body.iter_lines():
+                    if not line:
+                        continue
+                    record = {"step": step_name, "job_id": job_id, **json.loads(line)}
+                    merged.write((json.dumps(record) + "\n").encode("utf-8"))
+
+        merged.seek(0)
+        key = aggregated_key(execution_name)
+        s3_client.upload_fileobj(merged, bucket, key)
+
+    return key
@@ -0,0 +1,178 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import clients
+import payloads
+
+# size of the range GETs and of the parts of the multipart uploads
+PART_BYTES = 16 * 1024 * 1024
+# S3 takes parts of 5 MiB at least, the last one excepted, and 10,000 parts at most
+MIN_PART_BYTES = 5 * 1024 * 1024
+MAX_PARTS = 10000
+# range GETs, or parts uploads, in flight at the same time
+CONCURRENCY = 8
+
+
+def scratch_directory():
+
+    """
+    Directory of the staged files, SCRATCH_DIR when the job definition mounts the
+    scratch storage of the host, otherwise the temporary directory
+    """
+
+    return os.environ.get("SCRATCH_DIR") or tempfile.gettempdir()
+
+
+def part_ranges(size, part_bytes):
+
+    """
+    First and last byte of each part of an object of size bytes
+    """
+
+    return [
+        (start, min(start + part_bytes, size) - 1) for start in range(0, size, part_bytes)
+    ]
+
+
+def download_part(s3_client, bucket, key, etag, descriptor, first, last):
+
+    """
+    Writes the bytes first to last of the object at their offset in the file,
+    chunk by chunk. The etag fails the part if the object changed in the meantime
+    """
+
+    body = s3_client.get_object(
+        Bucket=bucket, Key=key, Range=f"bytes={first}-{last}", IfMatch=etag
+    )["Body"]
+    offset = first
+    for chunk in body.iter_chunks(payloads.READ_CHUNK_BYTES):
+        os.pwrite(descriptor, chunk, offset)
+        offset += len(chunk)
+    if offset != last + 1:
+        raise Exception(f"Range {first}-{last} of s3://{bucket}/{key} is incomplete")
+
+
+def download(
+    reference, path, s3_client=None, part_bytes=PART_BYTES, concurrency=CONCURRENCY
+):
+
+    """
+    Downloads the object of an s3:// url to path with concurrent range GETs and
+    returns its size. Each part is streamed to its offset in the file, so the memory
+    used is about concurrency read chunks whatever the size of the object
+    """
+
+    bucket, key = payloads.parse_reference(reference)
+    s3_client = s3_client or clients.client("s3")
+    head = s3_client.head_object(Bucket=bucket, Key=key)
+    size = head["ContentLength"]
+    ranges = part_ranges(size, part_bytes)
+
+    descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(descriptor, size)
+        workers = max(1, min(concurrency, len(ranges)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(
+                    download_part,
+                    s3_client,
+                    bucket,
+                    key,
+                    head["ETag"],
+                    descriptor,
+                    first,
+                    last,
+                )
+                for first, last in ranges
+            ]
+            for future in futures:
+                future.result()
+    finally:
+        os.close(descriptor)
+
+    return size
+
+
+def upload_part(s3_client, bucket, key, upload_id, descriptor, number, first, last):
+
+    """
+    Uploads the bytes first to last of the file as the part number of a multipart
+    upload, returns the part as expected by complete_multipart_upload
+    """
+
+    body = os.pread(descriptor, last - first + 1, first)
+    response = s3_client.upload_part(
+        Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=body
+    )
+    return {"PartNumber": number, "ETag": response["ETag"]}
+
+
+def upload(
+    path, reference, s3_client=None, part_bytes=PART_BYTES, concurrency=CONCURRENCY
+):
+
+    """
+    Uploads the file at path to an s3:// url and returns its size. Files larger than
+    a part go through a multipart upload of concurrent parts, each read from the file
+    by the thread uploading it, so at most concurrency parts are in memory. A failed
+    multipart upload is aborted, no part is left behind
+    """
+
+    bucket, key = payloads.parse_reference(reference)
+    s3_client = s3_client or clients.client("s3")
+    size = os.path.getsize(path)
+    part_bytes = max(part_bytes, MIN_PART_BYTES, -(-size // MAX_PARTS))
+
+    if size <= part_bytes:
+        with open(path, "rb") as stream:
+            s3_client.put_object(Bucket=bucket, Key=key, Body=stream)
+        return size
+
+    upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [
+                pool.submit(
+                    upload_part,
+                    s3_client,
+                    bucket,
+                    key,
+                    upload_id,
+                    descriptor,
+                    number,
+                    first,
+                    last,
+                )
+                for number, (first, last) in enumerate(part_ranges(size, part_bytes), 1)
+            ]
+            parts = [future.result() for future in futures]
+        s3_client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+    except Exception:
+        s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+    finally:
+        os.close(descriptor)
+
+    return size
+
+
+def stage_in(reference, directory=None, **kwargs):
+
+    """
+    Downloads the object of an s3:// url under directory, by default the scratch
+    directory, at the path of its key and returns the local path
+    """
+
+    _, key = payloads.parse_reference(reference)
+    path = os.path.join(directory or scratch_directory(), key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    download(reference, path, **kwargs)
+    return path
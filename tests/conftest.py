@@ -0,0 +1,97 @@
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+# the stack lives in aws/cdk_deployment, the template reader in utilities/run_local.py
+ROOT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT_DIRECTORY, "aws"))
+sys.path.insert(0, os.path.join(ROOT_DIRECTORY, "utilities"))
+os.environ.setdefault("JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION", "1")
+# the utilities create their clients at import, the tests only call them within a
+# moto mock
+os.environ.update(
+    AWS_ACCESS_KEY_ID="testing",
+    AWS_SECRET_ACCESS_KEY="testing",
+    AWS_SESSION_TOKEN="testing",
+    AWS_DEFAULT_REGION="eu-west-1",
+)
+
+import boto3  # noqa: E402
+from aws_cdk import core  # noqa: E402
+from moto import mock_aws  # noqa: E402
+from cdk_deployment.main_stack import MainStack  # noqa: E402
+from run_local import load_state_machines  # noqa: E402
+
+ACCOUNT = "123456789012"
+REGION = "eu-west-1"
+# a given vpc, the synth doesn't look the default one up and needs no credentials
+OFFLINE_VPC = {
+    "vpc_id": "vpc-12345678",
+    "vpc_availability_zones": ["eu-west-1a"],
+    "vpc_public_subnet_ids": ["subnet-12345678"],
+}
+
+
+def synth_stack(**kwargs):
+
+    """
+    CloudFormation template of a MainStack with kwargs and the definitions of its
+    state machines by logical id, with their type. Arns are replaced by the logical
+    ids of their resources
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = core.App(outdir=directory)
+        MainStack(
+            app,
+            "csfe-test",
+            env=core.Environment(account=ACCOUNT, region=REGION),
+            ecr_repository_name="csfe-test",
+            branch_name="test",
+            account=ACCOUNT,
+            region=REGION,
+            **{**OFFLINE_VPC, **kwargs},
+        )
+        path = app.synth().get_stack_by_name("csfe-test").template_full_path
+        with open(path) as stream:
+            template = json.load(stream)
+        return template, load_state_machines(path)
+
+
+@pytest.fixture
+def synth():
+
+    """
+    Synthesizes a MainStack of the test account and region without credentials, see
+    synth_stack
+    """
+
+    return synth_stack
+
+
+@pytest.fixture
+def bucket():
+
+    """
+    Name of the S3 bucket created by the s3_client fixture
+    """
+
+    return "csfe-test-bucket"
+
+
+@pytest.fixture
+def s3_client(bucket):
+
+    """
+    S3 client of a moto mock holding the empty bucket
+    """
+
+    with mock_aws():
+        s3_client = boto3.client("s3", REGION)
+        s3_client.create_bucket(
+            Bucket=bucket, CreateBucketConfiguration={"LocationConstraint": REGION}
+        )
+        yield s3_client
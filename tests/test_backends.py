@@ -0,0 +1,139 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+# the entrypoints of the container and of the lambda backend live in source/main.py,
+# the local runner of the step function in utilities/run_local.py
+ROOT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SOURCE_DIRECTORY = os.path.join(ROOT_DIRECTORY, "source")
+sys.path.insert(0, os.path.join(ROOT_DIRECTORY, "utilities"))
+sys.path.insert(0, SOURCE_DIRECTORY)
+
+import main  # noqa: E402
+from run_local import LocalExecution  # noqa: E402
+
+BACKENDS = ("batch", "lambda", "express")
+PARAMETERS = ["step2a", "step2b", "step2c"]
+EXECUTION_INPUT = {
+    "parameters": {
+        "step1_parameter": "step1",
+        "step2_parameters": PARAMETERS,
+        "step3_parameters": ["step3a", "step3b"],
+    }
+}
+
+
+def container_results(environment, workers=2):
+
+    """
+    Exit code and results of source/main.py run with the arguments of the CMD of the
+    image, the variables of environment set like a batch job would get them
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "records.jsonl")
+        completed = subprocess.run(
+            [
+                sys.executable,
+                "main.py",
+                "-p",
+                environment.get("PARAMETER", "parameter"),
+                "-ps",
+                environment.get("PARAMETERS", ""),
+                "-w",
+                str(workers),
+                "-o",
+                output,
+            ],
+            cwd=SOURCE_DIRECTORY,
+            env={**os.environ, **environment},
+            stdout=subprocess.DEVNULL,
+        )
+        with open(output) as stream:
+            records = [json.loads(line) for line in stream if line.strip()]
+    return completed.returncode, records
+
+
+def function_results(environment):
+
+    """
+    Exit code the job would have and results of the lambda backend on the event a
+    lambda task of the step function would send with environment
+    """
+
+    records = main.run_event({"environment": environment}, str(uuid.uuid4()))
+    return main.exit_code(records), records
+
+
+@pytest.mark.parametrize(
+    "environment",
+    [{"PARAMETER": parameter} for parameter in PARAMETERS]
+    + [{"PARAMETERS": json.dumps(PARAMETERS)}],
+    ids=PARAMETERS + ["chunk"],
+)
+def test_container_and_function_give_the_same_results(environment):
+    environment = {**environment, "STEP_NAME": "step2"}
+
+    assert container_results(environment) == function_results(environment)
+
+
+def execution_records(synth, **kwargs):
+
+    """
+    Results of the parameters of an execution of the step function of a MainStack
+    with kwargs, run on this machine, in a stable order
+    """
+
+    _, state_machines = synth(**kwargs)
+    (definition,) = [
+        definition for kind, definition in state_machines.values() if kind == "STANDARD"
+    ]
+    execution = LocalExecution(
+        definition,
+        workers=4,
+        express_definitions={
+            logical_id: definition
+            for logical_id, (kind, definition) in state_machines.items()
+            if kind == "EXPRESS"
+        },
+    )
+    execution.run(EXECUTION_INPUT, "test-execution")
+    return sorted(execution.records, key=json.dumps)
+
+
+@pytest.mark.parametrize("items_per_job", [1, 2])
+def test_backends_give_the_same_results(synth, items_per_job):
+    results = {
+        backend: execution_records(
+            synth,
+            step2_backend=backend,
+            step3_backend=backend,
+            step2_items_per_job=items_per_job,
+            step3_items_per_job=items_per_job,
+        )
+        for backend in BACKENDS
+    }
+
+    # step 1 always runs in batch
+    assert len(results["batch"]) == 6
+    assert {record["status"] for record in results["batch"]} == {"succeeded"}
+    assert results["lambda"] == results["batch"]
+    assert results["express"] == results["batch"]
+
+
+def test_pipeline_spec_runs_like_the_steps(synth):
+    # the default steps as the stages of a spec, with other backends and chunks
+    spec = {
+        "stages": [
+            {"name": "step1", "fan_out_mode": "single"},
+            {"name": "step2", "backend": "lambda", "items_per_job": 2},
+            {"name": "step3", "backend": "express"},
+        ]
+    }
+
+    assert execution_records(synth, pipeline=spec) == execution_records(synth)
@@ -0,0 +1,68 @@
+import os
+import sys
+
+import pytest
+
+# the result cache lives in source/cache.py, the evaluation of the intrinsic
+# functions of the step function in utilities/run_local.py
+ROOT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT_DIRECTORY, "utilities"))
+sys.path.insert(0, os.path.join(ROOT_DIRECTORY, "source"))
+
+import cache  # noqa: E402
+from run_local import evaluate  # noqa: E402
+
+IMAGE_DIGEST = "sha256:" + "ab" * 32
+# sha-256 of step2|step2a|<IMAGE_DIGEST>
+STEP2A_KEY = "7d6d23d6c5a8493a0be720ba3c63b4f0fbd25dfc818e5a1133dd0fe33f192f5c"
+NOW = 1_800_000_000
+
+
+class RecordedDynamoDB:
+
+    """
+    Stand-in of the dynamodb client answering get_item from a dict of items by
+    cache key
+    """
+
+    def __init__(self, items):
+
+        self.items = items
+
+    def get_item(self, TableName, Key):
+
+        item = self.items.get(Key["cache_key"]["S"])
+        return {"Item": item} if item else {}
+
+
+def test_cache_key_is_the_key_of_the_step_function(synth):
+    _, state_machines = synth(cache_results=True, image_digest=IMAGE_DIGEST)
+    ((_, definition),) = state_machines.values()
+    iterator = definition["States"]["csfeStep2Map"]["Iterator"]
+    expression = iterator["States"]["csfeStep2CacheKey"]["Parameters"]["key.$"]
+
+    assert cache.cache_key("step2", "step2a", IMAGE_DIGEST) == STEP2A_KEY
+    assert evaluate(expression, {"step2_parameter": "step2a"}, {}) == STEP2A_KEY
+
+
+@pytest.mark.parametrize(
+    "expires_at,found", [(NOW + 60, True), (NOW, False), (NOW - 60, False)]
+)
+def test_get_ignores_the_expired_items(expires_at, found):
+    dynamodb_client = RecordedDynamoDB(
+        {
+            STEP2A_KEY: {
+                "cache_key": {"S": STEP2A_KEY},
+                "job_id": {"S": "job"},
+                "expires_at": {"N": str(expires_at)},
+            }
+        }
+    )
+    result_cache = cache.ResultCache(
+        "csfe-cache", 3600, dynamodb_client=dynamodb_client, clock=lambda: NOW
+    )
+
+    # dynamodb deletes the expired items up to a couple of days late
+    expected = {"job_id": "job", "expires_at": expires_at} if found else None
+    assert result_cache.get(STEP2A_KEY) == expected
+    assert result_cache.get("missing") is None
@@ -0,0 +1,152 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+# the checkpoints of the container live in source/checkpoint.py
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../source")
+sys.path.insert(0, SOURCE_DIRECTORY)
+
+import checkpoint  # noqa: E402
+import main  # noqa: E402
+
+
+def test_succeeded_record_is_persisted(tmp_path):
+    store = checkpoint.LocalStore(str(tmp_path))
+    checkpoint.Checkpoint(store, "job/parameter.json").complete(
+        {"parameter": "step2a", "status": "succeeded"}
+    )
+
+    retry = checkpoint.Checkpoint(store, "job/parameter.json")
+    assert retry.record == {"parameter": "step2a", "status": "succeeded"}
+
+
+def test_failed_record_is_not_persisted(tmp_path):
+    store = checkpoint.LocalStore(str(tmp_path))
+    attempt = checkpoint.Checkpoint(store, "job/parameter.json", interval=3600)
+    attempt.save({"done": 2})
+    attempt.complete({"parameter": "step2a", "status": "failed", "error": "error"})
+
+    # the retry runs the parameter again, from the progress of the failed attempt
+    retry = checkpoint.Checkpoint(store, "job/parameter.json")
+    assert retry.record is None
+    assert retry.state == {"done": 2}
+
+
+def test_failed_parameter_runs_again(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHECKPOINT_DIR", str(tmp_path))
+    monkeypatch.setenv("AWS_BATCH_JOB_ID", "job")
+    attempts = []
+
+    def flaky(parameter):
+        attempts.append(parameter)
+        if len(attempts) == 1:
+            raise Exception("spot interruption")
+        return {"status": "succeeded"}
+
+    assert main.run_isolated("step2a", flaky)["status"] == "failed"
+    assert main.run_isolated("step2a", flaky)["status"] == "succeeded"
+    assert main.run_isolated("step2a", flaky)["status"] == "succeeded"
+    # the third attempt returns the result of the second one
+    assert attempts == ["step2a", "step2a"]
+
+
+# main.py with a slow read of the parameters, which saves some progress first
+SLOW_MAIN = """
+import os
+import time
+
+import checkpoint
+import main
+import payloads
+
+
+def slow_read(parameter):
+    checkpoint.current().save({"started": parameter})
+    with open(os.environ["READS_FILE"], "a") as stream:
+        stream.write(parameter + "\\n")
+    time.sleep(0.5)
+    return parameter
+
+
+payloads.read_parameter = slow_read
+main.main()
+"""
+
+
+def run_slow_main(parameters, workers, environment, output=None):
+
+    """
+    Starts source/main.py on parameters with the slow read of SLOW_MAIN
+    """
+
+    arguments = ["-p", *parameters, "-w", str(workers)]
+    if output:
+        arguments += ["-o", output]
+    return subprocess.Popen(
+        [sys.executable, "-c", SLOW_MAIN, *arguments],
+        cwd=SOURCE_DIRECTORY,
+        env={**os.environ, **environment},
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def read_lines(path):
+
+    with open(path) as stream:
+        return stream.read().splitlines()
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_sigterm_saves_the_progress_for_the_retry(tmp_path, workers):
+    parameters = [f"step2{letter}" for letter in "abcdefgh"]
+    store = checkpoint.LocalStore(str(tmp_path / "checkpoints"))
+    environment = {
+        "CHECKPOINT_DIR": store.directory,
+        "AWS_BATCH_JOB_ID": "job",
+        "READS_FILE": str(tmp_path / "reads.txt"),
+    }
+
+    def records():
+        loaded = {
+            parameter: store.load(checkpoint.checkpoint_key("job", parameter))
+            for parameter in parameters
+        }
+        return {
+            parameter: data["record"]
+            for parameter, data in loaded.items()
+            if data and data.get("record")
+        }
+
+    attempt = run_slow_main(parameters, workers, environment)
+    deadline = time.monotonic() + 60
+    while len(records()) < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    attempt.send_signal(signal.SIGTERM)
+    assert attempt.wait(timeout=30) == checkpoint.EXIT_INTERRUPTED
+
+    finished = records()
+    assert 2 <= len(finished) < len(parameters)
+    assert all(record["status"] == "succeeded" for record in finished.values())
+    interrupted = set(read_lines(environment["READS_FILE"])) - set(finished)
+    # the progress of the parameters running at the SIGTERM is flushed too
+    for parameter in interrupted:
+        saved = store.load(checkpoint.checkpoint_key("job", parameter))
+        assert saved == {"state": {"started": parameter}}
+
+    os.remove(environment["READS_FILE"])
+    output = str(tmp_path / "records.jsonl")
+    retry = run_slow_main(parameters, workers, environment, output)
+    assert retry.wait(timeout=60) == 0
+
+    # the retry only runs the parameters the first attempt didn't finish
+    assert sorted(read_lines(environment["READS_FILE"])) == sorted(
+        set(parameters) - set(finished)
+    )
+    results = [json.loads(line) for line in read_lines(output)]
+    assert [record["parameter"] for record in results] == parameters
+    assert all(record["status"] == "succeeded" for record in results)
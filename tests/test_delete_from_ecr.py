@@ -0,0 +1,104 @@
+import os
+import sys
+from datetime import datetime, timezone
+
+# the clean up lives in utilities/delete_from_ecr.py
+UTILITIES_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "../utilities"
+)
+sys.path.insert(0, UTILITIES_DIRECTORY)
+
+from delete_from_ecr import branch_image_ids, select_images  # noqa: E402
+
+PUSHED_AT = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class ImageNotFoundException(Exception):
+    pass
+
+
+class RecordedEcr:
+
+    """
+    Stand-in of the ecr client answering describe_images from a list of image
+    details, two per page
+    """
+
+    class exceptions:
+        ImageNotFoundException = ImageNotFoundException
+
+    def __init__(self, images):
+
+        self.images = [
+            {"imageDigest": f"sha256:{digest}", "imagePushedAt": PUSHED_AT, **image}
+            for digest, image in images.items()
+        ]
+
+    def get_paginator(self, operation):
+
+        return self
+
+    def paginate(self, repositoryName):
+
+        for start in range(0, len(self.images), 2):
+            yield {"imageDetails": self.images[start : start + 2]}
+
+    def describe_images(self, repositoryName, imageIds):
+
+        (image_id,) = imageIds
+        images = [
+            image
+            for image in self.images
+            if image_id["imageTag"] in image.get("imageTags", [])
+        ]
+        if not images:
+            raise ImageNotFoundException(image_id["imageTag"])
+        return {"imageDetails": images}
+
+
+ECR = RecordedEcr(
+    {
+        "feature": {"imageTags": ["feature-a", "ctx-1"]},
+        "shared": {"imageTags": ["feature-b", "main", "ctx-2"]},
+        "moved": {"imageTags": ["ctx-3"]},
+        "untagged": {},
+        "cache": {"imageTags": ["buildcache"]},
+    }
+)
+
+
+def test_stale_branch_images_are_selected_by_digest():
+    # the ctx- tag of feature-a goes with its image, main keeps the shared image
+    assert select_images("csfe", tag_pattern="feature-*", ecr_client=ECR) == [
+        {"imageDigest": "sha256:feature"},
+        {"imageTag": "feature-b"},
+    ]
+    assert select_images("csfe", tag_pattern="ctx-*", ecr_client=ECR) == []
+
+
+def test_not_deployed_branches_skip_the_context_tags():
+    assert select_images("csfe", keep_tags={"main"}, ecr_client=ECR) == [
+        {"imageDigest": "sha256:feature"},
+        {"imageTag": "feature-b"},
+    ]
+    assert select_images("csfe", keep_tags=set(), ecr_client=ECR) == [
+        {"imageDigest": "sha256:feature"},
+        {"imageDigest": "sha256:shared"},
+    ]
+
+
+def test_untagged_and_orphaned_images():
+    assert select_images("csfe", untagged=True, ecr_client=ECR) == [
+        {"imageDigest": "sha256:untagged"}
+    ]
+    assert select_images("csfe", orphaned=True, ecr_client=ECR) == [
+        {"imageDigest": "sha256:moved"}
+    ]
+
+
+def test_branch_image():
+    assert branch_image_ids("csfe", "feature-a", ECR) == [
+        {"imageDigest": "sha256:feature"}
+    ]
+    assert branch_image_ids("csfe", "feature-b", ECR) == [{"imageTag": "feature-b"}]
+    assert branch_image_ids("csfe", "gone", ECR) == []
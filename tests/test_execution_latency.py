@@ -0,0 +1,128 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# the utility lives in utilities/execution_latency.py, the histories and jobs it
+# recorded with --record in tests/fixtures/execution_latency
+ROOT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+UTILITIES_DIRECTORY = os.path.join(ROOT_DIRECTORY, "utilities")
+FIXTURES_DIRECTORY = os.path.join(
+    ROOT_DIRECTORY, "tests", "fixtures", "execution_latency"
+)
+sys.path.insert(0, UTILITIES_DIRECTORY)
+
+import execution_latency  # noqa: E402
+
+
+def recorded(name):
+
+    """
+    Paths of the recorded history and jobs of the fixture name
+    """
+
+    return (
+        os.path.join(FIXTURES_DIRECTORY, name, "history.json"),
+        os.path.join(FIXTURES_DIRECTORY, name, "jobs.json"),
+    )
+
+
+def report(name):
+
+    """
+    Report of the recorded execution of the fixture name
+    """
+
+    history_file, jobs_file = recorded(name)
+    with open(history_file) as stream:
+        events = json.load(stream)
+    with open(jobs_file) as stream:
+        jobs = json.load(stream)
+    return execution_latency.report(events, jobs)
+
+
+def test_callback_tasks():
+    result = report("callback")
+
+    assert result["execution"] == 561
+    # the job ids come from the output of submitJob.waitForTaskToken
+    assert [(step["state"], step["job_id"]) for step in result["critical_path"]] == [
+        ("csfeStep1Task", "step1-job"),
+        ("csfeStep2Task", "step2-b"),
+        ("csfeStep3Task", "step3-a"),
+    ]
+    step1 = result["critical_path"][0]
+    assert step1["gap"] is None
+    assert (step1["orchestration"], step1["queue_wait"], step1["run"]) == (1, 330, 68)
+    # the container sends the task success a second after its job stopped
+    assert [step["completion"] for step in result["critical_path"]] == [1, 1, 1]
+    assert result["critical_path_totals"] == {
+        "gap": 2,
+        "orchestration": 3,
+        "queue_wait": 366,
+        "run": 186,
+        "completion": 3,
+    }
+
+    step2 = result["stages"]["csfeStep2Task"]
+    assert (step2["items"], step2["span"]) == (2, 99)
+    assert step2["total"]["p50"] == 50 and step2["total"]["max"] == 99
+    assert step2["straggler"] == pytest.approx(99 / 50)
+
+
+def test_array_tasks_with_offloaded_payloads():
+    result = report("payload")
+
+    assert result["execution"] == 340
+    # the manifest uploads and the pointer to the collected results run no job
+    assert list(result["stages"]) == [
+        "csfeStep1Task",
+        "csfeStep2ArrayTask",
+        "csfeStep3ArrayTask",
+        "csfeCollectTask",
+    ]
+    assert [(step["state"], step["gap"]) for step in result["critical_path"]] == [
+        ("csfeStep1Task", None),
+        # the upload of the manifest before the array task is step function time
+        ("csfeStep2ArrayTask", 1),
+        ("csfeStep3ArrayTask", 1),
+        ("csfeCollectTask", 0),
+    ]
+
+    step2 = result["stages"]["csfeStep2ArrayTask"]
+    assert step2["items"] == 3
+    assert step2["queue_wait"]["p50"] == 13 and step2["queue_wait"]["max"] == 18
+    assert step2["run"]["max"] == 85
+    # the children of an array job share the completion of their task
+    assert step2["completion"]["max"] is None
+    assert result["critical_path"][1]["job_id"] == "step2-array:2"
+    assert result["critical_path"][1]["total"] == 104
+
+
+@pytest.mark.parametrize("name", ["callback", "payload"])
+def test_report_of_recorded_files(name, tmp_path):
+    history_file, jobs_file = recorded(name)
+    output = tmp_path / "report.json"
+    completed = subprocess.run(
+        [
+            sys.executable,
+            "execution_latency.py",
+            "--history-file",
+            history_file,
+            "--jobs-file",
+            jobs_file,
+            "--output",
+            str(output),
+        ],
+        cwd=UTILITIES_DIRECTORY,
+        env={**os.environ, "AWS_DEFAULT_REGION": "eu-west-1"},
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+    assert completed.returncode == 0
+    assert completed.stdout.startswith(f"Execution: {report(name)['execution']:.1f}s")
+    with open(output) as stream:
+        assert json.load(stream) == json.loads(json.dumps(report(name)))
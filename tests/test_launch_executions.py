@@ -0,0 +1,240 @@
+import json
+import os
+import sys
+
+import pytest
+from botocore.exceptions import ClientError
+
+# the launcher lives in utilities/launch_executions.py
+UTILITIES_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "../utilities"
+)
+sys.path.insert(0, UTILITIES_DIRECTORY)
+
+import launch_executions  # noqa: E402
+from launch_executions import normalize_stages, validate_input  # noqa: E402
+
+SIZED_ITEM = {"parameter": "step2a", "size": 42}
+STATE_MACHINE_ARN = "arn:aws:states:eu-west-1:123456789012:stateMachine:csfe-test"
+
+
+class FakeClock:
+
+    """
+    Clock of a token bucket which only moves forward when slept on, records the
+    sleeps
+    """
+
+    def __init__(self):
+
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+
+        return self.now
+
+    def sleep(self, seconds):
+
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class RecordedSfn:
+
+    """
+    Stand-in of the step functions client, start_execution raises the given error
+    codes first then records the names of the executions it starts
+    """
+
+    def __init__(self, error_codes=()):
+
+        self.error_codes = list(error_codes)
+        self.names = []
+
+    def start_execution(self, stateMachineArn, name, input):
+
+        if self.error_codes:
+            error = {"Error": {"Code": self.error_codes.pop(0), "Message": "error"}}
+            raise ClientError(error, "StartExecution")
+        self.names.append(name)
+        return {"executionArn": f"{stateMachineArn}:{name}"}
+
+
+def token_bucket(rate, burst):
+
+    """
+    Token bucket on a FakeClock, the clock is its clock attribute
+    """
+
+    clock = FakeClock()
+    bucket = launch_executions.TokenBucket(rate, burst, clock=clock, sleep=clock.sleep)
+    bucket.clock = clock
+    return bucket
+
+
+def steps_input(step2_parameters, step3_parameters=("step3a",)):
+
+    """
+    Execution input of step 1, 2 and 3
+    """
+
+    return {
+        "parameters": {
+            "step1_parameter": "step1",
+            "step2_parameters": list(step2_parameters),
+            "step3_parameters": list(step3_parameters),
+        }
+    }
+
+
+def test_plain_items():
+    assert validate_input(steps_input(["step2a", "s3://bucket/step2b"])) == []
+    assert validate_input({"parameters": {"step1_parameter": "step1"}}) == [
+        "step2_parameters must be a list",
+        "step3_parameters must be a list",
+    ]
+
+
+def test_sized_items_require_tiers():
+    execution_input = steps_input(["step2a", SIZED_ITEM])
+
+    assert validate_input(execution_input) == [
+        "step2_parameters must only contain strings"
+    ]
+    assert validate_input(execution_input, tiers=True) == []
+    assert validate_input(
+        steps_input([{"parameter": "step2a", "size": True}]), tiers=True
+    ) == [
+        "step2_parameters must only contain strings or objects with a string "
+        + "parameter and a numeric size"
+    ]
+
+
+def test_distributed_steps_have_a_manifest():
+    execution_input = steps_input([])
+    del execution_input["parameters"]["step2_parameters"]
+    execution_input["parameters"]["step2_manifest"] = "manifests/step2.json"
+
+    assert validate_input(execution_input) == []
+    assert validate_input(execution_input, topology="pipelined") == [
+        "the pipelined topology reads no manifest"
+    ]
+
+
+def test_pipeline_spec_keys():
+    stages = normalize_stages(
+        [
+            {"name": "prepare", "fan_out_mode": "single"},
+            {"name": "train"},
+            {"name": "score", "fan_out_mode": "array", "parameters": "models"},
+            {"name": "report", "fan_out_mode": "distributed"},
+        ]
+    )
+    execution_input = {
+        "parameters": {
+            "prepare_parameter": "prepare",
+            "train_parameters": ["train1", "train2"],
+            "models": ["model1"],
+            "report_manifest": "manifests/report.jsonl",
+        }
+    }
+
+    assert validate_input(execution_input, stages=stages) == []
+    # step 1, 2 and 3 are replaced by the stages
+    assert validate_input(steps_input(["step2a"]), stages=stages) == [
+        "prepare_parameter must be a string",
+        "train_parameters must be a list",
+        "models must be a list",
+        "report_manifest must be the key of a manifest",
+    ]
+    # items with a size are routed to the tiers by the map stages
+    execution_input["parameters"]["train_parameters"].append(SIZED_ITEM)
+    assert validate_input(execution_input, tiers=True, stages=stages) == []
+    assert validate_input(execution_input, stages=stages) == [
+        "train_parameters must only contain strings"
+    ]
+
+
+def test_token_bucket_limits_the_rate():
+    # a rate whose interval is exact in binary, the fake clock only moves by sleeps
+    bucket = token_bucket(rate=8, burst=4)
+
+    for _ in range(20):
+        bucket.acquire()
+
+    # the burst is free, the next calls come every 1 / rate seconds
+    assert bucket.clock.sleeps == [0.125] * 16
+    assert bucket.clock.now == 2.0
+
+
+def test_throttled_calls_back_off_and_slow_down(monkeypatch):
+    # the largest jitter
+    monkeypatch.setattr(launch_executions.random, "uniform", lambda low, high: high)
+    bucket = token_bucket(rate=10, burst=10)
+    sfn_client = RecordedSfn(["ThrottlingException", "TooManyRequestsException"])
+
+    arn = launch_executions.start_execution(
+        STATE_MACHINE_ARN, "name", {}, bucket, sfn_client
+    )
+
+    assert arn == f"{STATE_MACHINE_ARN}:name"
+    assert bucket.clock.sleeps == [pytest.approx(0.1), pytest.approx(0.2)]
+    # halved twice, then grown back by a step of the target rate
+    assert bucket.rate == pytest.approx(10 * 0.25 + 10 * launch_executions.RECOVERY_STEP)
+    for _ in range(100):
+        bucket.speed_up()
+    assert bucket.rate == 10
+
+
+def test_start_execution_gives_up_on_throttling(monkeypatch):
+    monkeypatch.setattr(launch_executions.random, "uniform", lambda low, high: high)
+    bucket = token_bucket(rate=10, burst=10)
+    sfn_client = RecordedSfn(["ThrottlingException"] * launch_executions.MAX_ATTEMPTS)
+
+    with pytest.raises(Exception, match="throttled"):
+        launch_executions.start_execution(
+            STATE_MACHINE_ARN, "name", {}, bucket, sfn_client
+        )
+    # never below a tenth of the target
+    assert bucket.rate == pytest.approx(1)
+    assert max(bucket.clock.sleeps) <= launch_executions.MAX_BACKOFF_SECONDS
+    assert (
+        launch_executions.start_execution(
+            STATE_MACHINE_ARN, "name", {}, bucket, RecordedSfn(["ExecutionAlreadyExists"])
+        )
+        is None
+    )
+    with pytest.raises(ClientError):
+        launch_executions.start_execution(
+            STATE_MACHINE_ARN, "name", {}, bucket, RecordedSfn(["AccessDeniedException"])
+        )
+
+
+def test_launch_resumes_from_the_checkpoint(tmp_path, monkeypatch):
+    input_path = tmp_path / "inputs.jsonl"
+    inputs = [steps_input([f"step2{letter}"]) for letter in "abc"]
+    input_path.write_text("".join(json.dumps(line) + "\n" for line in inputs))
+    checkpoint_path = tmp_path / "inputs.jsonl.checkpoint"
+    first_name = launch_executions.execution_name("launch", 1, inputs[0])
+    checkpoint_path.write_text(f"1\t{STATE_MACHINE_ARN}:{first_name}\n")
+    sfn_client = RecordedSfn()
+    monkeypatch.setattr(launch_executions, "SFN_CLIENT", sfn_client)
+    arguments = ["-i", str(input_path), "-sm", STATE_MACHINE_ARN, "-r", "1000"]
+    monkeypatch.setattr(sys, "argv", ["launch_executions.py", *arguments])
+
+    with pytest.raises(SystemExit) as exit_info:
+        launch_executions.main()
+    assert exit_info.value.code == 0
+
+    # the first line was launched by the interrupted run
+    assert sorted(sfn_client.names) == [
+        launch_executions.execution_name("launch", line_number, inputs[line_number - 1])
+        for line_number in (2, 3)
+    ]
+    assert launch_executions.Checkpoint(str(checkpoint_path)).done == {1, 2, 3}
+
+    # nothing is left to launch
+    with pytest.raises(SystemExit):
+        launch_executions.main()
+    assert len(sfn_client.names) == 2
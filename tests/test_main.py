@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+# the entrypoint of the container lives in source/main.py
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../source")
+sys.path.insert(0, SOURCE_DIRECTORY)
+
+import main  # noqa: E402
+
+
+class RecordingCache:
+
+    """
+    Stand-in of cache.ResultCache which records the puts instead of writing them to
+    dynamodb
+    """
+
+    puts = []
+
+    def __init__(self, table_name, ttl_seconds):
+
+        self.table_name = table_name
+
+    def put(self, key, job_id):
+
+        RecordingCache.puts.append((self.table_name, key, job_id))
+
+
+@pytest.fixture
+def result_cache(monkeypatch):
+    RecordingCache.puts = []
+    monkeypatch.setattr(main.cache, "ResultCache", RecordingCache)
+    monkeypatch.delenv("PAYLOAD_BUCKET", raising=False)
+    monkeypatch.setenv("CACHE_TABLE", "csfe-cache")
+    monkeypatch.setenv("CACHE_KEY", "key")
+    monkeypatch.setenv("CACHE_TTL_SECONDS", "3600")
+    return RecordingCache.puts
+
+
+def test_succeeded_job_is_cached(result_cache):
+    main.store([{"status": "succeeded"}], "job")
+
+    assert result_cache == [("csfe-cache", "key", "job")]
+
+
+@pytest.mark.parametrize(
+    "statuses", [["failed"], ["succeeded", "failed"]], ids=["failure", "partial"]
+)
+def test_failed_item_is_not_cached(result_cache, statuses):
+    main.store([{"status": status} for status in statuses], "job")
+
+    assert result_cache == []
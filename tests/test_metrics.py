@@ -0,0 +1,92 @@
+import io
+import json
+import os
+import sys
+
+# the metrics of the container live in source/metrics.py
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../source")
+sys.path.insert(0, SOURCE_DIRECTORY)
+
+import metrics  # noqa: E402
+
+
+def written(job_metrics):
+
+    """
+    Documents written by a flush of job_metrics, one per json line
+    """
+
+    job_metrics.stream = io.StringIO()
+    job_metrics.flush()
+    return [json.loads(line) for line in job_metrics.stream.getvalue().splitlines()]
+
+
+def test_embedded_metric_format(monkeypatch):
+    monkeypatch.setenv("METRICS_NAMESPACE", "csfe")
+    monkeypatch.setenv("BRANCH_NAME", "test")
+    monkeypatch.setenv("STEP_NAME", "step2")
+    monkeypatch.setenv("AWS_BATCH_JOB_ID", "job")
+    job_metrics = metrics.from_environment()
+    job_metrics.clock = lambda: 1700000000.5
+    with job_metrics.timer("ComputeTime"):
+        pass
+    job_metrics.count("ParametersFailed")
+    job_metrics.count("ParametersFailed", 2)
+
+    (document,) = written(job_metrics)
+    assert document["_aws"] == {
+        "Timestamp": 1700000000500,
+        "CloudWatchMetrics": [
+            {
+                "Namespace": "csfe",
+                # the job id is a property, not a dimension
+                "Dimensions": [["Branch", "Step"]],
+                "Metrics": [
+                    {"Name": "ComputeTime", "Unit": "Milliseconds"},
+                    {"Name": "ParametersFailed", "Unit": "Count"},
+                ],
+            }
+        ],
+    }
+    assert (document["Branch"], document["Step"], document["JobId"]) == (
+        "test",
+        "step2",
+        "job",
+    )
+    (compute_time,) = document["ComputeTime"]
+    assert compute_time >= 0
+    assert document["ParametersFailed"] == [1, 2]
+    # the values are written once
+    assert written(job_metrics) == []
+
+
+def test_documents_within_the_limits():
+    job_metrics = metrics.Metrics(namespace="csfe", dimensions={"Step": "step2"})
+    for index in range(metrics.MAX_METRICS + 1):
+        job_metrics.record(f"Metric{index}", 1)
+    for _ in range(metrics.MAX_VALUES):
+        job_metrics.record("Metric0", 2, unit="Seconds")
+
+    documents = written(job_metrics)
+    assert len(documents) == 2
+    for document in documents:
+        (directive,) = document["_aws"]["CloudWatchMetrics"]
+        assert len(directive["Metrics"]) <= metrics.MAX_METRICS
+        assert all(
+            len(document[metric["Name"]]) <= metrics.MAX_VALUES
+            for metric in directive["Metrics"]
+        )
+    assert documents[0]["_aws"]["CloudWatchMetrics"][0]["Metrics"][0] == {
+        "Name": "Metric0",
+        "Unit": "Seconds",
+    }
+    assert documents[0]["Metric0"] == [1] + [2] * (metrics.MAX_VALUES - 1)
+    assert documents[1]["Metric0"] == [2]
+    assert documents[1]["Metric100"] == [1]
+
+
+def test_nothing_written_without_namespace():
+    job_metrics = metrics.Metrics(dimensions={"Step": "step2"})
+    job_metrics.count("ParametersSucceeded")
+
+    assert written(job_metrics) == []
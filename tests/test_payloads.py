@@ -0,0 +1,113 @@
+import json
+import os
+import sys
+
+import pytest
+
+# the claim checks live in source/payloads.py, the offload of an execution input in
+# utilities/offload_payload.py
+ROOT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT_DIRECTORY, "utilities"))
+sys.path.insert(0, os.path.join(ROOT_DIRECTORY, "source"))
+
+import offload_payload  # noqa: E402
+import payloads  # noqa: E402
+
+EXECUTION_INPUT = {
+    "parameters": {
+        "step1_parameter": "step1",
+        "step2_parameters": ["step2a", "step2b"],
+        "step3_parameters": ["step3a", 3],
+    }
+}
+
+
+def test_references_round_trip(s3_client, bucket):
+    key = payloads.result_key("execution", "step2", "job")
+    records = [{"parameter": "step2a", "status": "succeeded", "text": "naïve"}]
+    payloads.write_results(bucket, key, records, s3_client=s3_client)
+    reference = f"s3://{bucket}/{key}"
+
+    assert payloads.is_reference(reference) and not payloads.is_reference("step2a")
+    assert payloads.parse_reference(reference) == (
+        bucket,
+        "results/execution/step2/job.jsonl",
+    )
+    assert payloads.read_parameter("step2a", s3_client) == "step2a"
+    text = payloads.read_parameter(reference, s3_client)
+    assert [json.loads(line) for line in text.splitlines()] == records
+
+
+def test_large_object_is_streamed_in_chunks(s3_client, bucket):
+    # two bytes characters, the odd chunk size splits some of them
+    text = "é" * (3 * 1024 * 1024)
+    s3_client.put_object(Bucket=bucket, Key="large", Body=text.encode("utf-8"))
+
+    chunk_bytes = 1024 * 1024 + 1
+    chunks = list(
+        payloads.stream_reference(f"s3://{bucket}/large", s3_client, chunk_bytes)
+    )
+    # 6 MiB in 6 chunks of raw bytes, then the end of the decoder. A chunk holds at
+    # most the rest of a character split by the previous one on top of its bytes
+    assert len(chunks) == 7
+    assert max(len(chunk.encode("utf-8")) for chunk in chunks) <= chunk_bytes + 1
+    assert "".join(chunks) == text
+
+
+@pytest.mark.parametrize("output", [True, False], ids=["output", "stdout"])
+def test_offload_cli_writes_the_claim_checks(
+    s3_client, bucket, tmp_path, monkeypatch, capsys, output
+):
+    input_path = tmp_path / "input.json"
+    input_path.write_text(json.dumps(EXECUTION_INPUT))
+    output_path = tmp_path / "offloaded.json"
+    arguments = ["--input", str(input_path), "--bucket", bucket, "--name", "test"]
+    if output:
+        arguments += ["--output", str(output_path)]
+    monkeypatch.setattr(sys, "argv", ["offload_payload.py", *arguments])
+
+    with pytest.raises(SystemExit) as exit_info:
+        offload_payload.main()
+    assert exit_info.value.code == 0
+
+    printed = capsys.readouterr().out
+    offloaded = json.loads(output_path.read_text() if output else printed)
+    references = offloaded["parameters"]
+    assert references["step1_parameter"] == f"s3://{bucket}/inputs/test/step1/0"
+    assert references["step3_parameters"] == [
+        f"s3://{bucket}/inputs/test/step3/0",
+        f"s3://{bucket}/inputs/test/step3/1",
+    ]
+    for step in ("step2", "step3"):
+        assert [
+            payloads.read_parameter(reference, s3_client)
+            for reference in references[f"{step}_parameters"]
+        ] == [str(item) for item in EXECUTION_INPUT["parameters"][f"{step}_parameters"]]
+
+
+def test_aggregate_results_merges_the_jobs_of_an_execution(
+    s3_client, bucket, monkeypatch
+):
+    jobs = {
+        ("step2", "job1"): [{"parameter": "step2a"}, {"parameter": "step2b"}],
+        ("step2", "job2"): [{"parameter": "step2c", "status": "failed"}],
+        ("step3", "job3"): [{"parameter": "step3a"}],
+    }
+    for (step_name, job_id), records in jobs.items():
+        key = payloads.result_key("execution", step_name, job_id)
+        payloads.write_results(bucket, key, records, s3_client=s3_client)
+    # the results of another execution are left out
+    other_key = payloads.result_key("other", "step2", "job4")
+    payloads.write_results(bucket, other_key, [{"parameter": "x"}], s3_client=s3_client)
+    # small enough for the merged results to spill to disk
+    monkeypatch.setattr(payloads, "SPOOL_MAX_BYTES", 64)
+
+    key = payloads.aggregate_results(bucket, "execution", s3_client=s3_client)
+
+    assert key == "aggregated/execution.jsonl"
+    body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read().decode()
+    assert [json.loads(line) for line in body.splitlines()] == [
+        {"step": step_name, "job_id": job_id, **record}
+        for (step_name, job_id), records in jobs.items()
+        for record in records
+    ]
@@ -0,0 +1,418 @@
+import json
+
+import pytest
+from cdk_deployment import defaults
+from cdk_deployment.pipeline_spec import default_pipeline_spec
+
+
+@pytest.fixture
+def definition(synth):
+
+    """
+    Amazon States Language definition of the standard state machine of a MainStack
+    with kwargs
+    """
+
+    def standard_definition(**kwargs):
+        _, state_machines = synth(**kwargs)
+        (definition,) = [
+            definition
+            for kind, definition in state_machines.values()
+            if kind == "STANDARD"
+        ]
+        return definition
+
+    return standard_definition
+
+
+def environment(state):
+
+    """
+    Environment of the batch job submitted by a task state, by variable name
+    """
+
+    return {
+        variable["Name"]: variable.get("Value.$", variable.get("Value"))
+        for variable in state["Parameters"]["ContainerOverrides"]["Environment"]
+    }
+
+
+def test_one_item_per_job(definition):
+    states = definition()["States"]
+
+    assert "csfeStep2Chunk" not in states and "csfeStep3Chunk" not in states
+    assert states["csfeStep1Task"]["Next"] == "csfeStep2Map"
+    for step_name in ("step2", "step3"):
+        fan_out = states[f"csfe{step_name.capitalize()}Map"]
+        assert fan_out["ItemsPath"] == f"$.parameters.{step_name}_parameters"
+        task = fan_out["Iterator"]["States"][f"csfe{step_name.capitalize()}Task"]
+        assert environment(task) == {
+            "PARAMETER": f"$.{step_name}_parameter",
+            "STEP_NAME": step_name,
+        }
+
+
+@pytest.mark.parametrize("step2_items_per_job,step3_items_per_job", [(2, 1), (5, 10)])
+def test_items_per_job(step2_items_per_job, step3_items_per_job, definition):
+    states = definition(
+        step2_items_per_job=step2_items_per_job, step3_items_per_job=step3_items_per_job
+    )["States"]
+
+    assert states["csfeStep1Task"]["Next"] == "csfeStep2Chunk"
+    chunk = states["csfeStep2Chunk"]
+    assert chunk["Type"] == "Pass" and chunk["Next"] == "csfeStep2Map"
+    assert chunk["Parameters"]["step2_chunks.$"] == (
+        f"States.ArrayPartition($.parameters.step2_parameters, {step2_items_per_job})"
+    )
+    fan_out = states["csfeStep2Map"]
+    assert fan_out["ItemsPath"] == "$.step2_chunks"
+    assert fan_out["Parameters"]["step2_parameters.$"] == (
+        "States.JsonToString($$.Map.Item.Value)"
+    )
+    task = fan_out["Iterator"]["States"]["csfeStep2Task"]
+    assert environment(task)["PARAMETERS"] == "$.step2_parameters"
+    assert "PARAMETER" not in environment(task)
+
+    if step3_items_per_job == 1:
+        assert fan_out["Next"] == "csfeStep3Map"
+        assert states["csfeStep3Map"]["ItemsPath"] == "$.parameters.step3_parameters"
+    else:
+        assert fan_out["Next"] == "csfeStep3Chunk"
+        assert states["csfeStep3Chunk"]["Parameters"]["step3_chunks.$"] == (
+            "States.ArrayPartition("
+            + f"$.parameters.step3_parameters, {step3_items_per_job})"
+        )
+        task = states["csfeStep3Map"]["Iterator"]["States"]["csfeStep3Task"]
+        assert environment(task)["PARAMETERS"] == "$.step3_parameters"
+
+
+def test_items_per_job_must_be_positive(synth):
+    with pytest.raises(Exception, match="items_per_job must be a positive integer"):
+        synth(step2_items_per_job=0)
+
+
+def policy_actions(template, role_prefix):
+
+    """
+    Actions of the inline policies of the roles whose logical id starts with
+    role_prefix, and of the policies attached to them, by resource
+    """
+
+    roles = [
+        logical_id
+        for logical_id, resource in template["Resources"].items()
+        if resource["Type"] == "AWS::IAM::Role" and logical_id.startswith(role_prefix)
+    ]
+    documents = [
+        policy["PolicyDocument"]
+        for role in roles
+        for policy in template["Resources"][role]["Properties"].get("Policies", [])
+    ] + [
+        resource["Properties"]["PolicyDocument"]
+        for resource in template["Resources"].values()
+        if resource["Type"] == "AWS::IAM::Policy"
+        and any(role["Ref"] in roles for role in resource["Properties"]["Roles"])
+    ]
+
+    actions = {}
+    for document in documents:
+        for statement in document["Statement"]:
+            statement_actions = statement["Action"]
+            if isinstance(statement_actions, str):
+                statement_actions = [statement_actions]
+            resources = statement["Resource"]
+            if not isinstance(resources, list):
+                resources = [resources]
+            for resource in resources:
+                actions.setdefault(json.dumps(resource), set()).update(statement_actions)
+    return actions
+
+
+def bucket_arn_actions(actions, bucket):
+
+    """
+    Actions allowed on the objects of the bucket with logical id bucket
+    """
+
+    return actions.get(
+        json.dumps(
+            {"Fn::Join": ["", [{"Fn::GetAtt": [bucket, "Arn"]}, "/*"]]},
+        ),
+        set(),
+    )
+
+
+@pytest.mark.parametrize("step3_items_per_job", [1, 3])
+def test_array_fan_out_reads_its_manifest_from_s3(step3_items_per_job, synth):
+    template, state_machines = synth(
+        step2_fan_out_mode="array",
+        step3_fan_out_mode="array",
+        step3_items_per_job=step3_items_per_job,
+    )
+    (states,) = [definition["States"] for _, definition in state_machines.values()]
+    (bucket,) = [
+        logical_id
+        for logical_id, resource in template["Resources"].items()
+        if resource["Type"] == "AWS::S3::Bucket"
+    ]
+
+    for step_name, items_path in (
+        ("step2", "$.parameters.step2_parameters"),
+        (
+            "step3",
+            "$.step3_chunks"
+            if step3_items_per_job > 1
+            else "$.parameters.step3_parameters",
+        ),
+    ):
+        prefix = f"csfe{step_name.capitalize()}Array"
+        manifest, task = states[f"{prefix}Manifest"], states[f"{prefix}Task"]
+        assert manifest["Resource"] == "arn:aws:states:::aws-sdk:s3:putObject"
+        assert manifest["Next"] == f"{prefix}Task"
+        assert manifest["Parameters"] == {
+            "Bucket": bucket,
+            "Key.$": f"States.Format('manifests/{{}}/{step_name}.json', "
+            + "$$.Execution.Name)",
+            "Body.$": f"States.JsonToString({items_path})",
+        }
+        # the list itself is never passed in the container overrides
+        assert environment(task)["MANIFEST"] == (
+            f"States.Format('s3://{bucket}/manifests/{{}}/{step_name}.json', "
+            + "$$.Execution.Name)"
+        )
+        assert task["Parameters"]["ArrayProperties"] == {
+            "Size.$": f"States.ArrayLength({items_path})"
+        }
+    assert states["csfeStep2ArrayTask"]["Next"] == (
+        "csfeStep3Chunk" if step3_items_per_job > 1 else "csfeStep3ArrayManifest"
+    )
+
+    assert "s3:PutObject" in bucket_arn_actions(
+        policy_actions(template, "csfeJStepFunctionRole"), bucket
+    )
+    assert "s3:GetObject*" in bucket_arn_actions(
+        policy_actions(template, "csfeBatchJobRole"), bucket
+    )
+
+
+def test_pipelined_topology_checks_the_items_are_paired(definition):
+    states = definition(topology="pipelined")["States"]
+
+    assert states["csfeStep1Task"]["Next"] == "csfePipelineCount"
+    assert states["csfePipelineCount"]["Parameters"] == {
+        "step2.$": "States.ArrayLength($.parameters.step2_parameters)",
+        "step3.$": "States.ArrayLength($.parameters.step3_parameters)",
+    }
+    paired = states["csfePipelinePaired"]
+    assert paired["Choices"] == [
+        {
+            "Variable": "$.item_counts.step2",
+            "NumericEqualsPath": "$.item_counts.step3",
+            "Next": "csfePipelineMap",
+        }
+    ]
+    assert states[paired["Default"]]["Type"] == "Fail"
+
+
+def test_result_cache_is_not_collected(synth):
+    with pytest.raises(Exception, match="result cache can't be combined"):
+        synth(
+            offload_payloads=True,
+            collect_results=True,
+            cache_results=True,
+            image_digest="sha256:" + "0" * 64,
+        )
+
+
+def test_image_digest_pins_the_job_images(synth):
+    digest = "sha256:" + "ab" * 32
+    template, _ = synth(
+        image_digest=digest,
+        tiers=[
+            {"name": "small", "max_size": 10, "fargate": True, "memory_mib": 2048},
+            {"name": "large", "max_size": 100, "memory_mib": 8000},
+        ],
+    )
+    images = [
+        json.dumps(resource["Properties"]["ContainerProperties"]["Image"])
+        for resource in template["Resources"].values()
+        if resource["Type"] == "AWS::Batch::JobDefinition"
+    ]
+
+    # the default job definition and the ones of the two tiers
+    assert len(images) == 3
+    for image in images:
+        assert f"/csfe-test@{digest}" in image and ":test" not in image
+    with pytest.raises(Exception, match="image_digest must be"):
+        synth(image_digest="latest")
+
+
+def test_callback_tasks_time_out_after_the_queue_wait(definition):
+    states = definition(completion_mode="callback")["States"]
+    tasks = [states["csfeStep1Task"]] + [
+        states[f"csfe{step_name}Map"]["Iterator"]["States"][f"csfe{step_name}Task"]
+        for step_name in ("Step2", "Step3")
+    ]
+
+    for task in tasks:
+        assert task["Resource"].endswith("submitJob.waitForTaskToken")
+        # a job still waiting for capacity sends no heartbeat
+        assert "HeartbeatSeconds" not in task
+        assert task["TimeoutSeconds"] == 24 * 3600
+
+
+@pytest.mark.parametrize("offload_payloads", [False, True])
+def test_distributed_map_reads_and_writes_the_manifest_bucket(offload_payloads, synth):
+    template, state_machines = synth(
+        step2_fan_out_mode="distributed",
+        step3_fan_out_mode="distributed",
+        step3_items_per_job=5,
+        offload_payloads=offload_payloads,
+    )
+    (states,) = [definition["States"] for _, definition in state_machines.values()]
+    (bucket,) = [
+        logical_id
+        for logical_id, resource in template["Resources"].items()
+        if resource["Type"] == "AWS::S3::Bucket"
+    ]
+    (state_machine_name,) = [
+        resource["Properties"]["StateMachineName"]
+        for resource in template["Resources"].values()
+        if resource["Type"] == "AWS::StepFunctions::StateMachine"
+    ]
+
+    assert states["csfeStep1Task"]["Next"] == "csfeStep2DistributedMap"
+    assert states["csfeStep2DistributedMap"]["Next"] == "csfeStep3DistributedMap"
+    for step_name, items_per_job in (("step2", 1), ("step3", 5)):
+        fan_out = states[f"csfe{step_name.capitalize()}DistributedMap"]
+        assert fan_out["ItemReader"] == {
+            "Resource": "arn:aws:states:::s3:getObject",
+            "ReaderConfig": {"InputType": "JSONL"},
+            "Parameters": {
+                "Bucket": bucket,
+                "Key.$": f"$.parameters.{step_name}_manifest",
+            },
+        }
+        # only a reference to the results of the iterations is added to the input
+        assert fan_out["ResultWriter"] == {
+            "Resource": "arn:aws:states:::s3:putObject",
+            "Parameters": {"Bucket": bucket, "Prefix": f"results/{step_name}"},
+        }
+        assert fan_out["ResultPath"] == f"$.{step_name}Results"
+        assert fan_out["ItemProcessor"]["ProcessorConfig"]["Mode"] == "DISTRIBUTED"
+        task = fan_out["ItemProcessor"]["States"][f"csfe{step_name.capitalize()}Task"]
+        if items_per_job == 1:
+            assert "ItemBatcher" not in fan_out
+            assert environment(task)["PARAMETER"] == "$.parameter"
+        else:
+            assert fan_out["ItemBatcher"]["MaxItemsPerBatch"] == items_per_job
+            assert environment(task)["PARAMETERS"] == "States.JsonToString($.Items)"
+        assert ("EXECUTION_NAME" in environment(task)) == offload_payloads
+
+    actions = policy_actions(template, "csfeJStepFunctionRole")
+    assert {"s3:GetObject", "s3:PutObject"} <= bucket_arn_actions(actions, bucket)
+    # the iterations are child executions of the state machine itself
+    (state_machine_arn,) = [
+        arn for arn in actions if arn.endswith(f':stateMachine:{state_machine_name}"')
+    ]
+    assert "states:StartExecution" in actions[state_machine_arn]
+    assert (
+        "states:DescribeExecution"
+        in actions[
+            state_machine_arn.replace(":stateMachine:", ":execution:")[:-1] + '/*"'
+        ]
+    )
+
+
+@pytest.mark.parametrize("weights", [[1], [1, 3]])
+def test_shards_route_the_items_by_hash(weights, definition):
+    shards = [
+        {"name": f"shard{index}", "weight": weight}
+        for index, weight in enumerate(weights)
+    ]
+    states = definition(shards=shards)["States"]
+
+    for step_name in ("Step2", "Step3"):
+        iterator = states[f"csfe{step_name}Map"]["Iterator"]
+        tasks = [f"csfe{step_name}TaskShardShard{index}" for index in range(len(shards))]
+        assert all(iterator["States"][task]["Type"] == "Task" for task in tasks)
+        if len(shards) == 1:
+            # a choice without choices isn't valid, the single shard takes every item
+            assert iterator["StartAt"] == tasks[0]
+            assert set(iterator["States"]) == set(tasks)
+        else:
+            assert iterator["StartAt"] == f"csfe{step_name}Hash"
+            assert iterator["States"][f"csfe{step_name}Shard"]["Choices"] == [
+                {"Variable": "$.shard.hash", "StringLessThan": "4000", "Next": tasks[0]}
+            ]
+            assert iterator["States"][f"csfe{step_name}Shard"]["Default"] == tasks[1]
+
+
+@pytest.mark.parametrize(
+    "steps",
+    [
+        {},
+        {"step2_items_per_job": 2, "step3_fan_out_mode": "array"},
+        {
+            "step1_backend": "lambda",
+            "step2_fan_out_mode": "distributed",
+            "step3_backend": "express",
+        },
+    ],
+)
+def test_default_steps_are_the_stages_of_their_spec(steps, synth):
+    _, state_machines = synth(offload_payloads=True, **steps)
+
+    assert (
+        state_machines
+        == synth(offload_payloads=True, pipeline=default_pipeline_spec(**steps))[1]
+    )
+    with pytest.raises(Exception, match="step settings don't apply"):
+        synth(step2_items_per_job=2, pipeline=default_pipeline_spec())
+
+
+def test_pipeline_stages_take_the_settings_of_the_stack(definition):
+    spec = {"stages": [{"name": "prepare", "fan_out_mode": "single"}, {"name": "train"}]}
+    states = definition(
+        pipeline=spec,
+        offload_payloads=True,
+        cache_results=True,
+        image_digest="sha256:" + "0" * 64,
+    )["States"]
+
+    assert states["csfePrepareCacheKey"]["Next"] == "csfePrepareCacheLookup"
+    train = states["csfeTrainMap"]
+    assert train["ResultPath"] == "$.trainResults"
+    assert train["Iterator"]["StartAt"] == "csfeTrainCacheKey"
+    assert environment(train["Iterator"]["States"]["csfeTrainTask"]) == {
+        "PARAMETER": "$.train_parameter",
+        "STEP_NAME": "train",
+        "EXECUTION_NAME": "$$.Execution.Name",
+        "CACHE_KEY": "$.cache.key",
+    }
+
+
+def test_stage_arns_are_definition_substitutions(synth):
+    spec = {"stages": [{"name": "prepare", "fan_out_mode": "single"}, {"name": "train"}]}
+    template, state_machines = synth(
+        pipeline=spec, tiers=[{"name": "small", "max_size": 10}]
+    )
+    (state_machine,) = [
+        resource["Properties"]
+        for resource in template["Resources"].values()
+        if resource["Type"] == "AWS::StepFunctions::StateMachine"
+    ]
+
+    # the definition holds no token, the arns are substituted by CloudFormation
+    assert isinstance(state_machine["DefinitionString"], str)
+    assert set(state_machine["DefinitionSubstitutions"]) == {
+        "JobQueue",
+        f"JobDefinition{defaults.JOB_VCPUS}x{defaults.JOB_MEMORY_LIMIT_MIB}",
+        "SmallJobQueue",
+        "SmallJobDefinition",
+    }
+    ((_, definition),) = state_machines.values()
+    iteration = definition["States"]["csfeTrainMap"]["Iterator"]
+    assert iteration["StartAt"] == "csfeTrainRoute"
+    tier_task = iteration["States"]["csfeTrainTaskSmall"]
+    assert tier_task["Parameters"]["JobQueue"].startswith("smallTiercsfeSmallJobQueue")
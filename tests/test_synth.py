@@ -0,0 +1,32 @@
+import os
+import sys
+
+# the cached synth lives in aws/synth.py
+AWS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../aws")
+sys.path.insert(0, AWS_DIRECTORY)
+
+import synth  # noqa: E402
+
+STAGES = '{"stages": [{"name": "%s", "fan_out_mode": "single"}]}'
+
+
+def test_pipeline_spec_file_is_part_of_the_key(tmp_path, monkeypatch):
+    # like the app, the path is relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    spec = tmp_path / "pipeline.json"
+    context = {"branch": "test", "pipeline": "pipeline.json"}
+
+    spec.write_text(STAGES % "step1")
+    key = synth.cache_key(context)
+    assert synth.cache_key(context) == key
+    spec.write_text(STAGES % "prepare")
+    assert synth.cache_key(context) != key
+
+
+def test_inline_pipeline_spec():
+    context = {"branch": "test", "pipeline": STAGES % "step1"}
+
+    assert synth.context_files(context) == []
+    assert synth.cache_key(context) != synth.cache_key(
+        {"branch": "test", "pipeline": STAGES % "prepare"}
+    )
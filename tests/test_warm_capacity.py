@@ -0,0 +1,134 @@
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+# the controller lives in aws/cdk_deployment/handlers/warm_capacity/index.py
+AWS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../aws")
+sys.path.insert(0, AWS_DIRECTORY)
+
+from cdk_deployment.handlers.warm_capacity import index  # noqa: E402
+
+# a sunday, followed by a monday
+SUNDAY = datetime(2026, 1, 4, tzinfo=timezone.utc)
+EARLY_MONDAY = [{"days": ["mon"], "start": "00:10", "end": "02:00", "vcpus": 8}]
+
+
+class RecordedBatch:
+
+    """
+    Stand-in of the batch client with a compute environment and the statuses of the
+    jobs of its queue, records the updates of the compute environment
+    """
+
+    def __init__(self, minv_cpus, desiredv_cpus=None, job_statuses=()):
+
+        self.resources = {
+            "minvCpus": minv_cpus,
+            "desiredvCpus": minv_cpus if desiredv_cpus is None else desiredv_cpus,
+        }
+        self.job_statuses = job_statuses
+        self.updates = []
+
+    def describe_compute_environments(self, computeEnvironments):
+
+        return {
+            "computeEnvironments": [
+                {"status": "VALID", "computeResources": dict(self.resources)}
+            ]
+        }
+
+    def list_jobs(self, jobQueue, jobStatus, maxResults):
+
+        summaries = [{"jobId": "job"}] if jobStatus in self.job_statuses else []
+        return {"jobSummaryList": summaries[:maxResults]}
+
+    def update_compute_environment(self, computeEnvironment, computeResources):
+
+        self.updates.append(computeResources)
+        self.resources.update(computeResources)
+
+
+@pytest.mark.parametrize(
+    "now,vcpus",
+    [
+        (SUNDAY.replace(hour=23, minute=50), 0),
+        # the lead of the window of monday starts on sunday
+        (SUNDAY.replace(hour=23, minute=55), 8),
+        (SUNDAY.replace(day=5, hour=1, minute=59), 8),
+        (SUNDAY.replace(day=5, hour=2), 0),
+        # the window of monday isn't lead into on the other days
+        (SUNDAY.replace(day=3, hour=23, minute=55), 0),
+    ],
+)
+def test_warm_vcpus_leads_across_midnight(now, vcpus):
+    assert index.warm_vcpus(EARLY_MONDAY, now, lead_minutes=15) == vcpus
+
+
+def test_reconcile_waits_for_the_queue_to_drain():
+    batch_client = RecordedBatch(8, job_statuses=("RUNNING",))
+
+    result = index.reconcile(batch_client, "ce", "queue", EARLY_MONDAY, SUNDAY)
+    assert result == {"action": "waiting", "minvCpus": 8}
+    assert batch_client.updates == []
+
+    batch_client.job_statuses = ()
+    result = index.reconcile(
+        batch_client, "ce", "queue", EARLY_MONDAY, SUNDAY, base_minv_cpus=2
+    )
+    assert result == {"action": "scaled", "from": 8, "minvCpus": 2}
+    assert batch_client.updates == [{"minvCpus": 2}]
+
+
+def test_handler_warms_up_ahead_of_a_window(monkeypatch):
+    monkeypatch.setenv("COMPUTE_ENVIRONMENT", "ce")
+    monkeypatch.setenv("JOB_QUEUE", "queue")
+    monkeypatch.setenv("SCHEDULE", json.dumps(EARLY_MONDAY))
+    monkeypatch.setenv("LEAD_MINUTES", "15")
+    batch_client = RecordedBatch(0)
+
+    result = index.handler(
+        {},
+        None,
+        batch_client=batch_client,
+        clock=lambda: SUNDAY.replace(hour=23, minute=57),
+    )
+    assert result == {"action": "scaled", "from": 0, "minvCpus": 8, "desiredvCpus": 8}
+    # within the window nothing changes, whatever the jobs of the queue
+    batch_client.job_statuses = index.ACTIVE_STATUSES
+    result = index.handler({}, None, batch_client, lambda: SUNDAY.replace(day=5, hour=1))
+    assert result == {"action": "none", "minvCpus": 8}
+
+
+@pytest.mark.parametrize(
+    "schedule,maxv_cpus,message",
+    [
+        (
+            [
+                {"start": "08:00", "end": "10:00", "vcpus": 4},
+                {"days": ["tue"], "start": "09:30", "end": "11:00", "vcpus": 8},
+            ],
+            None,
+            "overlap",
+        ),
+        ([{"start": "08:00", "end": "10:00", "vcpus": 32}], 16, "exceeds the 16"),
+        ([{"start": "23:00", "end": "24:59", "vcpus": 4}], None, "Invalid time"),
+        ([{"start": "10:00", "end": "08:00", "vcpus": 4}], None, "ends before"),
+    ],
+)
+def test_invalid_schedules_are_rejected(schedule, maxv_cpus, message):
+    with pytest.raises(Exception, match=message):
+        index.validate_schedule(schedule, maxv_cpus)
+
+
+def test_windows_on_other_days_or_back_to_back_are_valid():
+    index.validate_schedule(
+        [
+            {"days": ["mon"], "start": "08:00", "end": "10:00", "vcpus": 4},
+            {"days": ["tue"], "start": "09:00", "end": "11:00", "vcpus": 4},
+            {"days": ["mon"], "start": "10:00", "end": "24:00", "vcpus": 16},
+        ],
+        16,
+    )
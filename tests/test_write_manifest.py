@@ -0,0 +1,88 @@
+import csv
+import io
+import json
+import os
+import sys
+
+import pytest
+
+# the manifests of the distributed fan out are written by utilities/write_manifest.py
+UTILITIES_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "../utilities"
+)
+sys.path.insert(0, UTILITIES_DIRECTORY)
+
+import write_manifest  # noqa: E402
+from run_local import get_path  # noqa: E402
+
+ITEMS = ["step2a", {"parameter": 'step2 "b", quoted', "size": 42}, 3]
+PARAMETERS = ["step2a", 'step2 "b", quoted', "3"]
+
+
+def read_manifest(body, reader_config):
+
+    """
+    Items of a manifest as the ItemReader of a distributed map with reader_config
+    reads them
+    """
+
+    text = body.decode("utf-8")
+    if reader_config["InputType"] == "CSV":
+        assert reader_config["CSVHeaderLocation"] == "FIRST_ROW"
+        return list(csv.DictReader(io.StringIO(text)))
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def test_manifest_bodies():
+    assert write_manifest.manifest_body(ITEMS) == (
+        b'{"parameter": "step2a"}\n'
+        + b'{"parameter": "step2 \\"b\\", quoted"}\n'
+        + b'{"parameter": "3"}\n'
+    )
+    assert write_manifest.manifest_body(ITEMS, "csv") == (
+        b'parameter\nstep2a\n"step2 ""b"", quoted"\n3\n'
+    )
+
+
+@pytest.mark.parametrize("manifest_format", write_manifest.MANIFEST_FORMATS)
+def test_manifests_are_where_the_item_reader_reads(
+    synth, s3_client, bucket, tmp_path, monkeypatch, manifest_format
+):
+    _, state_machines = synth(
+        step2_fan_out_mode="distributed", manifest_format=manifest_format
+    )
+    ((_, definition),) = state_machines.values()
+    fan_out = definition["States"]["csfeStep2DistributedMap"]
+    item_reader = fan_out["ItemReader"]
+    input_path = tmp_path / "input.json"
+    input_path.write_text(
+        json.dumps(
+            {
+                "parameters": {
+                    "step1_parameter": "step1",
+                    "step2_parameters": ITEMS,
+                    "step3_parameters": ["step3a"],
+                }
+            }
+        )
+    )
+    output_path = tmp_path / "manifests.json"
+    arguments = ["-i", str(input_path), "-bk", bucket, "-s", "step2", "-n", "test"]
+    arguments += ["-fmt", manifest_format, "-o", str(output_path)]
+    monkeypatch.setattr(sys, "argv", ["write_manifest.py", *arguments])
+
+    with pytest.raises(SystemExit) as exit_info:
+        write_manifest.main()
+    assert exit_info.value.code == 0
+
+    execution_input = json.loads(output_path.read_text())
+    # step 3 keeps its items, the fan out of step 2 reads them from the manifest
+    assert execution_input["parameters"]["step3_parameters"] == ["step3a"]
+    assert "step2_parameters" not in execution_input["parameters"]
+    key = get_path(execution_input, item_reader["Parameters"]["Key.$"], {})
+    assert key == f"manifests/test/step2.{manifest_format}"
+    body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+    items = read_manifest(body, item_reader["ReaderConfig"])
+    # the item selector of the map passes the parameter of every item on
+    assert fan_out["ItemSelector"] == {"parameter.$": "$$.Map.Item.Value.parameter"}
+    assert [item["parameter"] for item in items] == PARAMETERS
@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tarfile
+import tempfile
+import time
+import zlib
+
+import docker
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(CURRENT_DIR, "../source")
+# metrics compared with the baseline, all of them lower is better
+METRICS = ("image_bytes", "layer_bytes", "start_seconds")
+# files of docker save which aren't layers
+SAVE_METADATA = ("oci-layout", "repositories", "json", "VERSION")
+
+
+def layer_bytes(image):
+
+    """
+    Bytes pulled for the image, estimated as the gzip size of each of its layers as
+    exported by docker save
+    """
+
+    total = 0
+    with tempfile.TemporaryFile() as archive:
+        for chunk in image.save(named=False):
+            archive.write(chunk)
+        archive.seek(0)
+        with tarfile.open(fileobj=archive) as layers:
+            for member in layers:
+                name = os.path.basename(member.name)
+                metadata = name in SAVE_METADATA or name.endswith(".json")
+                if metadata or not member.isfile():
+                    continue
+                compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+                stream = layers.extractfile(member)
+                for block in iter(lambda: stream.read(1024 * 1024), b""):
+                    total += len(compressor.compress(block))
+                total += len(compressor.flush())
+    return total
+
+
+def start_seconds(docker_client, image, runs):
+
+    """
+    Median seconds from the start of a container to its first output, over runs
+    containers
+    """
+
+    durations = []
+    for _ in range(runs):
+        container = docker_client.containers.create(image.id)
+        try:
+            start = time.perf_counter()
+            container.start()
+            for _ in container.logs(stream=True, follow=True):
+                durations.append(time.perf_counter() - start)
+                break
+            container.wait()
+        finally:
+            container.remove(force=True)
+    return statistics.median(durations)
+
+
+def regressions(metrics, baseline, threshold):
+
+    """
+    Metrics more than threshold, a fraction, above their baseline
+    """
+
+    return [
+        metric
+        for metric in METRICS
+        if metric in baseline and metrics[metric] > baseline[metric] * (1 + threshold)
+    ]
+
+
+def main():
+
+    """
+    Measures size, pulled bytes and start to first output latency of the job image
+    and fails when they regress beyond a threshold of a baseline
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-im", "--image", type=str, help="image to measure, defaults to building source"
+    )
+    parser.add_argument("-r", "--runs", type=int, default=5, help="containers started")
+    parser.add_argument("-bl", "--baseline", type=str, help="baseline json file")
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="allowed regression, as a fraction of the baseline",
+    )
+    parser.add_argument(
+        "--record", action="store_true", help="write the metrics to --baseline"
+    )
+    args = parser.parse_args()
+
+    docker_client = docker.from_env()
+    if args.image:
+        image = docker_client.images.get(args.image)
+    else:
+        image, _ = docker_client.images.build(path=SOURCE_DIR, rm=True)
+
+    metrics = {
+        "image_bytes": image.attrs["Size"],
+        "layer_bytes": layer_bytes(image),
+        "start_seconds": start_seconds(docker_client, image, args.runs),
+    }
+    print(
+        f"image {metrics['image_bytes'] / 1e6:.1f} MB, "
+        + f"layers {metrics['layer_bytes'] / 1e6:.1f} MB compressed, "
+        + f"first output after {metrics['start_seconds']:.3f}s"
+    )
+
+    if args.baseline and args.record:
+        with open(args.baseline, "w") as stream:
+            json.dump(metrics, stream, indent=2)
+        print(f"Recorded baseline {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as stream:
+            baseline = json.load(stream)
+        regressed = regressions(metrics, baseline, args.threshold)
+        for metric in regressed:
+            print(f"{metric} regressed: {metrics[metric]} against {baseline[metric]}")
+        if regressed:
+            sys.exit(1)
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+
+    main()
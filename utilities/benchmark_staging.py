@@ -0,0 +1,152 @@
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import boto3
+
+# the staging module of the container lives in source/staging.py
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../source")
+sys.path.insert(0, SOURCE_DIRECTORY)
+
+import staging  # noqa: E402
+
+MIB = 1024 * 1024
+KEY = "benchmark/staging.bin"
+
+
+def write_random_file(path, size):
+
+    """
+    Writes size random bytes to path, one MiB at a time
+    """
+
+    with open(path, "wb") as stream:
+        for start in range(0, size, MIB):
+            stream.write(os.urandom(min(MIB, size - start)))
+
+
+def same_content(path, other_path):
+
+    """
+    Whether the two files hold the same bytes, compared one MiB at a time
+    """
+
+    with open(path, "rb") as stream, open(other_path, "rb") as other_stream:
+        while True:
+            block, other_block = stream.read(MIB), other_stream.read(MIB)
+            if block != other_block:
+                return False
+            if not block:
+                return True
+
+
+def mib_per_second(s3_client, bucket, directory, path, part_bytes, concurrency):
+
+    """
+    Upload and download throughput of the staging module with concurrency parts in
+    flight, the downloaded file is checked against the uploaded one
+    """
+
+    reference = f"s3://{bucket}/{KEY}"
+    downloaded = os.path.join(directory, "downloaded.bin")
+
+    start = time.perf_counter()
+    size = staging.upload(path, reference, s3_client, part_bytes, concurrency)
+    upload_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    staging.download(reference, downloaded, s3_client, part_bytes, concurrency)
+    download_seconds = time.perf_counter() - start
+
+    if not same_content(path, downloaded):
+        raise Exception(f"The file downloaded with concurrency {concurrency} differs")
+    os.remove(downloaded)
+    return size / MIB / upload_seconds, size / MIB / download_seconds
+
+
+def main_benchmark():
+
+    """
+    Measures the upload and download MiB/s of source/staging.py for growing numbers
+    of parts in flight, against S3 or a local stand-in given with --endpoint-url,
+    eg moto_server or minio. The peak memory shows that it doesn't grow with the
+    size of the file
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-bk", "--bucket", type=str, default="csfe-staging-benchmark", help="bucket"
+    )
+    parser.add_argument("-mb", "--mebibytes", type=int, default=256, help="file size")
+    parser.add_argument(
+        "-p",
+        "--part-mebibytes",
+        type=int,
+        default=staging.PART_BYTES // MIB,
+        help="size of the parts",
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8, 16],
+        help="parts in flight",
+    )
+    parser.add_argument(
+        "-d",
+        "--directory",
+        type=str,
+        help="where the files are written, defaults to SCRATCH_DIR or the temp dir",
+    )
+    parser.add_argument("--endpoint-url", type=str, help="eg a local S3 stand-in")
+    args = parser.parse_args()
+
+    s3_client = boto3.client("s3", "eu-west-1", endpoint_url=args.endpoint_url)
+    if args.endpoint_url:
+        # a local stand-in starts empty
+        buckets = [bucket["Name"] for bucket in s3_client.list_buckets()["Buckets"]]
+        if args.bucket not in buckets:
+            s3_client.create_bucket(
+                Bucket=args.bucket,
+                CreateBucketConfiguration={"LocationConstraint": "eu-west-1"},
+            )
+
+    with tempfile.TemporaryDirectory(
+        dir=args.directory or staging.scratch_directory()
+    ) as directory:
+        path = os.path.join(directory, "uploaded.bin")
+        write_random_file(path, args.mebibytes * MIB)
+        print(f"{args.mebibytes} MiB in parts of {args.part_mebibytes} MiB")
+        baseline = None
+        for concurrency in args.concurrency:
+            upload_rate, download_rate = mib_per_second(
+                s3_client,
+                args.bucket,
+                directory,
+                path,
+                args.part_mebibytes * MIB,
+                concurrency,
+            )
+            baseline = baseline or (upload_rate, download_rate)
+            print(
+                f"concurrency {concurrency:3d}: "
+                + f"upload {upload_rate:8.1f} MiB/s ({upload_rate / baseline[0]:.2f}x), "
+                + f"download {download_rate:8.1f} MiB/s "
+                + f"({download_rate / baseline[1]:.2f}x)"
+            )
+
+    s3_client.delete_object(Bucket=args.bucket, Key=KEY)
+    # kilobytes on linux
+    peak_mib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"peak memory {peak_mib:.0f} MiB")
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+
+    main_benchmark()
@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+# the stack lives in aws, synthesizing it requires aws/deploy-requirements.txt
+AWS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../aws")
+sys.path.insert(0, AWS_DIRECTORY)
+
+from aws_cdk import core  # noqa: E402
+from cdk_deployment.jobs.asl import DEFINITION_MAX_BYTES  # noqa: E402
+from cdk_deployment.main_stack import MainStack  # noqa: E402
+
+ACCOUNT = "123456789012"
+REGION = "eu-west-1"
+BRANCH = "benchmark"
+# stages cycle through these settings, so that job definitions are shared
+STAGE_SETTINGS = (
+    {"fan_out_mode": "single"},
+    {"fan_out_mode": "map", "max_concurrency": 10},
+    {"fan_out_mode": "array", "vcpus": 2, "memory_mib": 4000},
+    {"fan_out_mode": "map", "items_per_job": 10},
+    {"fan_out_mode": "map", "vcpus": 4, "memory_mib": 8000},
+)
+PLACEHOLDER = re.compile(r"\$\{(JobQueue|JobDefinition[0-9x]+)\}")
+
+
+def pipeline_stages(count):
+
+    """
+    Pipeline spec of count stages cycling through STAGE_SETTINGS
+    """
+
+    return [
+        {"name": f"stage{index}", **STAGE_SETTINGS[index % len(STAGE_SETTINGS)]}
+        for index in range(count)
+    ]
+
+
+def deployed_definition(template):
+
+    """
+    Definition of the state machine of the template with its placeholders replaced
+    by arns of a realistic length, ie the definition step functions measures
+    """
+
+    for resource in template["Resources"].values():
+        if resource["Type"] == "AWS::StepFunctions::StateMachine":
+            definition = resource["Properties"]["DefinitionString"]
+            return PLACEHOLDER.sub(
+                lambda match: f"arn:aws:batch:{REGION}:{ACCOUNT}:"
+                + ("job-queue" if match.group(1) == "JobQueue" else "job-definition")
+                + f"/csfe-{BRANCH}-{match.group(1)}:1",
+                definition,
+            )
+    raise Exception("No state machine in the template")
+
+
+def synth(count, outdir):
+
+    """
+    Synthesizes the stack with count stages, returns its seconds, its template and
+    the number of job definitions
+    """
+
+    start = time.perf_counter()
+    app = core.App(outdir=outdir)
+    MainStack(
+        app,
+        "csfeMainStack",
+        env=core.Environment(account=ACCOUNT, region=REGION),
+        ecr_repository_name="benchmark",
+        branch_name=BRANCH,
+        account=ACCOUNT,
+        region=REGION,
+        pipeline=pipeline_stages(count),
+    )
+    template = app.synth().get_stack_by_name("csfeMainStack").template
+    seconds = time.perf_counter() - start
+    job_definitions = sum(
+        resource["Type"] == "AWS::Batch::JobDefinition"
+        for resource in template["Resources"].values()
+    )
+    return seconds, template, job_definitions
+
+
+def main_benchmark():
+
+    """
+    Measures how synth time, template size and definition size grow with the number
+    of stages of a pipeline spec. The vpc lookup isn't resolved, no AWS call is made
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-s",
+        "--stages",
+        type=int,
+        nargs="+",
+        default=[3, 10, 30, 100, 300],
+        help="numbers of stages",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as outdir:
+        # the first synth starts the jsii runtime, it isn't measured
+        synth(1, outdir)
+        print("stages  synth sec  template KiB  definition KiB  of quota  job defs")
+        for count in args.stages:
+            seconds, template, job_definitions = synth(count, outdir)
+            template_bytes = len(json.dumps(template, separators=(",", ":")))
+            definition_bytes = len(deployed_definition(template).encode("utf-8"))
+            print(
+                f"{count:6d}  {seconds:9.2f}  {template_bytes / 1024:12.1f}  "
+                + f"{definition_bytes / 1024:14.1f}  "
+                + f"{definition_bytes / DEFINITION_MAX_BYTES:8.1%}  "
+                + f"{job_definitions:8d}"
+            )
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+
+    main_benchmark()
@@ -0,0 +1,89 @@
+import argparse
+import os
+import sys
+import time
+
+# the worker pool of the container lives in source/main.py
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../source")
+sys.path.insert(0, SOURCE_DIRECTORY)
+
+import main  # noqa: E402
+
+
+def busy_work(parameter, milliseconds):
+
+    """
+    Stand-in for the processing of a parameter, keeps a cpu busy for milliseconds
+    """
+
+    deadline = time.perf_counter() + milliseconds / 1000
+    total = 0
+    while time.perf_counter() < deadline:
+        total += 1
+    return {"status": "succeeded"}
+
+
+class BusyWork:
+
+    """
+    Picklable busy_work with a fixed duration, to be sent to the worker processes
+    """
+
+    def __init__(self, milliseconds):
+
+        self.milliseconds = milliseconds
+
+    def __call__(self, parameter):
+
+        return busy_work(parameter, self.milliseconds)
+
+
+def items_per_second(items, workers, milliseconds):
+
+    """
+    Throughput of main.process with workers processes on items parameters
+    """
+
+    parameters = [str(item) for item in range(items)]
+    start = time.perf_counter()
+    main.process(parameters, workers, BusyWork(milliseconds))
+    return items / (time.perf_counter() - start)
+
+
+def main_benchmark():
+
+    """
+    Measures items/sec of the worker pool of the container for growing pool sizes
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--items", type=int, default=200, help="parameters")
+    parser.add_argument(
+        "-ms", "--milliseconds", type=float, default=20, help="cpu time per parameter"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        nargs="+",
+        help="pool sizes, defaults to 1 up to the vCPUs of this machine",
+    )
+    args = parser.parse_args()
+
+    pool_sizes = args.workers or range(1, main.available_vcpus() + 1)
+    baseline = None
+    print(f"{args.items} parameters of {args.milliseconds}ms")
+    for workers in pool_sizes:
+        throughput = items_per_second(args.items, workers, args.milliseconds)
+        baseline = baseline or throughput
+        print(
+            f"workers {workers:3d}: {throughput:10.1f} items/sec "
+            + f"({throughput / baseline:.2f}x)"
+        )
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+
+    main_benchmark()
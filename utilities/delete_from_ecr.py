@@ -1,33 +1,275 @@
 import argparse
+import fnmatch
+import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
 import boto3
 
 ECR_CLIENT = boto3.client("ecr", "eu-west-1")
+CFN_CLIENT = boto3.client("cloudformation", "eu-west-1")
+
+# batch_delete_image accepts at most 100 image ids per call
+DELETE_BATCH = 100
+# name of the stack deployed for a branch, see aws/app.py
+STACK_NAME = re.compile(r"^csfe-(.+)-main-stack$")
+# never deleted in bulk, the layer cache of push_to_ecr.py --buildx
+PROTECTED_TAGS = ("buildcache",)
+# tags push_to_ecr.py adds next to the branch tag, the hash of the build context
+CONTEXT_TAG_PREFIX = "ctx-"
+
+
+def deployed_branches(cfn_client=CFN_CLIENT):
+
+    """
+    Branches with a main stack which isn't deleted
+    """
+
+    branches = set()
+    paginator = cfn_client.get_paginator("list_stacks")
+    for page in paginator.paginate():
+        for stack in page["StackSummaries"]:
+            match = STACK_NAME.match(stack["StackName"])
+            if match and stack["StackStatus"] != "DELETE_COMPLETE":
+                branches.add(match.group(1))
+    return branches
+
+
+def branch_tags(tags):
+
+    """
+    Tags of an image naming a branch, ie other than the context and protected ones
+    """
+
+    return [
+        tag
+        for tag in tags
+        if not tag.startswith(CONTEXT_TAG_PREFIX) and tag not in PROTECTED_TAGS
+    ]
+
+
+def select_images(
+    repository,
+    tag_pattern=None,
+    older_than_days=None,
+    keep_tags=None,
+    untagged=False,
+    orphaned=False,
+    ecr_client=ECR_CLIENT,
+    now=None,
+):
+
+    """
+    Image ids of a repository to delete, paging through describe_images, among the
+    images pushed more than older_than_days ago when given. A branch tag is stale
+    when it matches tag_pattern and isn't in keep_tags. An image whose branch tags
+    are all stale is selected by digest, which deletes its ctx- tags too, otherwise
+    only its stale tags are. With untagged the images without tags are selected,
+    with orphaned the ones left with ctx- tags only, once their branch tag moved to
+    another image. Images with a protected tag are never selected
+    """
+
+    cutoff = None
+    if older_than_days is not None:
+        cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=older_than_days)
+    by_tag = tag_pattern or keep_tags is not None
+    selected = []
+    paginator = ecr_client.get_paginator("describe_images")
+    for page in paginator.paginate(repositoryName=repository):
+        for image in page["imageDetails"]:
+            if cutoff and image["imagePushedAt"] > cutoff:
+                continue
+            tags = image.get("imageTags", [])
+            if any(tag in PROTECTED_TAGS for tag in tags):
+                continue
+            branches = branch_tags(tags)
+            if not tags:
+                if untagged:
+                    selected.append({"imageDigest": image["imageDigest"]})
+                continue
+            if not branches:
+                if orphaned:
+                    selected.append({"imageDigest": image["imageDigest"]})
+                continue
+            if not by_tag:
+                continue
+            stale = [
+                tag
+                for tag in branches
+                if (not tag_pattern or fnmatch.fnmatchcase(tag, tag_pattern))
+                and (keep_tags is None or tag not in keep_tags)
+            ]
+            if len(stale) == len(branches):
+                selected.append({"imageDigest": image["imageDigest"]})
+            else:
+                selected += [{"imageTag": tag} for tag in stale]
+    return selected
+
+
+def branch_image_ids(repository, branch, ecr_client=ECR_CLIENT):
+
+    """
+    Image ids deleting the image of a branch: its digest when no other branch is
+    tagged on it, its ctx- tags going with it, otherwise only the branch tag
+    """
+
+    try:
+        (image,) = ecr_client.describe_images(
+            repositoryName=repository, imageIds=[{"imageTag": branch}]
+        )["imageDetails"]
+    except ecr_client.exceptions.ImageNotFoundException:
+        return []
+    if branch_tags(image.get("imageTags", [])) == [branch] and not any(
+        tag in PROTECTED_TAGS for tag in image["imageTags"]
+    ):
+        return [{"imageDigest": image["imageDigest"]}]
+    return [{"imageTag": branch}]
+
+
+def delete_images(repository, image_ids, ecr_client=ECR_CLIENT):
+
+    """
+    Deletes image_ids from a repository, DELETE_BATCH per call, and returns the
+    number deleted and the failures
+    """
+
+    deleted, failures = 0, []
+    for start in range(0, len(image_ids), DELETE_BATCH):
+        response = ecr_client.batch_delete_image(
+            repositoryName=repository, imageIds=image_ids[start : start + DELETE_BATCH]
+        )
+        deleted += len(response.get("imageIds", []))
+        failures += response.get("failures", [])
+    return deleted, failures
+
+
+def describe_image_id(image_id):
+
+    """
+    Tag or short digest of an image id, for the output
+    """
+
+    return image_id.get("imageTag") or image_id["imageDigest"][:19]
+
+
+def bulk_delete(args):
+
+    """
+    Selects the images of every repository, concurrently, then deletes them after
+    confirmation
+    """
+
+    keep_tags = deployed_branches() if args.not_deployed else None
+    repositories = args.ecrrepository
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        selections = dict(
+            zip(
+                repositories,
+                pool.map(
+                    lambda repository: select_images(
+                        repository,
+                        args.tag_pattern,
+                        args.older_than_days,
+                        keep_tags,
+                        args.untagged,
+                        args.orphaned,
+                    ),
+                    repositories,
+                ),
+            )
+        )
+
+    for repository, image_ids in selections.items():
+        print(f"{repository}: {len(image_ids)} images to delete")
+        for image_id in image_ids:
+            print(f"  {describe_image_id(image_id)}")
+    if args.dry_run:
+        print("Dry run, nothing deleted")
+        return
+    if not args.yes and input("Do you want to continue (y/n)?") != "y":
+        print("Aborted")
+        return
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = pool.map(
+            lambda repository: delete_images(repository, selections[repository]),
+            repositories,
+        )
+        for repository, (deleted, failures) in zip(repositories, results):
+            print(f"{repository}: deleted {deleted}, {len(failures)} failures")
+            for failure in failures:
+                print(f"  {failure.get('failureCode')}: {failure.get('failureReason')}")
 
 
 def main():
 
     """
-    Delete an image from ECR
+    Delete an image from ECR, or with --bulk the images of several repositories
+    selected by tag pattern, age or branch without deployed stack
     """
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("-b", "--branch", type=str, help="branch name", required=True)
+    parser.add_argument("-b", "--branch", type=str, help="branch name")
+    parser.add_argument(
+        "-er",
+        "--ecrrepository",
+        type=str,
+        nargs="+",
+        help="aws ecr repo names",
+        required=True,
+    )
+    parser.add_argument(
+        "--bulk", action="store_true", help="delete the images selected below"
+    )
+    parser.add_argument("-tp", "--tag-pattern", type=str, help="eg feature-*")
+    parser.add_argument(
+        "-od", "--older-than-days", type=int, help="only images pushed before"
+    )
     parser.add_argument(
-        "-er", "--ecrrepository", type=str, help="aws ecr repo name", required=True
+        "-nd",
+        "--not-deployed",
+        action="store_true",
+        help="tags without a deployed csfe-<tag>-main-stack",
     )
+    parser.add_argument(
+        "-u", "--untagged", action="store_true", help="images without any tag"
+    )
+    parser.add_argument(
+        "-o",
+        "--orphaned",
+        action="store_true",
+        help="images left with ctx- tags only, their branch tag moved",
+    )
+    parser.add_argument("--threads", type=int, default=4, help="repositories at once")
+    parser.add_argument("--dry-run", action="store_true", help="only list the images")
+    parser.add_argument("-y", "--yes", action="store_true", help="don't ask to confirm")
     args = parser.parse_args()
+
+    if args.bulk:
+        if not (args.tag_pattern or args.not_deployed or args.untagged or args.orphaned):
+            parser.error(
+                "--bulk needs --tag-pattern, --not-deployed, --untagged or --orphaned"
+            )
+        bulk_delete(args)
+        sys.exit(0)
+
+    if not args.branch or len(args.ecrrepository) != 1:
+        parser.error("--branch and a single --ecrrepository are required")
     branch = str(args.branch)
-    ecrrepository = str(args.ecrrepository)
+    ecrrepository = str(args.ecrrepository[0])
 
     print(f"Deleting branch {branch} from repo {ecrrepository}")
-    continue_flag = input("Do you want to continue (y/n)?")
+    continue_flag = "y" if args.yes else input("Do you want to continue (y/n)?")
     if continue_flag == "y":
-        ECR_CLIENT.batch_delete_image(
-            repositoryName=ecrrepository, imageIds=[{"imageTag": branch}]
-        )
-        print("Deleted")
+        image_ids = branch_image_ids(ecrrepository, branch)
+        if image_ids:
+            _, failures = delete_images(ecrrepository, image_ids)
+            print(f"Deleted {describe_image_id(image_ids[0])}, {len(failures)} failures")
+            for failure in failures:
+                print(f"  {failure.get('failureCode')}: {failure.get('failureReason')}")
+        else:
+            print(f"No image tagged {branch}")
     else:
         print("Aborted")
 
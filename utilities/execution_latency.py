@@ -0,0 +1,442 @@
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+import boto3
+
+SFN_CLIENT = boto3.client("stepfunctions", "eu-west-1")
+BATCH_CLIENT = boto3.client("batch", "eu-west-1")
+STS_CLIENT = boto3.client("sts", "eu-west-1")
+
+# DescribeJobs accepts at most 100 job ids per call
+DESCRIBE_JOBS_BATCH = 100
+PERCENTILES = (50, 90, 95, 99)
+# events of a task, each one follows the previous one of the same task
+TASK_EVENTS = (
+    "TaskStarted",
+    "TaskStartFailed",
+    "TaskSubmitted",
+    "TaskSubmitFailed",
+    "TaskSucceeded",
+    "TaskFailed",
+    "TaskTimedOut",
+)
+TERMINAL_TASK_EVENTS = ("TaskSucceeded", "TaskFailed", "TaskTimedOut")
+TERMINAL_EXECUTION_EVENTS = (
+    "ExecutionSucceeded",
+    "ExecutionFailed",
+    "ExecutionTimedOut",
+    "ExecutionAborted",
+)
+# components of the latency of a job, see item_timings
+COMPONENTS = ("orchestration", "queue_wait", "run", "completion", "total")
+
+
+def execution_arn(branch, execution, account, region="eu-west-1"):
+
+    """
+    Arn of the execution named execution of the step function of branch
+    """
+
+    return (
+        f"arn:aws:states:{region}:{account}:execution:"
+        + f"csfe-{branch}-stepfunction:{execution}"
+    )
+
+
+def get_execution_history(arn, sfn_client=SFN_CLIENT):
+
+    """
+    Every event of the history of an execution
+    """
+
+    events = []
+    paginator = sfn_client.get_paginator("get_execution_history")
+    for page in paginator.paginate(executionArn=arn):
+        events.extend(page["events"])
+    return events
+
+
+def describe_jobs(job_ids, batch_client=BATCH_CLIENT):
+
+    """
+    Descriptions of the batch jobs job_ids, and of the children of the array jobs
+    among them, DESCRIBE_JOBS_BATCH ids per call
+    """
+
+    def describe(ids):
+        jobs = []
+        for start in range(0, len(ids), DESCRIBE_JOBS_BATCH):
+            response = batch_client.describe_jobs(
+                jobs=ids[start : start + DESCRIBE_JOBS_BATCH]
+            )
+            jobs.extend(response["jobs"])
+        return jobs
+
+    jobs = describe(list(job_ids))
+    children = [
+        f"{job['jobId']}:{index}"
+        for job in jobs
+        if "size" in job.get("arrayProperties", {})
+        for index in range(job["arrayProperties"]["size"])
+    ]
+    return jobs + describe(children)
+
+
+def timestamp(value):
+
+    """
+    Seconds since the epoch of a history timestamp, a datetime or, once recorded,
+    its string
+    """
+
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return value.timestamp()
+
+
+def batch_tasks(events):
+
+    """
+    The batch tasks of an execution in order of scheduling, with their state name,
+    job id, step function timestamps and predecessor: the task whose completion
+    led to their scheduling, following the previous events
+    """
+
+    by_id = {event["id"]: event for event in events}
+    task_of = {}
+    tasks = {}
+    for event in events:
+        if event["type"] == "TaskScheduled":
+            details = event["taskScheduledEventDetails"]
+            if "batch" not in details["resourceType"]:
+                continue
+            entered = by_id.get(event.get("previousEventId"), {})
+            tasks[event["id"]] = {
+                "state": entered.get("stateEnteredEventDetails", {}).get("name"),
+                "scheduled": timestamp(event["timestamp"]),
+                "job_id": None,
+                "completed": None,
+                "status": None,
+                "predecessor": None,
+            }
+            task_of[event["id"]] = event["id"]
+        elif event["type"] in TASK_EVENTS and event.get("previousEventId") in task_of:
+            task = tasks[task_of[event["previousEventId"]]]
+            task_of[event["id"]] = task_of[event["previousEventId"]]
+            if event["type"] == "TaskSubmitted":
+                output = event["taskSubmittedEventDetails"].get("output") or "{}"
+                task["job_id"] = json.loads(output).get("JobId")
+            elif event["type"] in TERMINAL_TASK_EVENTS:
+                task["completed"] = timestamp(event["timestamp"])
+                task["status"] = event["type"][len("Task") :].upper()
+
+    # walks back the previous events up to the completion of a task, memoised as
+    # the walks of the items of a map share most of their events
+    completed_by = {}
+
+    def predecessor(event_id):
+        path = []
+        while event_id in by_id and event_id not in completed_by:
+            event = by_id[event_id]
+            if event["type"] in TERMINAL_TASK_EVENTS and event_id in task_of:
+                completed_by[event_id] = task_of[event_id]
+                break
+            path.append(event_id)
+            event_id = event.get("previousEventId")
+        found = completed_by.get(event_id)
+        for step in path:
+            completed_by[step] = found
+        return found
+
+    for scheduled_id, task in tasks.items():
+        task["predecessor"] = predecessor(by_id[scheduled_id].get("previousEventId"))
+
+    return tasks
+
+
+def item_timings(task, job, array_task=False):
+
+    """
+    Latency components in seconds of a job started by task: orchestration from the
+    scheduling of the task to the creation of the job, queue_wait while the job is
+    runnable and starting, ie capacity acquisition, placement and image pull, run
+    of the container and completion from the end of the job to the end of the task,
+    the .sync polling or the callback. The children of an array job share the
+    completion of their task, it is left out
+    """
+
+    created = job["createdAt"] / 1000
+    started = job["startedAt"] / 1000 if job.get("startedAt") else None
+    stopped = job["stoppedAt"] / 1000 if job.get("stoppedAt") else None
+    completed = task["completed"]
+
+    def elapsed(start, end):
+        return end - start if start is not None and end is not None else None
+
+    return {
+        "orchestration": elapsed(task["scheduled"], created),
+        "queue_wait": elapsed(created, started),
+        "run": elapsed(started, stopped),
+        "completion": None if array_task else elapsed(stopped, completed),
+        "total": elapsed(task["scheduled"], stopped if array_task else completed),
+        "attempts": len(job.get("attempts", [])),
+        "status": job["status"],
+    }
+
+
+def breakdown(events, jobs):
+
+    """
+    Per item timings of every batch job of an execution, grouped with the task which
+    started it. Items of an array job are its children
+    """
+
+    jobs_by_id = {job["jobId"]: job for job in jobs}
+    tasks = batch_tasks(events)
+    for task in tasks.values():
+        job = jobs_by_id.get(task["job_id"])
+        task["items"] = []
+        if not job:
+            continue
+        size = job.get("arrayProperties", {}).get("size")
+        if size:
+            task["items"] = [
+                {"job_id": child, **item_timings(task, jobs_by_id[child], True)}
+                for child in (f"{job['jobId']}:{index}" for index in range(size))
+                if child in jobs_by_id
+            ]
+        else:
+            task["items"] = [{"job_id": job["jobId"], **item_timings(task, job)}]
+    return tasks
+
+
+def percentile(values, rank):
+
+    """
+    Nearest rank percentile of values, None without values
+    """
+
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return None
+    return values[max(0, -(-rank * len(values) // 100) - 1)]
+
+
+def stage_summary(tasks):
+
+    """
+    For every state running batch jobs, the number of items, the span from the first
+    scheduling to the last completion and the percentiles of each latency component.
+    straggler is the slowest item over the median one
+    """
+
+    stages = {}
+    for task in tasks.values():
+        stage = stages.setdefault(
+            task["state"], {"items": [], "first": task["scheduled"], "last": None}
+        )
+        stage["items"].extend(task["items"])
+        if task["completed"]:
+            stage["last"] = max(stage["last"] or 0, task["completed"])
+
+    summary = {}
+    for state, stage in stages.items():
+        components = {
+            component: {
+                **{
+                    f"p{rank}": percentile(
+                        [item[component] for item in stage["items"]], rank
+                    )
+                    for rank in PERCENTILES
+                },
+                "max": percentile([item[component] for item in stage["items"]], 100),
+            }
+            for component in COMPONENTS
+        }
+        median = components["total"]["p50"]
+        summary[state] = {
+            "items": len(stage["items"]),
+            "span": stage["last"] - stage["first"] if stage["last"] else None,
+            "straggler": components["total"]["max"] / median if median else None,
+            **components,
+        }
+    return summary
+
+
+def critical_path(tasks):
+
+    """
+    The chain of tasks ending with the last one to complete, each one preceded by the
+    task whose completion led to its scheduling. gap is the step function time
+    between the two, eg map and choice states or cache lookups
+    """
+
+    completed = [key for key, task in tasks.items() if task["completed"]]
+    if not completed:
+        return []
+
+    path = []
+    key = max(completed, key=lambda key: tasks[key]["completed"])
+    while key is not None:
+        task = tasks[key]
+        predecessor = tasks.get(task["predecessor"])
+        slowest = max(task["items"], key=lambda item: item["total"] or 0, default={})
+        path.append(
+            {
+                "state": task["state"],
+                "job_id": slowest.get("job_id"),
+                "gap": task["scheduled"] - predecessor["completed"]
+                if predecessor
+                else None,
+                **{component: slowest.get(component) for component in COMPONENTS},
+            }
+        )
+        key = task["predecessor"]
+    return list(reversed(path))
+
+
+def execution_span(events):
+
+    """
+    Seconds from the start to the end of the execution, None while running
+    """
+
+    ends = [event for event in events if event["type"] in TERMINAL_EXECUTION_EVENTS]
+    if not ends:
+        return None
+    return timestamp(ends[-1]["timestamp"]) - timestamp(events[0]["timestamp"])
+
+
+def report(events, jobs):
+
+    """
+    Latency breakdown of an execution: total, critical path and stage summary
+    """
+
+    tasks = breakdown(events, jobs)
+    path = critical_path(tasks)
+    return {
+        "execution": execution_span(events),
+        "critical_path": path,
+        # time of the critical path spent in each component, the step function
+        # overhead is its gaps plus orchestration and completion
+        "critical_path_totals": {
+            component: sum(step[component] or 0 for step in path)
+            for component in ("gap", "orchestration", "queue_wait", "run", "completion")
+        },
+        "stages": stage_summary(tasks),
+    }
+
+
+def seconds(value):
+
+    """
+    Duration for the report, - when unknown
+    """
+
+    return "-" if value is None else f"{value:.1f}s"
+
+
+def print_report(result):
+
+    """
+    Prints the result of report as tables
+    """
+
+    print(f"Execution: {seconds(result['execution'])}")
+    print("\nCritical path")
+    print(
+        f"{'state':32} {'gap':>9} {'orchestr':>9} {'queue':>9} {'run':>9} "
+        + f"{'complete':>9}"
+    )
+    for step in result["critical_path"]:
+        print(
+            f"{step['state'] or '-':32} {seconds(step['gap']):>9} "
+            + f"{seconds(step['orchestration']):>9} {seconds(step['queue_wait']):>9} "
+            + f"{seconds(step['run']):>9} {seconds(step['completion']):>9}"
+        )
+    totals = result["critical_path_totals"]
+    print(
+        f"{'total':32} {seconds(totals['gap']):>9} "
+        + f"{seconds(totals['orchestration']):>9} {seconds(totals['queue_wait']):>9} "
+        + f"{seconds(totals['run']):>9} {seconds(totals['completion']):>9}"
+    )
+
+    for state, stage in result["stages"].items():
+        straggler = f"{stage['straggler']:.2f}x" if stage["straggler"] else "-"
+        print(
+            f"\n{state}: {stage['items']} items, span {seconds(stage['span'])}, "
+            + f"straggler {straggler}"
+        )
+        columns = [f"p{rank}" for rank in PERCENTILES] + ["max"]
+        print(f"{'':14}" + "".join(f"{column:>9}" for column in columns))
+        for component in COMPONENTS:
+            print(
+                f"{component:14}"
+                + "".join(f"{seconds(stage[component][column]):>9}" for column in columns)
+            )
+
+
+def main():
+
+    """
+    Breaks down the latency of an execution of the step function of a branch into
+    step function overhead, batch queue wait and container run, per item and per
+    stage. Works offline on the history and jobs recorded with --record
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--branch", type=str, help="branch name")
+    parser.add_argument("-e", "--execution", type=str, help="execution name")
+    parser.add_argument(
+        "-a", "--account", type=str, help="aws account, defaults to the caller's"
+    )
+    parser.add_argument(
+        "-hf", "--history-file", type=str, help="recorded execution history json"
+    )
+    parser.add_argument("-jf", "--jobs-file", type=str, help="recorded batch jobs json")
+    parser.add_argument(
+        "-r", "--record", type=str, help="directory to record history and jobs to"
+    )
+    parser.add_argument("-o", "--output", type=str, help="json file of the report")
+    args = parser.parse_args()
+
+    if args.history_file:
+        with open(args.history_file) as stream:
+            events = json.load(stream)
+    elif args.branch and args.execution:
+        account = args.account or STS_CLIENT.get_caller_identity()["Account"]
+        arn = execution_arn(args.branch, args.execution, account)
+        events = get_execution_history(arn)
+    else:
+        parser.error("either --history-file or --branch and --execution are required")
+
+    if args.jobs_file:
+        with open(args.jobs_file) as stream:
+            jobs = json.load(stream)
+    else:
+        job_ids = [task["job_id"] for task in batch_tasks(events).values()]
+        jobs = describe_jobs([job_id for job_id in job_ids if job_id])
+
+    if args.record:
+        os.makedirs(args.record, exist_ok=True)
+        with open(os.path.join(args.record, "history.json"), "w") as stream:
+            json.dump(events, stream, default=str)
+        with open(os.path.join(args.record, "jobs.json"), "w") as stream:
+            json.dump(jobs, stream)
+
+    result = report(events, jobs)
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as stream:
+            json.dump(result, stream, indent=2)
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+
+    main()
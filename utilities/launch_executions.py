@@ -0,0 +1,435 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# the pipeline specs are read like the stack reads them, see aws/cdk_deployment
+AWS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../aws")
+sys.path.insert(0, AWS_DIRECTORY)
+
+from cdk_deployment.pipeline_spec import (  # noqa: E402
+    load_pipeline_spec,
+    normalize_stages,
+)
+
+# throttling is handled by the launcher, not retried by botocore
+SFN_CONFIG = Config(retries={"max_attempts": 1, "mode": "standard"})
+SFN_CLIENT = boto3.client("stepfunctions", "eu-west-1", config=SFN_CONFIG)
+STS_CLIENT = boto3.client("sts", "eu-west-1")
+
+THROTTLING_ERRORS = ("ThrottlingException", "TooManyRequestsException")
+# the rate is cut by BACKOFF_FACTOR on throttling and grows back by RECOVERY_STEP of
+# the target rate on every success
+BACKOFF_FACTOR = 0.5
+RECOVERY_STEP = 0.05
+MAX_BACKOFF_SECONDS = 20
+MAX_ATTEMPTS = 8
+# execution names are at most 80 characters
+MAX_NAME_LENGTH = 80
+
+
+class TokenBucket:
+
+    """
+    Rate limiter shared by the launching threads, up to burst calls at once and
+    rate calls per second on average. slow_down and speed_up adapt the rate between
+    a tenth of the target and the target
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=time.sleep):
+
+        self.target_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+
+        """
+        Blocks until a call is allowed
+        """
+
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            self.sleep(delay)
+
+    def slow_down(self):
+
+        """
+        Halves the rate, after a throttled call
+        """
+
+        with self._lock:
+            self.rate = max(self.target_rate / 10, self.rate * BACKOFF_FACTOR)
+
+    def speed_up(self):
+
+        """
+        Grows the rate back towards the target, after a successful call
+        """
+
+        with self._lock:
+            self.rate = min(
+                self.target_rate, self.rate + self.target_rate * RECOVERY_STEP
+            )
+
+
+def is_item(value, sized=False):
+
+    """
+    Whether value is a step 2 or 3 item, a parameter or, when sized, a parameter
+    with its size
+    """
+
+    if isinstance(value, str):
+        return True
+    return (
+        sized
+        and isinstance(value, dict)
+        and isinstance(value.get("parameter"), str)
+        and isinstance(value.get("size", 0), (int, float))
+        and not isinstance(value.get("size"), bool)
+    )
+
+
+def input_keys(stages=None):
+
+    """
+    Keys of the parameters of an execution input, with whether each one holds a
+    single parameter, a list of items or the key of a manifest: step1_parameter,
+    step2_parameters and step3_parameters, or the keys of the stages of a pipeline
+    spec
+    """
+
+    if stages is None:
+        return [
+            ("step1_parameter", "parameter"),
+            ("step2_parameters", "items"),
+            ("step3_parameters", "items"),
+        ]
+    kinds = {"single": "parameter", "distributed": "manifest"}
+    return [
+        (stage["parameters"], kinds.get(stage["fan_out_mode"], "items"))
+        for stage in stages
+    ]
+
+
+def validate_input(execution_input, topology="barrier", tiers=False, stages=None):
+
+    """
+    Errors of an execution input against the documented format, see README.md.
+    Parameters are strings, or s3:// claim checks. With resource tiers, the items of
+    step 2 and 3, or of the stages, can also be objects with the parameter and its
+    size. A step with the distributed fan out has the key of its manifest instead of
+    its items. The pipelined topology pairs the step 2 and 3 items by position,
+    both lists must have the same length. With the normalized stages of a pipeline
+    spec the keys are those of the stages instead, see input_keys
+    """
+
+    if not isinstance(execution_input, dict) or not isinstance(
+        execution_input.get("parameters"), dict
+    ):
+        return ["parameters must be an object"]
+
+    parameters = execution_input["parameters"]
+    errors = []
+    for key, kind in input_keys(stages):
+        if kind == "parameter":
+            if not isinstance(parameters.get(key), str):
+                errors.append(f"{key} must be a string")
+            continue
+        # the default steps take either their items or the key of a manifest
+        manifest_key = (
+            key if kind == "manifest" else key.replace("_parameters", "_manifest")
+        )
+        if kind == "manifest" or (stages is None and manifest_key in parameters):
+            if not isinstance(parameters.get(manifest_key), str):
+                errors.append(f"{manifest_key} must be the key of a manifest")
+            continue
+        values = parameters.get(key)
+        sized = tiers
+        if not isinstance(values, list):
+            errors.append(f"{key} must be a list")
+        elif not all(is_item(value, sized) for value in values):
+            errors.append(
+                f"{key} must only contain strings or objects with a string parameter "
+                + "and a numeric size"
+                if sized
+                else f"{key} must only contain strings"
+            )
+    if topology == "pipelined" and not errors:
+        step2_items = parameters.get("step2_parameters")
+        step3_items = parameters.get("step3_parameters")
+        if step2_items is None or step3_items is None:
+            errors.append("the pipelined topology reads no manifest")
+        elif len(step2_items) != len(step3_items):
+            errors.append(
+                "step2_parameters and step3_parameters must have the same length with "
+                + "the pipelined topology"
+            )
+    return errors
+
+
+def read_inputs(path):
+
+    """
+    Line number and execution input of every non empty line of a jsonl file, the
+    input is None when the line isn't json
+    """
+
+    with open(path) as stream:
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError:
+                yield line_number, None
+
+
+def execution_name(prefix, line_number, execution_input):
+
+    """
+    Name of the execution of a line, the same for the same input so that relaunching
+    it doesn't start a second execution
+    """
+
+    digest = hashlib.sha256(
+        json.dumps(execution_input, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:16]
+    suffix = f"-{line_number}-{digest}"
+    return prefix[: MAX_NAME_LENGTH - len(suffix)] + suffix
+
+
+class Checkpoint:
+
+    """
+    Lines already launched, appended to a file as line number and execution arn so
+    that an interrupted launch resumes where it stopped
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        try:
+            with open(path) as stream:
+                self.done = {int(line.split("\t")[0]) for line in stream if line.strip()}
+        except FileNotFoundError:
+            pass
+
+    def record(self, line_number, execution_arn):
+
+        """
+        Marks a line as launched
+        """
+
+        with self._lock:
+            with open(self.path, "a") as stream:
+                stream.write(f"{line_number}\t{execution_arn}\n")
+            self.done.add(line_number)
+
+
+def start_execution(
+    state_machine_arn, name, execution_input, bucket, sfn_client=SFN_CLIENT
+):
+
+    """
+    Starts an execution within the rate of bucket. Throttled calls slow the bucket
+    down and are retried with exponential backoff and jitter, waited with the sleep
+    of bucket. Returns the arn of the execution, None when an execution of the same
+    name already exists
+    """
+
+    for attempt in range(MAX_ATTEMPTS):
+        bucket.acquire()
+        try:
+            response = sfn_client.start_execution(
+                stateMachineArn=state_machine_arn,
+                name=name,
+                input=json.dumps(execution_input),
+            )
+        except ClientError as error:
+            code = error.response["Error"]["Code"]
+            if code == "ExecutionAlreadyExists":
+                return None
+            if code not in THROTTLING_ERRORS:
+                raise
+            bucket.slow_down()
+            bucket.sleep(random.uniform(0, min(MAX_BACKOFF_SECONDS, 0.1 * 2**attempt)))
+            continue
+        bucket.speed_up()
+        return response["executionArn"]
+
+    raise Exception(f"Execution {name} throttled {MAX_ATTEMPTS} times")
+
+
+def main():
+
+    """
+    Validates then starts an execution per line of a jsonl file, concurrently and
+    within a rate limit, resuming from a checkpoint file
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i", "--input", type=str, help="jsonl file of execution inputs", required=True
+    )
+    parser.add_argument("-b", "--branch", type=str, help="branch name")
+    parser.add_argument("-sm", "--state-machine-arn", type=str, help="overrides --branch")
+    parser.add_argument(
+        "-c",
+        "--checkpoint",
+        type=str,
+        help="checkpoint file, defaults to the input followed by .checkpoint",
+    )
+    parser.add_argument(
+        "-n", "--name-prefix", type=str, default="launch", help="execution name prefix"
+    )
+    parser.add_argument(
+        "-r", "--rate", type=float, default=20, help="executions started per second"
+    )
+    parser.add_argument("--burst", type=int, default=20, help="token bucket size")
+    parser.add_argument(
+        "-t", "--threads", type=int, default=16, help="StartExecution calls in flight"
+    )
+    parser.add_argument(
+        "--topology",
+        type=str,
+        choices=("barrier", "pipelined"),
+        default="barrier",
+        help="topology of the stack, as the cdk context",
+    )
+    parser.add_argument(
+        "--tiers",
+        action="store_true",
+        help="the stack has resource tiers, the items of a map can have a size",
+    )
+    parser.add_argument(
+        "-ps",
+        "--pipeline",
+        type=str,
+        help="pipeline spec of the stack, as the cdk context",
+    )
+    parser.add_argument(
+        "--skip-invalid", action="store_true", help="launch the valid lines only"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="only validate the input")
+    parser.add_argument("--endpoint-url", type=str, help="eg a step functions stub")
+    args = parser.parse_args()
+
+    stages = None
+    if args.pipeline:
+        # like the stack, a pipeline spec excludes the pipelined topology
+        if args.topology != "barrier":
+            parser.error("a pipeline spec requires the barrier topology")
+        stages = normalize_stages(load_pipeline_spec(args.pipeline))
+
+    # every line is validated before anything is started
+    invalid = set()
+    total = 0
+    for line_number, execution_input in read_inputs(args.input):
+        total += 1
+        if execution_input is None:
+            errors = ["not valid json"]
+        else:
+            errors = validate_input(execution_input, args.topology, args.tiers, stages)
+        if errors:
+            invalid.add(line_number)
+            print(f"Line {line_number}: {', '.join(errors)}")
+    print(f"{total - len(invalid)} valid and {len(invalid)} invalid lines")
+    if args.dry_run or (invalid and not args.skip_invalid):
+        sys.exit(0 if args.dry_run else 1)
+
+    if args.state_machine_arn:
+        state_machine_arn = args.state_machine_arn
+    elif args.branch:
+        account = STS_CLIENT.get_caller_identity()["Account"]
+        state_machine_arn = (
+            f"arn:aws:states:eu-west-1:{account}:stateMachine:"
+            + f"csfe-{args.branch}-stepfunction"
+        )
+    else:
+        parser.error("either --branch or --state-machine-arn is required")
+    sfn_client = SFN_CLIENT
+    if args.endpoint_url:
+        sfn_client = boto3.client(
+            "stepfunctions",
+            "eu-west-1",
+            config=SFN_CONFIG,
+            endpoint_url=args.endpoint_url,
+        )
+
+    checkpoint = Checkpoint(args.checkpoint or f"{args.input}.checkpoint")
+    bucket = TokenBucket(args.rate, args.burst)
+    counts = {"started": 0, "existing": 0, "failed": 0}
+    start = time.monotonic()
+
+    def launch(line_number, execution_input):
+        name = execution_name(args.name_prefix, line_number, execution_input)
+        execution_arn = start_execution(
+            state_machine_arn, name, execution_input, bucket, sfn_client
+        )
+        checkpoint.record(line_number, execution_arn or f"existing:{name}")
+        return execution_arn
+
+    def collect(done):
+        for future in done:
+            line_number = futures.pop(future)
+            try:
+                counts["started" if future.result() else "existing"] += 1
+            except Exception as error:
+                counts["failed"] += 1
+                print(f"Line {line_number} failed: {error}")
+
+    # a bounded number of lines is in flight so that large files aren't read at once
+    futures = {}
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for line_number, execution_input in read_inputs(args.input):
+            if line_number in invalid or line_number in checkpoint.done:
+                continue
+            if len(futures) >= 2 * args.threads:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                collect(done)
+            futures[pool.submit(launch, line_number, execution_input)] = line_number
+        collect(wait(futures).done)
+
+    elapsed = time.monotonic() - start
+    print(
+        f"Started {counts['started']} executions in {elapsed:.1f}s "
+        + f"({counts['started'] / max(elapsed, 1e-9):.1f}/s), "
+        + f"{counts['existing']} already existed, {counts['failed']} failed, "
+        + f"{len(checkpoint.done) - counts['started'] - counts['existing']} skipped "
+        + "from the checkpoint"
+    )
+
+    # failed lines aren't checkpointed, running again retries them
+    sys.exit(1 if counts["failed"] else 0)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import json
+import sys
+import uuid
+
+import boto3
+
+S3_CLIENT = boto3.client("s3", "eu-west-1")
+
+
+def offload(parameters, bucket, prefix, s3_client=S3_CLIENT):
+
+    """
+    Uploads every parameter of an execution input to S3 and returns the same input
+    where each parameter is replaced by its s3:// claim check
+    """
+
+    def upload(parameter, key):
+        s3_client.put_object(Bucket=bucket, Key=key, Body=str(parameter).encode("utf-8"))
+        return f"s3://{bucket}/{key}"
+
+    offloaded = {
+        "step1_parameter": upload(parameters["step1_parameter"], f"{prefix}/step1/0")
+    }
+    for step in ("step2", "step3"):
+        offloaded[f"{step}_parameters"] = [
+            upload(parameter, f"{prefix}/{step}/{index}")
+            for index, parameter in enumerate(parameters[f"{step}_parameters"])
+        ]
+
+    return {"parameters": offloaded}
+
+
+def main():
+
+    """
+    Turns an execution input into an input made of claim checks, to be used with a
+    step function deployed with offload_payloads
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i", "--input", type=str, help="execution input json file", required=True
+    )
+    parser.add_argument(
+        "-bk", "--bucket", type=str, help="payload bucket name", required=True
+    )
+    parser.add_argument(
+        "-n", "--name", type=str, help="name of the input, defaults to a random uuid"
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, help="where to write the new execution input"
+    )
+    args = parser.parse_args()
+    name = args.name or str(uuid.uuid4())
+
+    with open(args.input) as stream:
+        parameters = json.load(stream)["parameters"]
+
+    offloaded = offload(parameters, args.bucket, f"inputs/{name}")
+
+    if args.output:
+        with open(args.output, "w") as stream:
+            json.dump(offloaded, stream, indent=2)
+        print(f"Offloaded input {name} written to {args.output}")
+    else:
+        print(json.dumps(offloaded, indent=2))
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+
+    main()
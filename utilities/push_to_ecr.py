@@ -1,21 +1,194 @@
 import argparse
 import base64
+import hashlib
 import json
 import os
+import subprocess
 import sys
+import time
 from pathlib import Path
 
 import boto3
 import docker
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(CURRENT_DIR, "../source")
 ECR_CLIENT = boto3.client("ecr", "eu-west-1")
 
+# images are tagged with the digest of their build context, a context already in the
+# registry is neither built nor pushed again
+CONTEXT_TAG_PREFIX = "ctx-"
+# tag of the buildkit layer cache in the repository
+CACHE_TAG = "buildcache"
+IGNORED_DIRECTORIES = ("__pycache__",)
+IGNORED_SUFFIXES = (".pyc",)
+
+
+def context_digest(path=SOURCE_DIR):
+
+    """
+    sha-256 of the build context, the Dockerfile included: relative path and
+    content of every file, in a stable order
+    """
+
+    digest = hashlib.sha256()
+    for root, directories, files in os.walk(path):
+        directories[:] = sorted(d for d in directories if d not in IGNORED_DIRECTORIES)
+        for name in sorted(files):
+            if name.endswith(IGNORED_SUFFIXES):
+                continue
+            file_path = os.path.join(root, name)
+            relative = os.path.relpath(file_path, path).replace(os.sep, "/")
+            with open(file_path, "rb") as stream:
+                content = hashlib.sha256(stream.read()).digest()
+            digest.update(relative.encode("utf-8") + b"\0" + content)
+    return digest.hexdigest()
+
+
+def ecr_credentials():
+
+    """
+    Registry, username and password of ECR
+    """
+
+    token = ECR_CLIENT.get_authorization_token()
+    username, password = (
+        base64.b64decode(token["authorizationData"][0]["authorizationToken"])
+        .decode()
+        .split(":")
+    )
+    registry = token["authorizationData"][0]["proxyEndpoint"].replace("https://", "")
+    return registry, username, password
+
+
+def registry_digest(docker_client, reference, auth_config=None):
+
+    """
+    Digest of the manifest of reference in the registry, None when missing
+    """
+
+    try:
+        return docker_client.images.get_registry_data(
+            reference, auth_config=auth_config
+        ).id
+    except docker.errors.NotFound:
+        return None
+    except docker.errors.APIError as error:
+        if "manifest unknown" in str(error) or "not found" in str(error):
+            return None
+        raise
+
+
+def push_summary(push_stream):
+
+    """
+    Consumes the stream of a push and returns the layers pushed, the layers already
+    in the registry and the bytes pushed
+    """
+
+    statuses, sizes = {}, {}
+    for line in push_stream:
+        if "error" in line:
+            raise Exception(f"Push failed: {line['error']}")
+        if "id" not in line:
+            continue
+        statuses[line["id"]] = line.get("status", "")
+        total = line.get("progressDetail", {}).get("total")
+        if total:
+            sizes[line["id"]] = total
+    pushed = [layer for layer, status in statuses.items() if status == "Pushed"]
+    existing = [layer for layer, status in statuses.items() if "exists" in status]
+    return len(pushed), len(existing), sum(sizes.get(layer, 0) for layer in pushed)
+
+
+def build_with_buildx(reference, repository):
+
+    """
+    Builds and pushes the image with buildkit, importing and exporting the layer
+    cache from the registry so that it survives across machines
+    """
+
+    cache = f"type=registry,ref={repository}:{CACHE_TAG}"
+    command = [
+        "docker",
+        "buildx",
+        "build",
+        SOURCE_DIR,
+        "--tag",
+        reference,
+        "--push",
+        "--cache-from",
+        cache,
+        "--cache-to",
+        f"{cache},mode=max,image-manifest=true,oci-mediatypes=true",
+    ]
+    completed = subprocess.run(
+        command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True
+    )
+    if completed.returncode:
+        print(completed.stdout)
+        raise Exception(f"docker buildx build exited with {completed.returncode}")
+    cached = completed.stdout.count("CACHED")
+    print(f"  built and pushed with buildx, {cached} cached steps")
+
+
+def build_with_docker(docker_client, repository, tag, branch, auth_config):
+
+    """
+    Builds the image with the docker daemon, reusing the layers of the image of the
+    branch, and pushes it
+    """
+
+    try:
+        docker_client.images.pull(repository, tag=branch, auth_config=auth_config)
+        cache_from = [f"{repository}:{branch}"]
+    except docker.errors.APIError:
+        cache_from = []
+    docker_client.images.build(
+        path=SOURCE_DIR, tag=f"{repository}:{tag}", rm=True, cache_from=cache_from
+    )
+    pushed, existing, size = push_summary(
+        docker_client.images.push(
+            repository, tag=tag, stream=True, decode=True, auth_config=auth_config
+        )
+    )
+    print(
+        f"  pushed {pushed} layers ({size / 1e6:.1f} MB), "
+        + f"{existing} already in the registry"
+    )
+
+
+def retag(docker_client, repository, repository_name, source_tag, tag, auth_config):
+
+    """
+    Points tag to the image of source_tag. In ECR only the manifest is copied,
+    otherwise the image is pulled, tagged and pushed, its layers are already there
+    """
+
+    if auth_config:
+        image = ECR_CLIENT.batch_get_image(
+            repositoryName=repository_name, imageIds=[{"imageTag": source_tag}]
+        )["images"][0]
+        media_type = image.get("imageManifestMediaType")
+        ECR_CLIENT.put_image(
+            repositoryName=repository_name,
+            imageManifest=image["imageManifest"],
+            imageTag=tag,
+            **({"imageManifestMediaType": media_type} if media_type else {}),
+        )
+        return
+
+    image = docker_client.images.pull(repository, tag=source_tag)
+    image.tag(repository, tag=tag)
+    push_summary(docker_client.images.push(repository, tag=tag, stream=True, decode=True))
+
 
 def main():
 
     """
-    Push an image to ECR
+    Push an image to ECR, or to --registry, tagged with the digest of its build
+    context. Nothing is built or pushed when the registry already has that digest and
+    the branch tag is only moved when it points to another image
 
     See: https://github.com/AlexIoannides/py-docker-aws-example-project
     """
@@ -25,71 +198,84 @@ def main():
     parser.add_argument(
         "-er", "--ecrrepository", type=str, help="aws ecr repo name", required=True
     )
+    parser.add_argument(
+        "-r", "--registry", type=str, help="plain registry, eg localhost:5000, not ECR"
+    )
+    parser.add_argument(
+        "--buildx", action="store_true", help="build with buildkit and registry cache"
+    )
+    parser.add_argument("-y", "--yes", action="store_true", help="don't ask to confirm")
     args = parser.parse_args()
     branch = str(args.branch)
     ecrrepository = str(args.ecrrepository)
 
     print(f"Pushing branch {branch} to repo {ecrrepository}")
-    continue_flag = input("Do you want to continue (y/n)?")
-    if continue_flag == "y":
-
-        # reset authentication in config file to take care of the known bug
-        # where existing stale creds cause login to fail
-        # https://github.com/docker/docker-py/issues/2256
-        config = Path(Path.home() / ".docker" / "config.json")
-        try:
-            original = config.read_text()
-        except Exception:
-            original = None
-        try:
-            # build Docker image
-            docker_client = docker.from_env()
-            image_tag = f"{ecrrepository}:{branch}"
-            image, build_log = docker_client.images.build(
-                path=os.path.join(CURRENT_DIR, "../source"),
-                tag=image_tag,
-                rm=True,
-            )
-
-            # get aws tokens
-            token = ECR_CLIENT.get_authorization_token()
-            ecr_username, ecr_password = (
-                base64.b64decode(token["authorizationData"][0]["authorizationToken"])
-                .decode()
-                .split(":")
-            )
-            ecr_url = token["authorizationData"][0]["proxyEndpoint"]
-            ecr_registry = ecr_url.replace("https://", "")
-
-            # reset authentication in config file to take care of the known bug
-            # where existing stale creds cause login to fail
-            # https://github.com/docker/docker-py/issues/2256
-            as_json = json.loads(original)
+    continue_flag = "y" if args.yes else input("Do you want to continue (y/n)?")
+    if continue_flag != "y":
+        print("Aborted")
+        sys.exit(0)
+
+    start = time.monotonic()
+    tag = CONTEXT_TAG_PREFIX + context_digest()[:32]
+    docker_client = docker.from_env()
+    # reset authentication in config file to take care of the known bug
+    # where existing stale creds cause login to fail
+    # https://github.com/docker/docker-py/issues/2256
+    config = Path(Path.home() / ".docker" / "config.json")
+    try:
+        original = config.read_text()
+    except Exception:
+        original = None
+    try:
+        if args.registry:
+            registry, auth_config = args.registry, None
+        else:
+            registry, username, password = ecr_credentials()
+            auth_config = {"username": username, "password": password}
+            as_json = json.loads(original or "{}")
             as_json.pop("auths", None)
             as_json.pop("credsStore", None)
+            config.parent.mkdir(exist_ok=True)
             config.write_text(json.dumps(as_json))
+            docker_client.login(username=username, password=password, registry=registry)
+            if args.buildx:
+                # buildx reads the credentials from the config file
+                subprocess.run(
+                    ["docker", "login", "-u", username, "--password-stdin", registry],
+                    input=password,
+                    universal_newlines=True,
+                    stdout=subprocess.DEVNULL,
+                    check=True,
+                )
+        repository = f"{registry}/{ecrrepository}"
 
-            # get Docker to login/authenticate with ECR
-            docker_client.login(
-                username=ecr_username, password=ecr_password, registry=ecr_registry
-            )
-            # tag image for AWS ECR
-            ecr_repo_name = "{}/{}".format(ecr_registry, image_tag)
-            image.tag(ecr_repo_name, tag=branch)
-
-            # push image to AWS ECR
-            for line in docker_client.images.push(
-                ecr_repo_name, tag=branch, stream=True, decode=True
-            ):
-                print(line)
-
-            print("Built and pushed")
-        finally:
-            if original:
-                config.write_text(original)
-
-    else:
-        print("Aborted")
+        digest = registry_digest(docker_client, f"{repository}:{tag}", auth_config)
+        if digest:
+            print(f"Context {tag} already in the registry, skipping build and push")
+        else:
+            print(f"Building context {tag}")
+            if args.buildx:
+                build_with_buildx(f"{repository}:{tag}", repository)
+            else:
+                build_with_docker(docker_client, repository, tag, branch, auth_config)
+            digest = registry_digest(docker_client, f"{repository}:{tag}", auth_config)
+
+        branch_digest = registry_digest(
+            docker_client, f"{repository}:{branch}", auth_config
+        )
+        if branch_digest == digest:
+            print(f"Tag {branch} already points to {tag}")
+        else:
+            retag(docker_client, repository, ecrrepository, tag, branch, auth_config)
+            print(f"Tag {branch} moved to {tag}")
+    finally:
+        if original:
+            config.write_text(original)
+        elif not args.registry and config.exists():
+            # the config only held the credentials written above
+            config.unlink()
+
+    print(f"Done in {time.monotonic() - start:.1f}s, image digest {digest}")
 
     sys.exit(0)
 
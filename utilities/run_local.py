@@ -0,0 +1,787 @@
+import argparse
+import copy
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../source")
+# default environment of the image, see source/Dockerfile
+IMAGE_ENVIRONMENT = {"PARAMETER": "parameter", "PARAMETERS": "", "MANIFEST": ""}
+# runs lambda_handler of source/main.py on the event of argv 1 and writes its result to
+# the file of argv 3, like the lambda runtime would with the request id of argv 2
+LAMBDA_RUNNER = (
+    "import json, sys, types, main; "
+    + "context = types.SimpleNamespace(aws_request_id=sys.argv[2]); "
+    + "result = main.lambda_handler(json.loads(sys.argv[1]), context); "
+    + "open(sys.argv[3], 'w').write(json.dumps(result))"
+)
+# threads running the iterations of a map, the jobs themselves are bounded by workers
+MAP_THREADS = 256
+PATH_TOKENS = re.compile(r"\.([^.\[]+)|\[(\d+)\]")
+HASH_ALGORITHMS = {
+    "MD5": hashlib.md5,
+    "SHA-1": hashlib.sha1,
+    "SHA-256": hashlib.sha256,
+    "SHA-384": hashlib.sha384,
+    "SHA-512": hashlib.sha512,
+}
+
+
+def now_timestamp():
+
+    """
+    Current time as an Amazon States Language timestamp
+    """
+
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def parse_timestamp(value):
+
+    """
+    datetime of an Amazon States Language timestamp
+    """
+
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def get_path(data, path, context):
+
+    """
+    Value at a json path, $$ paths are resolved against the context object. Only
+    the dotted and indexed paths the state machine uses are supported
+    """
+
+    if path.startswith("$$"):
+        data, path = context, path[1:]
+    for key, index in PATH_TOKENS.findall(path[1:].replace(".[", "[")):
+        data = data[int(index)] if index else data[key]
+    return data
+
+
+def set_path(data, path, value):
+
+    """
+    Copy of data with value set at a json path, like ResultPath. None discards value
+    and $ replaces data
+    """
+
+    if path is None:
+        return data
+    if path == "$":
+        return value
+    data = copy.deepcopy(data)
+    target = data
+    tokens = PATH_TOKENS.findall(path[1:])
+    for key, index in tokens[:-1]:
+        target = target[int(index)] if index else target.setdefault(key, {})
+    key, index = tokens[-1]
+    target[int(index) if index else key] = value
+    return data
+
+
+def split_arguments(arguments):
+
+    """
+    Top level arguments of an intrinsic function call
+    """
+
+    parts, current, depth, quoted, escaped = [], "", 0, False, False
+    for character in arguments:
+        if escaped:
+            current, escaped = current + character, False
+            continue
+        if character == "\\":
+            current, escaped = current + character, True
+            continue
+        if character == "'":
+            quoted = not quoted
+        elif not quoted and character == "(":
+            depth += 1
+        elif not quoted and character == ")":
+            depth -= 1
+        elif not quoted and not depth and character == ",":
+            parts.append(current.strip())
+            current = ""
+            continue
+        current += character
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def format_string(template, *values):
+
+    """
+    States.Format, every {} takes the next value
+    """
+
+    pieces = re.split(r"(?<!\\)\{\}", template)
+    if len(pieces) != len(values) + 1:
+        raise Exception("States.IntrinsicFailure: wrong number of States.Format values")
+    result = pieces[0]
+    for value, piece in zip(values, pieces[1:]):
+        result += (value if isinstance(value, str) else json.dumps(value)) + piece
+    return re.sub(r"\\(.)", r"\1", result)
+
+
+INTRINSICS = {
+    "States.Format": format_string,
+    "States.JsonToString": lambda value: json.dumps(value, separators=(",", ":")),
+    "States.StringToJson": json.loads,
+    "States.Array": lambda *values: list(values),
+    "States.ArrayPartition": lambda array, size: [
+        array[start : start + int(size)] for start in range(0, len(array), int(size))
+    ],
+    "States.ArrayLength": len,
+    "States.ArrayGetItem": lambda array, index: array[int(index)],
+    "States.Hash": lambda data, algorithm: HASH_ALGORITHMS[algorithm](
+        data.encode("utf-8")
+    ).hexdigest(),
+    "States.UUID": lambda: str(uuid.uuid4()),
+}
+
+
+def evaluate(expression, data, context):
+
+    """
+    Value of the right hand side of a .$ field: a json path or an intrinsic function
+    whose arguments are paths, literals or intrinsic functions
+    """
+
+    expression = expression.strip()
+    if expression.startswith("States."):
+        name = expression[: expression.index("(")]
+        if name not in INTRINSICS:
+            raise Exception(f"Unsupported intrinsic function {name}")
+        arguments = split_arguments(expression[expression.index("(") + 1 : -1])
+        return INTRINSICS[name](*(evaluate(arg, data, context) for arg in arguments))
+    if expression.startswith("'"):
+        return expression[1:-1]
+    if expression.startswith("$"):
+        return get_path(data, expression, context)
+    return json.loads(expression)
+
+
+def resolve(template, data, context):
+
+    """
+    Parameters, ResultSelector or ItemSelector template applied to data
+    """
+
+    if isinstance(template, dict):
+        return {
+            key[:-2]
+            if key.endswith(".$")
+            else key: evaluate(value, data, context)
+            if key.endswith(".$")
+            else resolve(value, data, context)
+            for key, value in template.items()
+        }
+    if isinstance(template, list):
+        return [resolve(value, data, context) for value in template]
+    return template
+
+
+COMPARISONS = {
+    "StringEquals": lambda a, b: a == b,
+    "StringLessThan": lambda a, b: a < b,
+    "StringGreaterThan": lambda a, b: a > b,
+    "StringLessThanEquals": lambda a, b: a <= b,
+    "StringGreaterThanEquals": lambda a, b: a >= b,
+    "StringMatches": lambda a, b: fnmatch.fnmatchcase(a, b),
+    "NumericEquals": lambda a, b: a == b,
+    "NumericLessThan": lambda a, b: a < b,
+    "NumericGreaterThan": lambda a, b: a > b,
+    "NumericLessThanEquals": lambda a, b: a <= b,
+    "NumericGreaterThanEquals": lambda a, b: a >= b,
+    "BooleanEquals": lambda a, b: a == b,
+    "TimestampEquals": lambda a, b: parse_timestamp(a) == parse_timestamp(b),
+    "TimestampLessThan": lambda a, b: parse_timestamp(a) < parse_timestamp(b),
+    "TimestampGreaterThan": lambda a, b: parse_timestamp(a) > parse_timestamp(b),
+    "TimestampLessThanEquals": lambda a, b: parse_timestamp(a) <= parse_timestamp(b),
+    "TimestampGreaterThanEquals": lambda a, b: parse_timestamp(a) >= parse_timestamp(b),
+    "IsNull": lambda a, b: (a is None) == b,
+    "IsString": lambda a, b: isinstance(a, str) == b,
+    "IsNumeric": lambda a, b: (isinstance(a, (int, float)) and not isinstance(a, bool))
+    == b,
+    "IsBoolean": lambda a, b: isinstance(a, bool) == b,
+}
+
+
+def matches(rule, data, context):
+
+    """
+    Whether a Choice rule matches data
+    """
+
+    if "And" in rule:
+        return all(matches(branch, data, context) for branch in rule["And"])
+    if "Or" in rule:
+        return any(matches(branch, data, context) for branch in rule["Or"])
+    if "Not" in rule:
+        return not matches(rule["Not"], data, context)
+
+    try:
+        value, present = get_path(data, rule["Variable"], context), True
+    except (KeyError, IndexError, TypeError):
+        value, present = None, False
+    for operator, operand in rule.items():
+        if operator in ("Variable", "Next"):
+            continue
+        if operator == "IsPresent":
+            return present == operand
+        if not present:
+            raise Exception(f"States.Runtime: {rule['Variable']} is not present")
+        if operator.endswith("Path"):
+            operator, operand = operator[: -len("Path")], get_path(data, operand, context)
+        if operator not in COMPARISONS:
+            raise Exception(f"Unsupported choice operator {operator}")
+        return COMPARISONS[operator](value, operand)
+    raise Exception("Choice rule without operator")
+
+
+def load_state_machines(path):
+
+    """
+    Amazon States Language definitions of the state machines of the CloudFormation
+    template synthesized by cdk, by logical id, with their type. References and
+    definition substitutions are replaced by the logical ids of their resources
+    """
+
+    def token(part):
+        if isinstance(part, str):
+            return part
+        if "Ref" in part:
+            return part["Ref"]
+        if "Fn::GetAtt" in part:
+            return ".".join(part["Fn::GetAtt"])
+        return json.dumps(part)
+
+    with open(path) as stream:
+        document = json.load(stream)
+
+    state_machines = {}
+    for logical_id, resource in document.get("Resources", {}).items():
+        if resource["Type"] == "AWS::StepFunctions::StateMachine":
+            definition = resource["Properties"]["DefinitionString"]
+            if isinstance(definition, dict):
+                definition = "".join(token(part) for part in definition["Fn::Join"][1])
+            substitutions = resource["Properties"].get("DefinitionSubstitutions", {})
+            for name, value in substitutions.items():
+                definition = definition.replace("${" + name + "}", token(value))
+            state_machines[logical_id] = (
+                resource["Properties"].get("StateMachineType", "STANDARD"),
+                json.loads(definition),
+            )
+    return state_machines
+
+
+def load_definition(path):
+
+    """
+    Amazon States Language definition from an ASL json file or of the standard
+    state machine of the CloudFormation template synthesized by cdk
+    """
+
+    with open(path) as stream:
+        document = json.load(stream)
+    if "StartAt" in document:
+        return document
+
+    for kind, definition in load_state_machines(path).values():
+        if kind == "STANDARD":
+            return definition
+    raise Exception(f"No state machine definition in {path}")
+
+
+def load_express_definitions(path):
+
+    """
+    Definitions of the express state machines of the CloudFormation template
+    synthesized by cdk by logical id, ie the child executions of the express step
+    backend. None for an ASL json file
+    """
+
+    with open(path) as stream:
+        if "StartAt" in json.load(stream):
+            return {}
+
+    return {
+        logical_id: definition
+        for logical_id, (kind, definition) in load_state_machines(path).items()
+        if kind == "EXPRESS"
+    }
+
+
+class LocalExecution:
+
+    """
+    Interprets a state machine definition on this machine. Batch jobs run source/
+    main.py in a subprocess, like the CMD of the image, at most workers at a time.
+    environment is added to the one of the jobs, like the job definition does.
+    Functions of the lambda backend run in a subprocess too, and the child
+    executions of express_definitions in this process. Objects the execution writes
+    to S3, ie the manifests of the array jobs, are kept in memory, and so are the
+    results of the parameters of every job and function
+    """
+
+    def __init__(
+        self,
+        definition,
+        workers,
+        environment=None,
+        source=SOURCE_DIRECTORY,
+        verbose=False,
+        express_definitions=None,
+    ):
+
+        self.definition = definition
+        self.express_definitions = express_definitions or {}
+        self.environment = environment or {}
+        self.source = source
+        self.verbose = verbose
+        self._slots = threading.Semaphore(workers)
+        self._lock = threading.Lock()
+        # start and end of every job, to measure the orchestration overhead
+        self.job_intervals = []
+        # body of the objects written by the execution, by s3:// url
+        self.objects = {}
+        # results of the parameters, in the order the jobs and functions completed
+        self.records = []
+
+    def run(self, execution_input, name, definition=None):
+
+        """
+        Runs an execution, of definition or else of the state machine, and returns
+        its output
+        """
+
+        context = {
+            "Execution": {
+                "Id": f"local:{name}",
+                "Name": name,
+                "Input": execution_input,
+                "StartTime": now_timestamp(),
+            }
+        }
+        return self.run_states(definition or self.definition, execution_input, context)
+
+    def run_states(self, machine, data, context):
+
+        """
+        Runs the states of a state machine, or of a map iteration, from StartAt
+        """
+
+        name = machine["StartAt"]
+        while name is not None:
+            state = machine["States"][name]
+            state_context = dict(
+                context, State={"Name": name, "EnteredTime": now_timestamp()}
+            )
+            data, name = self.run_state(state, data, state_context)
+        return data
+
+    def run_state(self, state, data, context):
+
+        """
+        Runs a state, returns its output and the name of the next state
+        """
+
+        kind = state["Type"]
+        if kind == "Fail":
+            raise Exception(f"{state.get('Error')}: {state.get('Cause')}")
+
+        input_path = state["InputPath"] if "InputPath" in state else "$"
+        effective = get_path(data, input_path, context) if input_path else {}
+        if kind == "Choice":
+            next_state = next(
+                (
+                    rule["Next"]
+                    for rule in state["Choices"]
+                    if matches(rule, effective, context)
+                ),
+                state.get("Default"),
+            )
+            if next_state is None:
+                raise Exception("States.NoChoiceMatched")
+            return self.output(state, effective, context), next_state
+        if kind == "Succeed":
+            return self.output(state, effective, context), None
+        if kind == "Wait":
+            time.sleep(state.get("Seconds", 0))
+            return self.output(state, effective, context), self.next_state(state)
+
+        if kind == "Map":
+            result = self.run_map(state, effective, context)
+        else:
+            if kind == "Task":
+                context = dict(context, Task={"Token": str(uuid.uuid4())})
+            if "Parameters" in state:
+                effective = resolve(state["Parameters"], effective, context)
+            if kind == "Pass":
+                result = state.get("Result", effective)
+            elif kind == "Task":
+                result = self.run_task(state["Resource"], effective, context)
+            elif kind == "Parallel":
+                result = [
+                    self.run_states(branch, effective, context)
+                    for branch in state["Branches"]
+                ]
+            else:
+                raise Exception(f"Unsupported state type {kind}")
+
+        if "ResultSelector" in state:
+            result = resolve(state["ResultSelector"], result, context)
+        result_path = state["ResultPath"] if "ResultPath" in state else "$"
+        data = set_path(data, result_path, result)
+        return self.output(state, data, context), self.next_state(state)
+
+    def output(self, state, data, context):
+
+        """
+        Output of a state through its OutputPath
+        """
+
+        path = state["OutputPath"] if "OutputPath" in state else "$"
+        return get_path(data, path, context) if path else {}
+
+    def next_state(self, state):
+
+        """
+        Name of the state after state, None at the end
+        """
+
+        return None if state.get("End") else state["Next"]
+
+    def run_map(self, state, data, context):
+
+        """
+        Runs the iterations of a map on up to MaxConcurrency threads
+        """
+
+        if "ItemReader" in state:
+            raise Exception("Maps reading their items from S3 can't run locally")
+        items = get_path(data, state.get("ItemsPath", "$"), context)
+        iterator = state.get("Iterator") or state["ItemProcessor"]
+        selector = state.get("Parameters") or state.get("ItemSelector")
+
+        def iteration(indexed_item):
+            index, item = indexed_item
+            item_context = dict(context, Map={"Item": {"Index": index, "Value": item}})
+            item_input = resolve(selector, data, item_context) if selector else item
+            return self.run_states(iterator, item_input, item_context)
+
+        threads = min(state.get("MaxConcurrency") or len(items), MAP_THREADS)
+        with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+            return list(pool.map(iteration, enumerate(items)))
+
+    def run_task(self, resource, parameters, context):
+
+        """
+        Result of a task. Batch jobs, functions and express child executions run
+        locally, dynamodb lookups always miss and S3 objects are kept in memory
+        """
+
+        if "batch:submitJob" in resource:
+            return self.run_batch_job(parameters, resource)
+        if resource == "arn:aws:states:::lambda:invoke":
+            return self.run_function(parameters)
+        if resource.startswith("arn:aws:states:::states:startExecution.sync"):
+            return self.run_child_execution(parameters, resource)
+        if resource.endswith(":::dynamodb:getItem"):
+            return {}
+        if resource == "arn:aws:states:::aws-sdk:s3:putObject":
+            with self._lock:
+                self.objects[
+                    f"s3://{parameters['Bucket']}/{parameters['Key']}"
+                ] = parameters["Body"]
+            return {"ETag": f'"{hashlib.md5(parameters["Body"].encode()).hexdigest()}"'}
+        raise Exception(f"Unsupported task resource {resource}")
+
+    def run_batch_job(self, parameters, resource):
+
+        """
+        Runs a batch job, or the children of an array job, and returns what the
+        step function would get from the integration
+        """
+
+        job_id = str(uuid.uuid4())
+        environment = {
+            **os.environ,
+            **IMAGE_ENVIRONMENT,
+            **self.environment,
+            **{
+                variable["Name"]: variable["Value"]
+                for variable in parameters.get("ContainerOverrides", {}).get(
+                    "Environment", []
+                )
+            },
+            "AWS_BATCH_JOB_ID": job_id,
+        }
+        # the container would report to the step function itself
+        environment.pop("TASK_TOKEN", None)
+        # a manifest written by the execution is passed inline, the containers
+        # can't read it from S3
+        environment["MANIFEST"] = self.objects.get(
+            environment["MANIFEST"], environment["MANIFEST"]
+        )
+
+        size = parameters.get("ArrayProperties", {}).get("Size")
+        if size:
+            with ThreadPoolExecutor(max_workers=min(size, MAP_THREADS)) as pool:
+                exit_codes = list(
+                    pool.map(
+                        lambda index: self.run_container(
+                            parameters["JobName"],
+                            dict(environment, AWS_BATCH_JOB_ARRAY_INDEX=str(index)),
+                        ),
+                        range(size),
+                    )
+                )
+        else:
+            exit_codes = [self.run_container(parameters["JobName"], environment)]
+
+        if any(exit_codes):
+            raise Exception(
+                f"States.TaskFailed: job {parameters['JobName']} {job_id} exited with "
+                + ", ".join(str(code) for code in exit_codes)
+            )
+        if resource.endswith(".waitForTaskToken"):
+            return {"JobId": job_id, "Status": "SUCCEEDED"}
+        return {
+            "JobId": job_id,
+            "JobName": parameters["JobName"],
+            "JobQueue": parameters.get("JobQueue"),
+            "JobDefinition": parameters.get("JobDefinition"),
+            "Status": "SUCCEEDED",
+        }
+
+    def run_function(self, parameters):
+
+        """
+        Invokes a function of the lambda backend, ie lambda_handler of source/main.py
+        in a subprocess once a worker is free, and returns what the step function
+        would get from the integration
+        """
+
+        request_id = str(uuid.uuid4())
+        function_name = parameters["FunctionName"]
+        with tempfile.TemporaryDirectory() as directory:
+            result_path = os.path.join(directory, "result.json")
+            command = [
+                sys.executable,
+                "-c",
+                LAMBDA_RUNNER,
+                json.dumps(parameters.get("Payload", {})),
+                request_id,
+                result_path,
+            ]
+            with self._slots:
+                start = time.perf_counter()
+                completed = subprocess.run(
+                    command,
+                    cwd=self.source,
+                    env={**os.environ, **self.environment},
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    universal_newlines=True,
+                )
+                end = time.perf_counter()
+            with self._lock:
+                self.job_intervals.append((start, end))
+                if self.verbose or completed.returncode:
+                    for line in completed.stdout.splitlines():
+                        print(f"[{function_name}] {line}")
+            if completed.returncode:
+                raise Exception(
+                    f"States.TaskFailed: function {function_name} {request_id} failed"
+                )
+            with open(result_path) as stream:
+                payload = json.load(stream)
+        with self._lock:
+            self.records += payload["Records"]
+
+        return {"Payload": payload, "StatusCode": 200}
+
+    def run_child_execution(self, parameters, resource):
+
+        """
+        Runs a child execution of an express state machine of the template and
+        returns what the step function would get from the integration
+        """
+
+        state_machine = parameters["StateMachineArn"]
+        if state_machine not in self.express_definitions:
+            raise Exception(f"No express state machine {state_machine} in the template")
+        output = self.run(
+            parameters.get("Input", {}),
+            parameters.get("Name") or str(uuid.uuid4()),
+            self.express_definitions[state_machine],
+        )
+        return {
+            # .sync:2 returns the output as json, .sync as a string
+            "Output": output if resource.endswith(":2") else json.dumps(output),
+            "Status": "SUCCEEDED",
+        }
+
+    def run_container(self, job_name, environment):
+
+        """
+        Runs source/main.py with the arguments of the CMD of the image once a worker
+        is free, returns its exit code. The results are written with --output
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            records_path = os.path.join(directory, "records.jsonl")
+            command = [
+                sys.executable,
+                "main.py",
+                "-p",
+                environment["PARAMETER"],
+                "-ps",
+                environment["PARAMETERS"],
+                "-m",
+                environment["MANIFEST"],
+                "-o",
+                records_path,
+            ]
+            with self._slots:
+                start = time.perf_counter()
+                completed = subprocess.run(
+                    command,
+                    cwd=self.source,
+                    env=environment,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    universal_newlines=True,
+                )
+                end = time.perf_counter()
+            records = []
+            if os.path.exists(records_path):
+                with open(records_path) as stream:
+                    records = [json.loads(line) for line in stream if line.strip()]
+        with self._lock:
+            self.records += records
+            self.job_intervals.append((start, end))
+            if self.verbose or completed.returncode:
+                for line in completed.stdout.splitlines():
+                    print(f"[{job_name}] {line}")
+        return completed.returncode
+
+
+def summary(job_intervals, start, end):
+
+    """
+    Wall time, jobs, job seconds, peak of jobs running at the same time and
+    orchestration overhead, the time during which no job was running
+    """
+
+    changes = sorted(
+        [(job_start, 1) for job_start, _ in job_intervals]
+        + [(job_end, -1) for _, job_end in job_intervals]
+    )
+    running, peak, idle, last = 0, 0, 0.0, start
+    for moment, change in changes:
+        if not running:
+            idle += moment - last
+        running += change
+        peak = max(peak, running)
+        last = moment
+    idle += end - last
+    return {
+        "wall_seconds": end - start,
+        "jobs": len(job_intervals),
+        "job_seconds": sum(job_end - job_start for job_start, job_end in job_intervals),
+        "peak_jobs": peak,
+        "overhead_seconds": idle,
+    }
+
+
+def main():
+
+    """
+    Runs an execution of the step function on this machine, from its ASL definition
+    or from the template synthesized by cdk
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-d",
+        "--definition",
+        type=str,
+        help="ASL json, or template json under cdk.out",
+        required=True,
+    )
+    parser.add_argument(
+        "-i", "--input", type=str, help="execution input json file", required=True
+    )
+    parser.add_argument(
+        "-n", "--name", type=str, help="execution name, defaults to a random uuid"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="jobs running at the same time",
+    )
+    parser.add_argument(
+        "-e",
+        "--env",
+        type=str,
+        action="append",
+        default=[],
+        help="NAME=VALUE added to the environment of the jobs",
+    )
+    parser.add_argument("-s", "--source", type=str, default=SOURCE_DIRECTORY)
+    parser.add_argument("-v", "--verbose", action="store_true", help="print job output")
+    parser.add_argument("-o", "--output", type=str, help="json file of the output")
+    args = parser.parse_args()
+
+    with open(args.input) as stream:
+        execution_input = json.load(stream)
+    execution = LocalExecution(
+        load_definition(args.definition),
+        args.workers,
+        dict(variable.split("=", 1) for variable in args.env),
+        args.source,
+        args.verbose,
+        load_express_definitions(args.definition),
+    )
+
+    start = time.perf_counter()
+    try:
+        output = execution.run(execution_input, args.name or str(uuid.uuid4()))
+    except Exception as error:
+        print(f"Execution failed: {error}")
+        sys.exit(1)
+    stats = summary(execution.job_intervals, start, time.perf_counter())
+
+    print(json.dumps(output, indent=2))
+    print(
+        f"{stats['jobs']} jobs in {stats['wall_seconds']:.2f}s, "
+        + f"{stats['job_seconds']:.2f} job seconds, "
+        + f"at most {stats['peak_jobs']} at the same time, "
+        + f"{stats['overhead_seconds']:.2f}s without any job running"
+    )
+    if args.output:
+        with open(args.output, "w") as stream:
+            json.dump(output, stream, indent=2)
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,426 @@
+import argparse
+import heapq
+import itertools
+import json
+import math
+import os
+import random
+import sys
+from collections import deque
+
+# the defaults of the stack settings live in aws/cdk_deployment/defaults.py
+AWS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../aws")
+sys.path.insert(0, AWS_DIRECTORY)
+
+from cdk_deployment import defaults  # noqa: E402
+from simulate_topology import sample_durations  # noqa: E402
+
+# stack settings the simulation depends on, same names and defaults as the cdk
+# context read by aws/app.py
+STACK_SETTINGS = {
+    "maxv_cpus": defaults.MAXV_CPUS,
+    "minv_cpus": defaults.MINV_CPUS,
+    "instance_types": list(defaults.INSTANCE_TYPES),
+    "job_vcpus": defaults.JOB_VCPUS,
+    "max_concurrency": defaults.MAX_CONCURRENCY,
+    "retry_attempts": defaults.RETRY_ATTEMPTS,
+    "step2_items_per_job": 1,
+    "step3_items_per_job": 1,
+    "topology": "barrier",
+}
+# workload, durations are the seconds of an item on a single vCPU
+WORKLOAD = {
+    "step1": {"items": 1, "median": 60, "skew": 0.5},
+    "step2": {"items": 200, "median": 60, "skew": 1.0},
+    "step3": {"items": 200, "median": 60, "skew": 1.0},
+    # interruptions per spot instance and hour
+    "spot_interruptions_per_hour": 0.0,
+    # from the scaling decision to the instance joining the compute environment
+    "instance_start_seconds": 180,
+    # from the placement of a job to the start of its container, eg the image pull
+    "job_start_seconds": 20,
+    # how often the compute environment is scaled
+    "scale_interval_seconds": 30,
+    # idle instances are terminated after
+    "idle_shutdown_seconds": 300,
+}
+
+
+class Job:
+
+    """
+    A batch job: its vCPUs, seconds of work, the jobs it waits for and the map
+    iteration it belongs to
+    """
+
+    def __init__(self, name, vcpus, duration, map_name=None, iteration=None):
+
+        self.name = name
+        self.vcpus = vcpus
+        self.duration = duration
+        self.map_name = map_name
+        self.iteration = iteration
+        self.waiting_on = 0
+        self.dependents = []
+        # whether the job ends its map iteration and frees the iteration slot
+        self.ends_iteration = map_name is not None
+        self.attempts = 0
+        self.run_token = 0
+        self.instance = None
+
+
+def job_duration(item_durations, vcpus):
+
+    """
+    Seconds of a job running item_durations on a worker pool of vcpus processes,
+    see source/main.py. Items are handed out in order to the first free worker
+    """
+
+    workers = [0.0] * max(1, min(vcpus, len(item_durations)))
+    for duration in item_durations:
+        heapq.heapreplace(workers, workers[0] + duration)
+    return max(workers)
+
+
+def chunks(durations, size):
+
+    """
+    durations split in chunks of size, like States.ArrayPartition
+    """
+
+    return [durations[start : start + size] for start in range(0, len(durations), size)]
+
+
+def build_jobs(settings, workload, rng):
+
+    """
+    Jobs of an execution with the topology of the stack: step 1, then the map of step
+    2 followed by the map of step 3, or a single map running step 2 and 3 of every
+    item with the pipelined topology
+    """
+
+    vcpus = settings["job_vcpus"]
+
+    def durations(step):
+        return sample_durations(
+            workload[step]["items"], workload[step]["median"], workload[step]["skew"], rng
+        )
+
+    def depends(job, on):
+        for dependency in on:
+            dependency.dependents.append(job)
+            job.waiting_on += 1
+
+    step1 = Job("step1", vcpus, job_duration(durations("step1"), vcpus))
+    jobs = [step1]
+    if settings["topology"] == "pipelined":
+        # step 2 and 3 items are paired by position, see PipelineTask
+        if workload["step2"]["items"] != workload["step3"]["items"]:
+            raise Exception("The pipelined topology pairs as many step 2 as 3 items")
+        step3_durations = durations("step3")
+        for index, duration in enumerate(durations("step2")):
+            step2 = Job("step2", vcpus, duration, "pipeline", index)
+            step2.ends_iteration = False
+            step3 = Job("step3", vcpus, step3_durations[index], "pipeline", index)
+            depends(step2, [step1])
+            depends(step3, [step2])
+            jobs += [step2, step3]
+        return jobs
+
+    previous = [step1]
+    for step in ("step2", "step3"):
+        stage = [
+            Job(step, vcpus, job_duration(chunk, vcpus), step, index)
+            for index, chunk in enumerate(
+                chunks(durations(step), settings[f"{step}_items_per_job"])
+            )
+        ]
+        for job in stage:
+            depends(job, previous)
+        jobs += stage
+        previous = stage
+    return jobs
+
+
+def simulate(settings, workload, rng):
+
+    """
+    Runs the jobs of an execution through the map concurrency limits, the batch job
+    queue and a compute environment scaling spot instances between minv_cpus and
+    maxv_cpus. Returns the makespan, instance-hours, queue depth over time and the
+    jobs which failed more than retry_attempts times
+    """
+
+    jobs = build_jobs(settings, workload, rng)
+    instance_vcpus = defaults.INSTANCE_VCPUS[settings["instance_types"][0]]
+    interruption_rate = workload["spot_interruptions_per_hour"] / 3600
+
+    events = []
+    sequence = itertools.count()
+    now = 0.0
+
+    def schedule(delay, kind, payload=None):
+        heapq.heappush(events, (now + delay, next(sequence), kind, payload))
+
+    runnable = deque()
+    map_running = {}
+    map_waiting = {}
+    instances = []
+    instance_seconds = 0.0
+    queue_depth = []
+    remaining = len(jobs)
+    exhausted = 0
+    interruptions = 0
+
+    def launch(ready_in):
+        instance = {"vcpus": instance_vcpus, "free": instance_vcpus, "jobs": set()}
+        instance.update(launched=now, ready=False, idle_since=None, alive=True)
+        instances.append(instance)
+        schedule(ready_in, "instance_ready", instance)
+
+    def terminate(instance):
+        nonlocal instance_seconds
+        instance["alive"] = False
+        instances.remove(instance)
+        instance_seconds += now - instance["launched"]
+
+    def submit(job):
+        # a map iteration holds its slot until its last job completes
+        limit = settings["max_concurrency"]
+        running = map_running.setdefault(job.map_name, set())
+        if job.map_name is None or not limit or job.iteration in running:
+            runnable.append(job)
+        elif len(running) < limit:
+            running.add(job.iteration)
+            runnable.append(job)
+        else:
+            map_waiting.setdefault(job.map_name, deque()).append(job)
+
+    def place():
+        while runnable:
+            instance = next(
+                (
+                    instance
+                    for instance in instances
+                    if instance["ready"] and instance["free"] >= runnable[0].vcpus
+                ),
+                None,
+            )
+            if not instance:
+                return
+            job = runnable.popleft()
+            instance["free"] -= job.vcpus
+            instance["jobs"].add(job)
+            instance["idle_since"] = None
+            job.instance = instance
+            job.run_token += 1
+            duration = workload["job_start_seconds"] + job.duration
+            schedule(duration, "job_done", (job, job.run_token))
+
+    def release(job):
+        instance = job.instance
+        instance["free"] += job.vcpus
+        instance["jobs"].discard(job)
+        if not instance["jobs"]:
+            instance["idle_since"] = now
+        job.instance = None
+
+    # the minimum capacity is always there
+    for _ in range(math.ceil(settings["minv_cpus"] / instance_vcpus)):
+        launch(0)
+    for job in jobs:
+        if not job.waiting_on:
+            submit(job)
+    schedule(0, "scale")
+
+    while remaining:
+        now, _, kind, payload = heapq.heappop(events)
+
+        if kind == "scale":
+            queue_depth.append((now, len(runnable)))
+            demand = sum(job.vcpus for job in runnable) + sum(
+                instance["vcpus"] - instance["free"] for instance in instances
+            )
+            capacity = sum(instance["vcpus"] for instance in instances)
+            target = min(settings["maxv_cpus"], max(demand, settings["minv_cpus"]))
+            for _ in range(max(0, math.ceil((target - capacity) / instance_vcpus))):
+                launch(workload["instance_start_seconds"])
+            for instance in list(instances):
+                idle_since = instance["idle_since"]
+                if (
+                    idle_since is not None
+                    and now - idle_since >= workload["idle_shutdown_seconds"]
+                    and capacity - instance["vcpus"] >= settings["minv_cpus"]
+                ):
+                    capacity -= instance["vcpus"]
+                    terminate(instance)
+            schedule(workload["scale_interval_seconds"], "scale")
+
+        elif kind == "instance_ready" and payload["alive"]:
+            payload["ready"] = True
+            payload["idle_since"] = now
+            if interruption_rate:
+                schedule(rng.expovariate(interruption_rate), "interruption", payload)
+
+        elif kind == "interruption" and payload["alive"]:
+            # the jobs of a reclaimed instance fail and, within their attempts, are
+            # retried. The execution would fail for the others, they are counted and
+            # rerun to keep simulating
+            interruptions += 1
+            for job in list(payload["jobs"]):
+                release(job)
+                job.attempts += 1
+                if job.attempts >= settings["retry_attempts"]:
+                    exhausted += 1
+                runnable.appendleft(job)
+            terminate(payload)
+
+        elif kind == "job_done":
+            job, run_token = payload
+            if run_token != job.run_token or job.instance is None:
+                continue
+            release(job)
+            remaining -= 1
+            if job.ends_iteration and settings["max_concurrency"]:
+                map_running[job.map_name].discard(job.iteration)
+                waiting = map_waiting.get(job.map_name)
+                if waiting:
+                    next_job = waiting.popleft()
+                    map_running[job.map_name].add(next_job.iteration)
+                    runnable.append(next_job)
+            for dependent in job.dependents:
+                dependent.waiting_on -= 1
+                if not dependent.waiting_on:
+                    submit(dependent)
+
+        place()
+
+    # the instances still running are terminated once idle for long enough
+    for instance in instances:
+        shutdown = max(now, instance["idle_since"] or now)
+        shutdown += workload["idle_shutdown_seconds"]
+        instance_seconds += shutdown - instance["launched"]
+
+    return {
+        "makespan": now,
+        "instance_hours": instance_seconds / 3600,
+        "queue_depth": queue_depth,
+        "interruptions": interruptions,
+        "exhausted": exhausted,
+    }
+
+
+def percentile(values, rank):
+
+    """
+    Nearest rank percentile of values
+    """
+
+    values = sorted(values)
+    return values[max(0, -(-rank * len(values) // 100) - 1)]
+
+
+def print_queue_depth(queue_depth, interval):
+
+    """
+    Prints the runnable jobs every interval seconds
+    """
+
+    print(f"\nRunnable jobs every {interval:.0f}s")
+    next_time = 0.0
+    peak = max(depth for _, depth in queue_depth)
+    for time, depth in queue_depth:
+        if time >= next_time:
+            bar = "#" * round(40 * depth / peak) if peak else ""
+            print(f"{time:8.0f}s {depth:6d} {bar}")
+            next_time = time + interval
+
+
+def load_json(path, base):
+
+    """
+    base updated with the json file at path, when given
+    """
+
+    settings = json.loads(json.dumps(base))
+    if path:
+        with open(path) as stream:
+            settings.update(json.load(stream))
+    return settings
+
+
+def main():
+
+    """
+    Predicts makespan, queue depth and instance-hours of an execution for compute
+    environment and map settings, before deploying them
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-s", "--stack", type=str, help="json of stack settings, as the cdk context"
+    )
+    parser.add_argument("-w", "--workload", type=str, help="json of the workload")
+    parser.add_argument(
+        "-mv", "--maxv-cpus", type=int, nargs="+", help="maxv_cpus values to compare"
+    )
+    parser.add_argument(
+        "-mc",
+        "--max-concurrency",
+        type=int,
+        nargs="+",
+        help="max_concurrency values to compare",
+    )
+    parser.add_argument("-r", "--runs", type=int, default=20, help="simulated runs")
+    parser.add_argument(
+        "-i", "--interval", type=float, default=300, help="queue depth print interval"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+
+    settings = load_json(args.stack, STACK_SETTINGS)
+    workload = load_json(args.workload, WORKLOAD)
+    if settings["instance_types"][0] not in defaults.INSTANCE_VCPUS:
+        parser.error(f"unknown instance type {settings['instance_types'][0]}")
+    if settings["job_vcpus"] > defaults.INSTANCE_VCPUS[settings["instance_types"][0]]:
+        parser.error("a job needs more vCPUs than an instance has")
+    if min(args.maxv_cpus or [settings["maxv_cpus"]]) < settings["job_vcpus"]:
+        parser.error("a job needs more vCPUs than maxv_cpus")
+    if (
+        settings["topology"] == "pipelined"
+        and workload["step2"]["items"] != workload["step3"]["items"]
+    ):
+        parser.error("the pipelined topology needs as many step 2 as step 3 items")
+
+    combinations = list(
+        itertools.product(
+            args.maxv_cpus or [settings["maxv_cpus"]],
+            args.max_concurrency or [settings["max_concurrency"]],
+        )
+    )
+    print(
+        f"{'maxv_cpus':>9} {'max_conc':>9} {'makespan':>10} {'p95':>10} "
+        + f"{'inst-hours':>10} {'peak queue':>10} {'failed runs':>11}"
+    )
+    for maxv_cpus, max_concurrency in combinations:
+        rng = random.Random(args.seed)
+        combination = dict(settings, maxv_cpus=maxv_cpus, max_concurrency=max_concurrency)
+        results = [simulate(combination, workload, rng) for _ in range(args.runs)]
+        makespans = [result["makespan"] for result in results]
+        print(
+            f"{maxv_cpus:9d} {max_concurrency:9d} "
+            + f"{sum(makespans) / args.runs:9.0f}s {percentile(makespans, 95):9.0f}s "
+            + f"{sum(r['instance_hours'] for r in results) / args.runs:10.2f} "
+            + f"{max(d for r in results for _, d in r['queue_depth']):10d} "
+            + f"{sum(bool(r['exhausted']) for r in results):11d}"
+        )
+
+    if len(combinations) == 1:
+        print_queue_depth(results[0]["queue_depth"], args.interval)
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+
+    main()
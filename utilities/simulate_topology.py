@@ -0,0 +1,123 @@
+import argparse
+import heapq
+import random
+import sys
+from collections import deque
+
+
+def sample_durations(count, median, skew, rng):
+
+    """
+    Log-normal job durations in seconds, skew is the sigma of the distribution.
+    The larger the skew the longer the tail of stragglers
+    """
+
+    return [rng.lognormvariate(0, skew) * median for _ in range(count)]
+
+
+def simulate(durations, dependencies, slots):
+
+    """
+    Runs a list of jobs on a number of identical slots and returns the makespan.
+    Jobs become runnable once all their dependencies have completed and are started
+    in the order they became runnable, like jobs in a batch job queue
+    """
+
+    waiting_on = {job: len(deps) for job, deps in dependencies.items()}
+    dependents = {job: [] for job in range(len(durations))}
+    for job, deps in dependencies.items():
+        for dep in deps:
+            dependents[dep].append(job)
+
+    runnable = deque(job for job in range(len(durations)) if not waiting_on.get(job))
+    running = []
+    now = 0.0
+    while runnable or running:
+        while runnable and len(running) < slots:
+            job = runnable.popleft()
+            heapq.heappush(running, (now + durations[job], job))
+        now, job = heapq.heappop(running)
+        for dependent in dependents[job]:
+            waiting_on[dependent] -= 1
+            if not waiting_on[dependent]:
+                runnable.append(dependent)
+
+    return now
+
+
+def step_jobs(items, median2, median3, skew, rng):
+
+    """
+    Durations of the step 2 jobs, jobs 0 to items - 1, followed by the durations of
+    the step 3 jobs, jobs items to 2 * items - 1
+    """
+
+    return sample_durations(items, median2, skew, rng) + sample_durations(
+        items, median3, skew, rng
+    )
+
+
+def barrier_dependencies(items):
+
+    """
+    Every step 3 job waits for all the step 2 jobs
+    """
+
+    return {items + item: list(range(items)) for item in range(items)}
+
+
+def pipelined_dependencies(items):
+
+    """
+    Every step 3 job waits for the step 2 job of the same item only
+    """
+
+    return {items + item: [item] for item in range(items)}
+
+
+def main():
+
+    """
+    Compares the makespan of the barrier and pipelined topologies of step 2 and 3 on
+    a skewed workload
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--items", type=int, default=200, help="items per step")
+    parser.add_argument(
+        "-s", "--slots", type=int, default=10, help="jobs running at the same time"
+    )
+    parser.add_argument(
+        "-m2", "--median2", type=float, default=60, help="median step 2 job seconds"
+    )
+    parser.add_argument(
+        "-m3", "--median3", type=float, default=60, help="median step 3 job seconds"
+    )
+    parser.add_argument(
+        "-k", "--skew", type=float, default=1.0, help="sigma of the job durations"
+    )
+    parser.add_argument("-r", "--runs", type=int, default=20, help="simulated runs")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    barrier_total, pipelined_total = 0.0, 0.0
+    for _ in range(args.runs):
+        durations = step_jobs(args.items, args.median2, args.median3, args.skew, rng)
+        barrier_total += simulate(durations, barrier_dependencies(args.items), args.slots)
+        pipelined_total += simulate(
+            durations, pipelined_dependencies(args.items), args.slots
+        )
+
+    barrier = barrier_total / args.runs
+    pipelined = pipelined_total / args.runs
+    print(f"Average makespan over {args.runs} runs of {args.items} items per step")
+    print(f"barrier:   {barrier:10.1f}s")
+    print(f"pipelined: {pipelined:10.1f}s ({100 * (1 - pipelined / barrier):.1f}% less)")
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+
+    main()
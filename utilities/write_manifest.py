@@ -0,0 +1,126 @@
+import argparse
+import csv
+import io
+import json
+import sys
+import uuid
+
+import boto3
+
+S3_CLIENT = boto3.client("s3", "eu-west-1")
+MANIFEST_FORMATS = ("jsonl", "csv")
+
+
+def item_parameter(item):
+
+    """
+    Parameter of a step 2 or 3 item, sized items lose their size hint
+    """
+
+    return str(item["parameter"] if isinstance(item, dict) else item)
+
+
+def manifest_body(items, manifest_format="jsonl"):
+
+    """
+    Manifest of a distributed map, one {"parameter": ...} object per line or a csv
+    with a parameter column
+    """
+
+    if manifest_format == "csv":
+        stream = io.StringIO()
+        writer = csv.writer(stream, lineterminator="\n")
+        writer.writerow(["parameter"])
+        writer.writerows([item_parameter(item)] for item in items)
+        return stream.getvalue().encode("utf-8")
+    return "".join(
+        json.dumps({"parameter": item_parameter(item)}) + "\n" for item in items
+    ).encode("utf-8")
+
+
+def write_manifests(
+    parameters, bucket, prefix, steps, manifest_format="jsonl", s3_client=S3_CLIENT
+):
+
+    """
+    Uploads the items of steps as manifests and returns the same input where the
+    items of each of those steps are replaced by the key of their manifest
+    """
+
+    written = dict(parameters)
+    for step in steps:
+        key = f"{prefix}/{step}.{manifest_format}"
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=manifest_body(written.pop(f"{step}_parameters"), manifest_format),
+        )
+        written[f"{step}_manifest"] = key
+
+    return {"parameters": written}
+
+
+def main():
+
+    """
+    Turns an execution input into an input with manifests, to be used with a step
+    function deployed with the distributed fan out for step 2 or 3
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i", "--input", type=str, help="execution input json file", required=True
+    )
+    parser.add_argument(
+        "-bk", "--bucket", type=str, help="manifest bucket name", required=True
+    )
+    parser.add_argument(
+        "-s",
+        "--steps",
+        type=str,
+        nargs="+",
+        choices=["step2", "step3"],
+        default=["step2", "step3"],
+        help="steps with the distributed fan out",
+    )
+    parser.add_argument(
+        "-fmt", "--format", choices=MANIFEST_FORMATS, default="jsonl", help="format"
+    )
+    parser.add_argument(
+        "-n", "--name", type=str, help="name of the input, defaults to a random uuid"
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, help="where to write the new execution input"
+    )
+    parser.add_argument("--endpoint-url", type=str, help="eg a local S3 stand-in")
+    args = parser.parse_args()
+    name = args.name or str(uuid.uuid4())
+    s3_client = S3_CLIENT
+    if args.endpoint_url:
+        s3_client = boto3.client("s3", "eu-west-1", endpoint_url=args.endpoint_url)
+
+    with open(args.input) as stream:
+        parameters = json.load(stream)["parameters"]
+
+    written = write_manifests(
+        parameters,
+        args.bucket,
+        f"manifests/{name}",
+        args.steps,
+        args.format,
+        s3_client=s3_client,
+    )
+
+    if args.output:
+        with open(args.output, "w") as stream:
+            json.dump(written, stream, indent=2)
+        print(f"Input {name} with manifests written to {args.output}")
+    else:
+        print(json.dumps(written, indent=2))
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+
+    main()